@@ -0,0 +1,129 @@
+"""Admission control for the API's prediction routes.
+
+Without a bound, a traffic spike queues requests until every one of them
+waits longer than its client will, and they all time out together. A
+RouteLimit lets at most max_in_flight requests of its routes run at once in
+a worker and at most max_queued more wait (up to queue_timeout seconds) for
+one of those slots. Anything beyond that is shed at once: the API answers
+503 with a Retry-After header, which costs microseconds and frees the
+worker thread for the next request.
+
+Limits are per route group, so saturated prediction routes leave threads
+free for /health and /metrics, which are not limited. They count per
+worker process and act on the requests the worker has accepted, so they
+need threaded workers (GUNICORN_THREADS > 1, see gunicorn.conf.py): a sync
+worker runs one request at a time and leaves the rest in the listen
+backlog. Keep the requests admitted across all route groups (max_in_flight
++ max_queued of each, see admitted_total) below the thread count, so a
+thread is always left for the health check; gunicorn.conf.py warns at boot
+when they are not.
+
+A threaded worker also queues requests in front of its threads, where the
+app cannot see them. gthread_worker.py's worker stamps each request with
+when it was queued there and how many requests were ahead of it; a
+request that already waited queue_timeout seconds is shed as soon as it
+reaches a thread, so a backlog drains in microseconds per request instead
+of being served to clients that have given up.
+
+stats() reports the current and peak queue depth, the time admitted
+requests waited and how many were shed (queue full, timed out in it, or
+too old on arrival), for sizing worker and thread counts from data.
+"""
+import threading
+import time
+
+
+class RouteLimit:
+    """Bounded in-flight slots and wait queue of one route group in one worker process"""
+
+    def __init__(self, name, max_in_flight, max_queued=0, queue_timeout=1.0, retry_after=1):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        # Seconds a shed client is told to wait before retrying
+        self.retry_after = retry_after
+        self._slots = threading.Semaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = self.queued = self.peak_queued = 0
+        self.admitted = self.shed_queue_full = self.shed_timeout = self.shed_stale = 0
+        self.wait_seconds = 0.0
+        # Of the worker's queue in front of its threads, as stamped by gthread_worker.py
+        self.backlog_requests = self.backlog_depth = self.peak_backlog_depth = 0
+        self.backlog_seconds = self.peak_backlog_seconds = 0.0
+
+    def acquire(self, backlog_seconds=None, backlog_depth=None):
+        """True once the request holds a slot, which it must release(); False if it is shed
+
+        backlog_seconds is how long the request waited for a worker thread,
+        behind backlog_depth others, when the server reports it.
+        """
+        timeout = self.queue_timeout
+        if backlog_seconds is not None:
+            with self._lock:
+                self.backlog_requests += 1
+                self.backlog_seconds += backlog_seconds
+                self.peak_backlog_seconds = max(self.peak_backlog_seconds, backlog_seconds)
+                self.backlog_depth = backlog_depth or 0
+                self.peak_backlog_depth = max(self.peak_backlog_depth, self.backlog_depth)
+                if backlog_seconds >= timeout:
+                    # Its client has waited long enough already
+                    self.shed_stale += 1
+                    return False
+            timeout -= backlog_seconds
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.queued >= self.max_queued:
+                    self.shed_queue_full += 1
+                    return False
+                self.queued += 1
+                self.peak_queued = max(self.peak_queued, self.queued)
+            start = time.perf_counter()
+            acquired = self._slots.acquire(timeout=timeout)
+            waited = time.perf_counter() - start
+            with self._lock:
+                self.queued -= 1
+                if not acquired:
+                    self.shed_timeout += 1
+                    return False
+                self.wait_seconds += waited
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    @property
+    def shed(self):
+        return self.shed_queue_full + self.shed_timeout + self.shed_stale
+
+    def stats(self):
+        requests = self.admitted + self.shed
+        return {
+            'max_in_flight': self.max_in_flight,
+            'max_queued': self.max_queued,
+            'queue_timeout_ms': self.queue_timeout * 1e3,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'peak_queued': self.peak_queued,
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'shed_queue_full': self.shed_queue_full,
+            'shed_timeout': self.shed_timeout,
+            'shed_stale': self.shed_stale,
+            'shed_rate': self.shed / requests if requests else 0.0,
+            'mean_wait_ms': self.wait_seconds / self.admitted * 1e3 if self.admitted else 0.0,
+            'mean_backlog_wait_ms': self.backlog_seconds / self.backlog_requests * 1e3 if self.backlog_requests else 0.0,
+            'peak_backlog_wait_ms': self.peak_backlog_seconds * 1e3,
+            'backlog_depth': self.backlog_depth,
+            'peak_backlog_depth': self.peak_backlog_depth,
+        }
+
+
+def admitted_total(limits):
+    """Requests the limits admit at once in one worker, running or waiting for a slot"""
+    return sum(limit.max_in_flight + limit.max_queued for limit in limits)
@@ -0,0 +1,236 @@
+"""Batched statistics of the encoded training frame.
+
+The data-driven weights used to need three scans per feature: a Pearson
+correlation, a crosstab and a groupby mean. Here every feature is scanned
+once. All correlations with the target come from one batched matrix
+product. Each column is integer-coded once, the codes of all columns are
+offset into one index space, and one bincount over the stacked codes and
+the target gives the row count and the depressed count of every (column,
+value) pair. Rates,
+odds ratios and high-risk values then come from those small tables.
+
+The same tables are the value-by-target contingency tables of the feature
+impact analysis, whose chi-square tests run for every feature at once.
+
+Weights, thresholds and the feature impact are derived from the
+correlations and tables alone (weights_from_tables, impact_from_tables), so
+an incremental store of those aggregates (stats_store.py) yields the same
+results without rescanning the data.
+"""
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2
+
+import schema
+
+
+def target_correlations(df, columns, target=schema.TARGET):
+    """Pearson correlation of every column with target, bit-identical to Series.corr one column at a time"""
+    y = df[target].to_numpy(dtype=np.float64)
+    # Series.corr is np.corrcoef(column, target); one batched matmul computes
+    # all of those 2x2 products with the same arithmetic, so results match exactly
+    pairs = np.empty((len(columns), 2, len(y)))
+    for i, col in enumerate(columns):
+        pairs[i, 0] = df[col].to_numpy(dtype=np.float64)
+    pairs[:, 1] = y
+    if np.isnan(pairs).any():
+        # Pairwise-complete observations differ per column
+        return np.array([df[col].corr(df[target]) for col in columns])
+    pairs -= pairs.mean(axis=2)[:, :, None]
+    cov = np.matmul(pairs, pairs.transpose(0, 2, 1)) * (1 / (len(y) - 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stddev = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+        correlations = cov[:, 0, 1] / stddev[:, 0] / stddev[:, 1]
+    return np.clip(correlations, -1, 1)
+
+
+def integer_codes(series):
+    """(codes, sorted unique values) of a column, like pd.factorize(sort=True)
+
+    Label-encoded and other integer columns skip hashing: a bincount over
+    the value range finds the values present and a lookup table maps them
+    to codes.
+    """
+    values = series.to_numpy()
+    if values.dtype.kind not in 'iu' or len(values) == 0:
+        return pd.factorize(series, sort=True)
+    low, high = values.min(), values.max()
+    if high - low > 4 * len(values):
+        # Sparse range: a lookup table would be bigger than the column
+        return pd.factorize(series, sort=True)
+    present = np.bincount(values - low) > 0
+    lookup = np.cumsum(present) - 1
+    return lookup[values - low], pd.Index(np.flatnonzero(present) + low, dtype=values.dtype)
+
+
+def value_counts_by_target(df, columns, target=schema.TARGET):
+    """{column: (sorted values, rows per value, depressed rows per value)} from one bincount pass
+
+    The target must be coded 0/1. Missing values are left out, as groupby
+    and crosstab leave them out.
+    """
+    y = df[target].to_numpy() == 1
+    codes = np.empty((len(columns), len(df)), dtype=np.intp)
+    values, offset = [], 0
+    for i, col in enumerate(columns):
+        column_codes, uniques = integer_codes(df[col])
+        values.append(uniques)
+        np.add(column_codes, offset, out=codes[i])
+        # Missing values (code -1) all land in one spare bin past the real ones
+        codes[i][column_codes < 0] = -1
+        offset += len(uniques)
+    codes[codes < 0] = offset
+    # Bin 2 * code + target: even bins count the healthy rows, odd bins the depressed
+    codes *= 2
+    codes += y
+    by_target = np.bincount(codes.ravel(), minlength=2 * (offset + 1)).reshape(-1, 2)
+    counts, positives = by_target.sum(axis=1), by_target[:, 1]
+
+    tables, start = {}, 0
+    for col, uniques in zip(columns, values):
+        end = start + len(uniques)
+        tables[col] = (uniques, counts[start:end], positives[start:end])
+        start = end
+    return tables
+
+
+def data_driven_weights(df, target=schema.TARGET):
+    """(weights, risk_thresholds, feature_stats) from the correlation, odds ratio and
+    per-value target rates of every feature column"""
+    columns = [col for col in df.columns if col not in (schema.ID_COLUMN, target)]
+    return weights_from_tables(
+        columns, target_correlations(df, columns, target), value_counts_by_target(df, columns, target),
+        object_columns={col for col in columns if df[col].dtype == 'object'}
+    )
+
+
+def weights_from_tables(columns, correlations, tables, object_columns=(), target=schema.TARGET):
+    """data_driven_weights from each column's target correlation and value_counts_by_target table"""
+    feature_stats = {}
+    for col, correlation in zip(columns, correlations):
+        uniques, counts, positives = tables[col]
+        negatives = counts - positives
+
+        # Odds ratio of a 2x2 table, for categorical/discrete columns
+        odds_ratio = 1.0
+        if col in object_columns or len(uniques) <= 10:
+            if len(uniques) == 2 and positives.sum() > 0 and negatives.sum() > 0:
+                odds_ratio = (negatives[0] * positives[1]) / (positives[0] * negatives[1] + 1e-8)
+
+        depression_rates = pd.Series(positives / counts, index=uniques.rename(col), name=target)
+        rate_difference = depression_rates.max() - depression_rates.min()
+
+        high_risk_threshold = depression_rates.mean() + depression_rates.std()
+        high_risk_values = depression_rates[depression_rates > high_risk_threshold].index.tolist()
+
+        feature_stats[col] = {
+            'correlation': abs(correlation) if not pd.isna(correlation) else 0,
+            'odds_ratio': abs(np.log(odds_ratio)) if odds_ratio > 0 else 0,
+            'rate_difference': rate_difference,
+            'high_risk_values': high_risk_values,
+            'depression_rates': depression_rates
+        }
+
+    correlations = [stats['correlation'] for stats in feature_stats.values()]
+    max_correlation = max(correlations) if correlations else 1
+
+    weights, risk_thresholds = {}, {}
+    for feature, stats in feature_stats.items():
+        # Normalize correlation to 0-2 scale
+        normalized_correlation = (stats['correlation'] / max_correlation) * 2
+        # Combine multiple factors for weight
+        weight = normalized_correlation * (1 + stats['rate_difference']) * (1 + stats['odds_ratio']/10)
+        weights[feature] = max(0.1, min(3.0, weight))  # Cap between 0.1 and 3.0
+        risk_thresholds[feature] = stats['high_risk_values']
+
+    return weights, risk_thresholds, feature_stats
+
+
+def chi_square_tests(tables):
+    """{column: (chi2, dof, p_value)} for every value-by-target contingency table at once
+
+    Same statistic as scipy.stats.chi2_contingency, including its Yates
+    correction when dof is 1; a table with a single row or a single target
+    class has dof 0, chi2 0 and p 1, and a column with no values at all
+    gets (None, None, None).
+    """
+    columns = list(tables)
+    sizes = np.array([len(uniques) for uniques, _, _ in tables.values()], dtype=np.intp)
+    observed = np.concatenate(
+        [np.column_stack([counts - positives, positives]) for _, counts, positives in tables.values()]
+        + [np.empty((0, 2))]
+    ).astype(np.float64)
+    # Row of every table entry -> its column
+    owner = np.repeat(np.arange(len(columns)), sizes)
+    class_totals = np.column_stack([np.bincount(owner, weights=observed[:, k], minlength=len(columns)) for k in (0, 1)])
+    n_rows = class_totals.sum(axis=1)
+    # crosstab drops a target class no row has, so it does not count towards dof
+    dof = (sizes - 1) * ((class_totals > 0).sum(axis=1) - 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = observed.sum(axis=1)[:, None] * class_totals[owner] / n_rows[owner][:, None]
+        difference = expected - observed
+        yates = (dof == 1)[owner][:, None]
+        observed = np.where(yates, observed + np.sign(difference) * np.minimum(0.5, np.abs(difference)), observed)
+        terms = np.where(expected > 0, (observed - expected) ** 2 / expected, 0.0)
+    statistics = np.bincount(owner, weights=terms.sum(axis=1), minlength=len(columns))
+    statistics[dof <= 0] = 0.0
+    p_values = np.where(dof > 0, chi2.sf(statistics, np.maximum(dof, 1)), 1.0)
+
+    return {
+        col: (float(statistic), int(df), float(p_value)) if n > 0 else (None, None, None)
+        for col, statistic, df, p_value, n in zip(columns, statistics, dof, p_values, n_rows)
+    }
+
+
+def feature_impact(df, target=schema.TARGET, labels=None, alpha=0.05):
+    """How each feature relates to the target, as plain JSON-ready data
+
+    {column: {'correlation', 'chi2', 'dof', 'p_value', 'significant',
+    'values': [{'value', 'total', 'depressed', 'rate'}, ...]}}. labels maps
+    a label-encoded column to its categories, so values are reported as the
+    original answers rather than codes. Nothing is printed.
+    """
+    columns = [col for col in df.columns if col not in (schema.ID_COLUMN, target)]
+    return impact_from_tables(
+        columns, target_correlations(df, columns, target), value_counts_by_target(df, columns, target), labels, alpha
+    )
+
+
+def impact_from_tables(columns, correlations, tables, labels=None, alpha=0.05):
+    """feature_impact from each column's target correlation and value_counts_by_target table"""
+    labels = labels or {}
+    tests = chi_square_tests(tables)
+
+    impact = {}
+    for col, correlation in zip(columns, correlations):
+        uniques, counts, positives = tables[col]
+        statistic, dof, p_value = tests[col]
+        names = labels.get(col)
+        values = [names[int(value)] if names is not None else value for value in uniques.tolist()]
+        impact[col] = {
+            'correlation': None if pd.isna(correlation) else float(correlation),
+            'chi2': statistic,
+            'dof': dof,
+            'p_value': p_value,
+            'significant': None if p_value is None else p_value < alpha,
+            'values': [
+                {'value': value, 'total': int(total), 'depressed': int(depressed), 'rate': float(depressed / total)}
+                for value, total, depressed in zip(values, counts, positives)
+            ],
+        }
+    return impact
+
+
+def print_feature_impact(impact):
+    print("\n" + "="*80)
+    print("DATA-DRIVEN FEATURE IMPACT ANALYSIS")
+    print("="*80)
+    print(f"{'Feature':40s} {'Correlation':>12s} {'Chi-square':>12s} {'p-value':>10s}  Significance")
+    for col, result in impact.items():
+        correlation = 'n/a' if result['correlation'] is None else f"{result['correlation']:.4f}"
+        if result['p_value'] is None:
+            print(f"{col:40s} {correlation:>12s} {'n/a':>12s} {'n/a':>10s}  Not applicable")
+            continue
+        significance = "SIGNIFICANT" if result['significant'] else "NOT SIGNIFICANT"
+        print(f"{col:40s} {correlation:>12s} {result['chi2']:12.2f} {result['p_value']:10.6f}  {significance}")
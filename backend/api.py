@@ -1,12 +1,120 @@
 import os
-from flask import Flask, request, jsonify
+import json
+import time
+from functools import wraps
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import pandas as pd
-import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
-import joblib
+import schema
+from admission import RouteLimit
+from model import bundle_options_from_env, load_or_train_bundle
+from flat_model import FlatModelHandle, PinnedModelHandle, publish_if_changed
+from micro_batch import MicroBatcher
+from prediction_cache import make_cache, predict_cached, predict_cached_async
+from process_pool import (ScoringPool, discard_result, feature_impact_csv, parse_line, result_text, score_chunk,
+                          split_json_array)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.environ.get('DATA_PATH', os.path.join(BASE_DIR, 'Student Depression Dataset.csv'))
+# Memory-mapped model file the workers serve from; replace it atomically to
+# roll out a new model version without a restart
+FLAT_MODEL_PATH = os.environ.get('FLAT_MODEL_PATH', os.path.join(BASE_DIR, 'artifacts', 'current.flat'))
+# Records per vectorized predict call in /api/predict/batch; results are
+# streamed back one chunk at a time
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 2048))
+# Model configuration from MODEL_ROSTER, MODEL_ENGINE, ... (see bundle_options_from_env)
+MODEL_OPTIONS = bundle_options_from_env()
+# Single-record predictions are cached by model version and encoded answers:
+# PREDICTION_CACHE=local (per worker, LRU), shared (across workers) or off
+PREDICTION_CACHE = os.environ.get('PREDICTION_CACHE', 'local')
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 300))
+# PREDICT_BATCH_WINDOW_MS=1..5 coalesces concurrent /api/predict calls into
+# batches of up to PREDICT_BATCH_MAX rows (see micro_batch.py); 0 turns it off.
+# In the Flask app each row blocks its request thread, so a batch holds at
+# most PREDICT_MAX_IN_FLIGHT rows per worker; the ASGI app awaits the batch
+# on its event loop and fills it up to PREDICT_BATCH_MAX
+PREDICT_BATCH_WINDOW_MS = float(os.environ.get('PREDICT_BATCH_WINDOW_MS', 0))
+PREDICT_BATCH_MAX = int(os.environ.get('PREDICT_BATCH_MAX', 64))
+# Batch chunks of at least POOL_MIN_RECORDS records and feature impact jobs
+# run in PROCESS_POOL_WORKERS processes per API worker (see process_pool.py),
+# so they do not hold the GIL of the worker serving the other requests; 0
+# runs them in the request thread
+PROCESS_POOL_WORKERS = int(os.environ.get('PROCESS_POOL_WORKERS', 1))
+POOL_MIN_RECORDS = int(os.environ.get('POOL_MIN_RECORDS', 256))
+# Upper bound on a CSV posted to /api/feature-impact
+MAX_ANALYSIS_BYTES = int(os.environ.get('MAX_ANALYSIS_BYTES', 64 << 20))
+# Admission control (see admission.py), per worker: /api/predict runs at most
+# PREDICT_MAX_IN_FLIGHT requests at once with PREDICT_MAX_QUEUED more
+# waiting up to ADMISSION_QUEUE_TIMEOUT_MS for a slot, and batch scoring and
+# CSV analysis share HEAVY_MAX_IN_FLIGHT / HEAVY_MAX_QUEUED; the rest get a
+# 503 with Retry-After: RETRY_AFTER_SECONDS. All of these together must
+# stay below GUNICORN_THREADS to leave a thread for /health: the defaults
+# admit 3 of the default 4
+PREDICT_MAX_IN_FLIGHT = int(os.environ.get('PREDICT_MAX_IN_FLIGHT', 2))
+PREDICT_MAX_QUEUED = int(os.environ.get('PREDICT_MAX_QUEUED', 0))
+HEAVY_MAX_IN_FLIGHT = int(os.environ.get('HEAVY_MAX_IN_FLIGHT', 1))
+HEAVY_MAX_QUEUED = int(os.environ.get('HEAVY_MAX_QUEUED', 0))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', 500))
+RETRY_AFTER_SECONDS = int(os.environ.get('RETRY_AFTER_SECONDS', 1))
+NDJSON_MIMETYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines'}
+
+# Load the fitted predictor once at import time. With gunicorn's preload_app
+# this happens in the master before the workers fork, so every worker shares
+# the model, label encoders and scaler copy-on-write instead of loading its own.
+# The bundle is cached by dataset hash + model config, so this only trains when
+# either has changed since the last boot.
+bundle = load_or_train_bundle(DATA_PATH, **MODEL_OPTIONS)
+predictor = bundle['predictor']
+# Data-driven per-factor risk scoring, compiled at training time; the same
+# plan the command-line assessment scores with (see scoring.py). It stays
+# fixed at boot: a model swapped in by retrain.py changes predictions only,
+# and a full retrain's new weights apply from the next restart
+scoring_plan = predictor.scoring_plan_for(bundle['weights'], bundle['risk_thresholds'])
+# Pay the first-call costs now rather than on the first real request
+predictor.warm_up()
+
+# Predictions are served from the flat model file, which every worker maps
+# read-only so the model pages are shared through the page cache.
+serving_metadata = {
+    "version": bundle['version'],
+    "trained_at": bundle['trained_at'],
+    "model": bundle.get('best_model_name'),
+    "metrics": bundle.get('metrics', {}).get(bundle.get('best_model_name'), {})
+}
+try:
+    publish_if_changed(predictor.inference_plan, FLAT_MODEL_PATH, serving_metadata)
+    serving = FlatModelHandle(FLAT_MODEL_PATH)
+except ValueError as e:
+    # Models without a flattened engine are served from memory instead
+    print(f"Serving in-memory model: {e}")
+    serving = PinnedModelHandle(predictor.inference_plan, serving_metadata)
+
+# Created before the workers fork, so a shared cache is shared by all of them
+prediction_cache = make_cache(PREDICTION_CACHE, PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+batcher = MicroBatcher(PREDICT_BATCH_WINDOW_MS / 1e3, PREDICT_BATCH_MAX) if PREDICT_BATCH_WINDOW_MS > 0 else None
+scoring_pool = None
+if PROCESS_POOL_WORKERS > 0:
+    # Pool processes map the same flat model file, or get a copy of the in-memory plan
+    scoring_pool = ScoringPool(
+        PROCESS_POOL_WORKERS, FLAT_MODEL_PATH if isinstance(serving, FlatModelHandle) else None,
+        serving.peek()[0], scoring_plan, POOL_MIN_RECORDS
+    )
+
+admission_limits = {
+    'predict': RouteLimit('predict', PREDICT_MAX_IN_FLIGHT, PREDICT_MAX_QUEUED, ADMISSION_QUEUE_TIMEOUT_MS / 1e3,
+                          RETRY_AFTER_SECONDS),
+    'heavy': RouteLimit('heavy', HEAVY_MAX_IN_FLIGHT, HEAVY_MAX_QUEUED, ADMISSION_QUEUE_TIMEOUT_MS / 1e3,
+                        RETRY_AFTER_SECONDS),
+}
+
+# The feature impact analysis is computed at training time and cached in the
+# bundle; its JSON body is rendered once here and served as-is, also after
+# a hot swap (its "version" is the boot bundle's)
+FEATURE_IMPACT_JSON = json.dumps({
+    "version": bundle['version'],
+    "features": bundle.get('feature_analysis') or {}
+})
 
 app = Flask(__name__)
 
@@ -18,6 +126,42 @@ CORS(app, origins=[
     "*"  # You can remove this and specify exact domains for better security
 ])
 
+def admitted(route_group):
+    """Run the view only when its route group's admission limit has a slot for it, else answer 503"""
+    limit = admission_limits[route_group]
+    def decorator(view):
+        @wraps(view)
+        def admitted_view(*args, **kwargs):
+            if not limit.acquire(*_backlog_wait()):
+                response = jsonify({"error": "Server is busy, retry later", "status": "error"})
+                response.headers['Retry-After'] = str(limit.retry_after)
+                return response, 503
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                limit.release()
+                raise
+            if response.is_streamed:
+                # Held until the streamed body has been sent
+                response.call_on_close(limit.release)
+            else:
+                limit.release()
+            return response
+        return admitted_view
+    return decorator
+
+def _backlog_wait():
+    """(seconds, requests ahead) this request queued for a thread, as the gunicorn worker stamped it, or Nones"""
+    queued_at = request.headers.get('X-Queue-Start')
+    if queued_at is None:
+        return None, None
+    try:
+        # The worker's stamp comes last, after any the client sent
+        return (max(0.0, time.time() - float(queued_at.rsplit(',', 1)[-1])),
+                int(request.headers.get('X-Queue-Depth', '0').rsplit(',', 1)[-1]))
+    except ValueError:
+        return None, None
+
 # Root route - this fixes the 404 error
 @app.route('/', methods=['GET'])
 def home():
@@ -27,20 +171,20 @@ def home():
         "service": "ML Prediction API",
         "endpoints": {
             "health": "/health",
-            "predict": "/api/predict (POST)"  # Updated to show correct endpoint
+            "predict": "/api/predict (POST)",  # Updated to show correct endpoint
+            "predict_batch": "/api/predict/batch (POST, JSON array or NDJSON)",
+            "feature_impact": "/api/feature-impact (GET, or POST a labeled CSV)",
+            "metrics": "/metrics"
         }
     })
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({
-        "status": "healthy", 
-        "service": "ML API",
-        "timestamp": pd.Timestamp.now().isoformat()
-    })
+    return jsonify(health_status())
 
 # Add the /api/predict route that your frontend expects
 @app.route('/api/predict', methods=['POST'])
+@admitted('predict')
 def predict_api():
     try:
         # Get JSON data from request
@@ -51,18 +195,9 @@ def predict_api():
         
         print(f"Received prediction request: {data}")  # Debug log
         
-        # Mock prediction logic - replace with your actual ML model
-        # Calculate a simple risk score based on provided data
-        risk_score = calculate_risk_score(data)
-        prediction = 1 if risk_score > 50 else 0
-        probability = risk_score / 100.0
-        
-        prediction_result = {
-            "risk_score": risk_score,
-            "prediction": prediction,
-            "probability": probability,
-            "status": "success"
-        }
+        prediction_result, status = predict_record(data)
+        if status != 200:
+            return jsonify(prediction_result), status
         
         print(f"Sending prediction result: {prediction_result}")  # Debug log
         return jsonify(prediction_result)
@@ -71,51 +206,186 @@ def predict_api():
         print(f"Error in prediction: {str(e)}")  # Debug log
         return jsonify({"error": str(e), "status": "error"}), 500
 
-def calculate_risk_score(data):
-    """Simple risk score calculation - replace with your actual ML model"""
-    score = 0
-    
-    # Academic/Work pressure (0-20 points)
-    pressure_map = {"None": 0, "Low": 5, "Moderate": 10, "High": 15, "Extreme": 20}
-    score += pressure_map.get(data.get("Academic Pressure", "None"), 0)
-    score += pressure_map.get(data.get("Work Pressure", "None"), 0)
-    
-    # Sleep duration (0-15 points)
-    sleep_map = {"<5": 15, "5-6": 10, "6-7": 5, "7-8": 0, ">8": 0}
-    score += sleep_map.get(data.get("Sleep Duration", "7-8"), 5)
+def predict_record(data):
+    """(response body, HTTP status) of one /api/predict record, shared with the ASGI app"""
+    errors, warnings = schema.validate_record(data)
+    if errors:
+        return _invalid_record_body(errors), 400
     
-    # Suicidal thoughts (0-30 points)
-    if data.get("Have you ever had suicidal thoughts ?") == "Yes":
-        score += 30
-    
-    # Financial stress (0-15 points)
-    score += pressure_map.get(data.get("Financial Stress", "None"), 0) * 0.75
-    
-    # Family history (0-10 points)
-    if data.get("Family History of Mental Illness") == "Yes":
-        score += 10
+    prediction, probability = _predict_one(data)
+    return _prediction_body(data, prediction, probability, warnings), 200
+
+async def predict_record_batched(data):
+    """predict_record for the ASGI event loop with micro batching on, awaiting the record's batch"""
+    errors, warnings = schema.validate_record(data)
+    if errors:
+        return _invalid_record_body(errors), 400
     
-    # Satisfaction scores (reverse scoring, 0-10 points each)
-    satisfaction_map = {"Very Satisfied": 0, "Satisfied": 2, "Neutral": 5, "Unsatisfied": 8, "Very Unsatisfied": 10}
-    score += satisfaction_map.get(data.get("Study Satisfaction", "Neutral"), 5)
-    score += satisfaction_map.get(data.get("Job Satisfaction", "Neutral"), 5)
+    plan, metadata = serving.snapshot()
+    if prediction_cache is not None:
+        prediction, probability = await predict_cached_async(prediction_cache, plan, metadata.get('version'), data,
+                                                             batcher.predict_async)
+    else:
+        prediction, probability = await batcher.predict_async(plan, plan.encode_one(data))
+    return _prediction_body(data, prediction, probability, warnings), 200
+
+def _invalid_record_body(errors):
+    return {"error": "; ".join(errors), "errors": errors, "status": "error"}
+
+def _prediction_body(data, prediction, probability, warnings):
+    factor_scores, risk_score = scoring_plan.score_one(data)
     
-    return min(score, 100)  # Cap at 100
+    prediction_result = {
+        "risk_score": risk_score,
+        "prediction": int(prediction),
+        "probability": float(probability),
+        "risk_breakdown": {factor: scores['risk_score'] for factor, scores in factor_scores.items()},
+        "status": "success"
+    }
+    if warnings:
+        prediction_result["warnings"] = warnings
+    return prediction_result
+
+def health_status():
+    return {
+        "status": "healthy", 
+        "service": "ML API",
+        "timestamp": pd.Timestamp.now().isoformat()
+    }
+
+def model_info_status():
+    plan, metadata = serving.snapshot()
+    return {
+        "model_type": "Mental Health Risk Assessment",
+        "version": metadata.get('version'),
+        "model": metadata.get('model'),
+        "features": plan.feature_names,
+        "last_trained": metadata.get('trained_at'),
+        "metrics": metadata.get('metrics', {}),
+        # Bundle the risk scoring and feature impact come from, fixed at boot
+        "scoring_version": bundle['version']
+    }
+
+def _predict_one(record):
+    """(prediction, probability) of one record, from the prediction cache when it holds them"""
+    # One read of the served model, so a hot swap cannot pair one model's
+    # prediction with the other's version in the cache
+    plan, metadata = serving.snapshot()
+    if prediction_cache is not None:
+        return predict_cached(prediction_cache, plan, metadata.get('version'), record,
+                              batcher.predict if batcher is not None else None)
+    if batcher is not None:
+        return batcher.predict(plan, plan.encode_one(record))
+    return plan.predict_one(record)
 
 # Keep the original /predict route for backward compatibility
 @app.route('/predict', methods=['POST'])
 def predict():
     return predict_api()
 
+@app.route('/api/predict/batch', methods=['POST'])
+@admitted('heavy')
+def predict_batch_api():
+    """Score a JSON array or an NDJSON stream of records, streaming NDJSON results back"""
+    if request.mimetype in NDJSON_MIMETYPES:
+        chunks = _chunks(_iter_ndjson_lines(request.stream))
+    else:
+        # The array is split into the texts of its records, which are parsed
+        # where they are scored (in the process pool for large chunks)
+        try:
+            if not request.is_json:
+                raise ValueError("not JSON")
+            chunks = _chunks(split_json_array(request.get_data(as_text=True)))
+        except ValueError:
+            return jsonify({"error": "Expected a JSON array of records or an NDJSON body", "status": "error"}), 400
+    
+    return Response(stream_with_context(_score_chunks(chunks)), mimetype='application/x-ndjson')
+
+def _iter_ndjson_lines(stream):
+    """Yield every non-blank line of an NDJSON body"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+def _chunks(items):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _score_chunks(chunks):
+    """Yield one NDJSON block of results per chunk of raw JSON record texts
+
+    Chunks go to the process pool as they are read, up to one more than it
+    has processes at a time, and their results are yielded in order.
+    """
+    pending = []
+    start = 0
+    # Every chunk of one request is scored by the same model, even across a
+    # hot swap: pool processes that have moved on hand chunks back to be
+    # scored here with plan
+    plan, metadata = serving.snapshot()
+    version = metadata.get('version')
+    try:
+        for chunk in chunks:
+            if scoring_pool is not None:
+                pending.append(scoring_pool.score_lines(plan, chunk, start, version))
+            else:
+                entries = [(start + k, *parse_line(line)) for k, line in enumerate(chunk)]
+                pending.append(score_chunk(plan, scoring_plan, entries))
+            start += len(chunk)
+            while pending and (isinstance(pending[0], str) or len(pending) > PROCESS_POOL_WORKERS):
+                yield result_text(pending.pop(0))
+        while pending:
+            yield result_text(pending.pop(0))
+    finally:
+        # A client that disconnects closes the generator with jobs still in
+        # the pool; their shared memory must not outlive them
+        for result in pending:
+            discard_result(result)
+
+@app.route('/api/feature-impact', methods=['GET'])
+def feature_impact():
+    """Correlation, per-answer depression rates and chi-square test of every feature"""
+    return Response(FEATURE_IMPACT_JSON, mimetype='application/json')
+
+@app.route('/api/feature-impact', methods=['POST'])
+@admitted('heavy')
+def feature_impact_of_csv():
+    """The feature impact analysis of a posted labeled CSV (the dataset's columns), run in the process pool"""
+    if request.content_length is None or request.content_length > MAX_ANALYSIS_BYTES:
+        return jsonify({"error": f"Expected a CSV body of at most {MAX_ANALYSIS_BYTES} bytes", "status": "error"}), 413
+    payload = request.get_data()
+    try:
+        body = scoring_pool.feature_impact(payload) if scoring_pool is not None else feature_impact_csv(payload)
+    except Exception as e:
+        return jsonify({"error": f"Could not analyze the CSV: {e}", "status": "error"}), 400
+    return Response(body, mimetype='application/json')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Counters of this worker: prediction cache hits, misses and the time hits saved, micro batch sizes"""
+    return jsonify(metrics_status())
+
+def metrics_status():
+    return {
+        "pid": os.getpid(),
+        "model_version": serving.snapshot()[1].get('version'),
+        "prediction_cache": prediction_cache.stats() if prediction_cache is not None else None,
+        "micro_batching": batcher.stats() if batcher is not None else None,
+        "process_pool": scoring_pool.stats() if scoring_pool is not None else None,
+        "admission": {name: limit.stats() for name, limit in admission_limits.items()}
+    }
+
 # Add more endpoints as needed for your ML model
 @app.route('/model-info', methods=['GET'])
 def model_info():
-    return jsonify({
-        "model_type": "Mental Health Risk Assessment",
-        "version": "1.0.0",
-        "features": ["Academic Pressure", "Work Pressure", "Sleep Duration", "Financial Stress"],
-        "last_trained": "2025-01-01"
-    })
+    return jsonify(model_info_status())
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
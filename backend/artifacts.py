@@ -0,0 +1,78 @@
+"""Content-addressed cache for trained model bundles.
+
+A bundle holds everything the training pipeline produces (fitted predictor,
+data-driven weights, metrics, ...). It is keyed by the SHA-256 of the training
+CSV's bytes plus the model configuration, so rerunning training on unchanged
+inputs just loads the previous result from disk.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+import joblib
+
+# Bump whenever the training pipeline or the bundle layout changes, so bundles
+# written by older code are never picked up by mistake
+BUNDLE_FORMAT = 10
+
+DEFAULT_ARTIFACT_DIR = os.environ.get(
+    'ARTIFACT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts')
+)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hash a file's bytes without reading it into memory all at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bundle_key(dataset_sha256, model_config):
+    """Combine the dataset hash and model config into the cache key"""
+    payload = json.dumps(
+        {'format': BUNDLE_FORMAT, 'dataset': dataset_sha256, 'model_config': model_config},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def bundle_path(key, artifact_dir=None):
+    return os.path.join(artifact_dir or DEFAULT_ARTIFACT_DIR, f"bundle-{key[:16]}.joblib")
+
+
+def save_bundle(bundle, path):
+    """Write a bundle atomically so concurrent readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_bundle(path):
+    return joblib.load(path)
+
+
+def load_or_build_bundle(csv_filename, model_config, build_fn, artifact_dir=None):
+    """Return the cached bundle for (dataset, config), running build_fn only on a miss"""
+    dataset_sha256 = file_sha256(csv_filename)
+    key = bundle_key(dataset_sha256, model_config)
+    path = bundle_path(key, artifact_dir)
+
+    if os.path.exists(path):
+        print(f"Loading cached training bundle {key[:16]} from {path}")
+        return load_bundle(path)
+
+    print(f"No cached bundle for this dataset/config, training (bundle {key[:16]})...")
+    bundle = build_fn()
+    bundle.update({
+        'version': key[:16],
+        'format': BUNDLE_FORMAT,
+        'trained_at': datetime.now(timezone.utc).isoformat(),
+        'dataset_sha256': dataset_sha256,
+        'model_config': model_config,
+    })
+    save_bundle(bundle, path)
+    return bundle
@@ -0,0 +1,275 @@
+"""ASGI variant of the prediction API, for serving next to (or instead of) the Flask app.
+
+It serves the same model, prediction cache and micro batcher as api.py
+(importing api loads them) and answers /, /health, /api/predict, /predict,
+/api/feature-impact, /metrics and /model-info with the same bodies. The
+batch endpoint stays on the Flask app.
+
+A sync gunicorn worker is held by a request from the moment it is accepted
+until the response is written, so a slow client uploading its answers
+occupies a whole worker. Here the event loop reads request bodies and
+writes responses without blocking, and only the CPU-bound part of a
+prediction (JSON parsing, validation, the model, scoring and JSON encoding)
+runs in a small per-worker thread pool. With micro batching on
+(PREDICT_BATCH_WINDOW_MS), predictions run on the event loop instead and
+await their batch there, so a batch can fill with up to PREDICT_BATCH_MAX
+concurrent requests rather than one per thread. At most ASGI_MAX_PENDING
+predictions run at once; further requests wait on the event loop, where
+waiting costs no thread. Once ASGI_MAX_QUEUED requests wait, or one has
+waited ADMISSION_QUEUE_TIMEOUT_MS, predictions are shed with a 503 and
+Retry-After, as in the Flask app (see admission.py).
+
+Run from the backend directory, e.g. on port 5001 beside the Flask app::
+
+    uvicorn asgi_api:app --port 5001 --workers 2
+    PORT=5001 gunicorn --config gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi_api:app
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import api
+
+# Threads scoring requests, per worker, when micro batching is off. Scoring
+# holds the GIL, so more threads than cores rarely help.
+ASGI_SCORING_THREADS = int(os.environ.get('ASGI_SCORING_THREADS', 2))
+# Predictions running at once, per worker; at least a full micro batch
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', max(64, api.PREDICT_BATCH_MAX)))
+# Requests waiting for one of those, per worker, before further ones are shed
+ASGI_MAX_QUEUED = int(os.environ.get('ASGI_MAX_QUEUED', 256))
+# Larger request bodies are refused with 413
+MAX_BODY_BYTES = int(os.environ.get('MAX_BODY_BYTES', 1 << 20))
+
+JSON_HEADERS = [(b'content-type', b'application/json')]
+CORS_HEADERS = [
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type'),
+]
+
+HOME_JSON = json.dumps({
+    "message": "Mental Health ML API is running!",
+    "status": "healthy",
+    "service": "ML Prediction API (ASGI)",
+    "endpoints": {
+        "health": "/health",
+        "predict": "/api/predict (POST)",
+        "feature_impact": "/api/feature-impact",
+        "metrics": "/metrics"
+    }
+}).encode('utf-8')
+
+
+# Returned by _Scoring.run for a request that was shed
+SHED = object()
+
+
+class _Scoring:
+    """Thread pool and admission semaphore of one worker process and its event loop"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.executor = ThreadPoolExecutor(ASGI_SCORING_THREADS, thread_name_prefix='asgi-scoring')
+        self.pending = asyncio.Semaphore(ASGI_MAX_PENDING)
+        self.queued = self.peak_queued = 0
+        self.admitted = self.shed_queue_full = self.shed_timeout = 0
+
+    async def _admit(self):
+        """Wait for a slot; False if the request is shed instead"""
+        if self.pending.locked():
+            if self.queued >= ASGI_MAX_QUEUED:
+                self.shed_queue_full += 1
+                return False
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            try:
+                await asyncio.wait_for(self.pending.acquire(), api.ADMISSION_QUEUE_TIMEOUT_MS / 1e3)
+            except asyncio.TimeoutError:
+                self.shed_timeout += 1
+                return False
+            finally:
+                self.queued -= 1
+        else:
+            await self.pending.acquire()
+        self.admitted += 1
+        return True
+
+    async def run(self, fn, *args):
+        """fn(*args) in the thread pool, or SHED when too many requests already wait for it"""
+        if not await self._admit():
+            return SHED
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending.release()
+
+    async def run_here(self, coroutine_fn, *args):
+        """Await coroutine_fn(*args) on the event loop, admitted like run()"""
+        if not await self._admit():
+            return SHED
+        try:
+            return await coroutine_fn(*args)
+        finally:
+            self.pending.release()
+
+    def stats(self):
+        return {
+            'max_in_flight': ASGI_MAX_PENDING,
+            'max_queued': ASGI_MAX_QUEUED,
+            'queued': self.queued,
+            'peak_queued': self.peak_queued,
+            'admitted': self.admitted,
+            'shed': self.shed_queue_full + self.shed_timeout,
+            'shed_queue_full': self.shed_queue_full,
+            'shed_timeout': self.shed_timeout,
+        }
+
+
+_scoring = None
+
+
+def scoring():
+    # Created on first use in each worker: threads do not survive fork, and
+    # the semaphore belongs to the worker's event loop
+    global _scoring
+    if _scoring is None or _scoring.pid != os.getpid():
+        _scoring = _Scoring()
+    return _scoring
+
+
+def _parse_predict_body(body):
+    """(answers, None), or (None, (HTTP status, JSON error bytes)) for an unusable /api/predict body"""
+    try:
+        data = json.loads(body) if body else None
+    except ValueError as e:
+        return None, (400, _encode({"error": f"Invalid JSON: {e}", "status": "error"}))
+    if not data:
+        return None, (400, _encode({"error": "No data provided", "status": "error"}))
+    if not isinstance(data, dict):
+        return None, (400, _encode({"error": "Expected a JSON object of answers", "status": "error"}))
+    return data, None
+
+
+def _predict_body(body):
+    """(HTTP status, JSON response bytes) of an /api/predict request body"""
+    data, error = _parse_predict_body(body)
+    if error is not None:
+        return error
+    try:
+        result, status = api.predict_record(data)
+    except Exception as e:
+        print(f"Error in prediction: {str(e)}")
+        return 500, _encode({"error": str(e), "status": "error"})
+    return status, _encode(result)
+
+
+async def _predict_body_batched(body):
+    """_predict_body on the event loop, awaiting the micro batch instead of holding a thread for it"""
+    data, error = _parse_predict_body(body)
+    if error is not None:
+        return error
+    try:
+        result, status = await api.predict_record_batched(data)
+    except Exception as e:
+        print(f"Error in prediction: {str(e)}")
+        return 500, _encode({"error": str(e), "status": "error"})
+    return status, _encode(result)
+
+
+def _encode(body):
+    return json.dumps(body).encode('utf-8')
+
+
+async def _read_body(receive):
+    """The request body, or None once it grows past MAX_BODY_BYTES"""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return b''
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _respond(send, status, body, headers=JSON_HEADERS, origin=None):
+    headers = list(headers) + [(b'content-length', str(len(body)).encode('ascii'))]
+    if origin is not None:
+        # Any origin is allowed, as in the Flask app's CORS setup
+        headers.append((b'access-control-allow-origin', origin))
+        headers.append((b'vary', b'Origin'))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _scoring is not None:
+                _scoring.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    path, method = scope['path'], scope['method']
+    origin = dict(scope['headers']).get(b'origin')
+
+    if method == 'OPTIONS':
+        # CORS preflight
+        return await _respond(send, 200, b'', CORS_HEADERS, origin)
+
+    if path in ('/api/predict', '/predict'):
+        if method != 'POST':
+            return await _respond(send, 405, _encode({"error": "Method not allowed", "status": "error"}), origin=origin)
+        body = await _read_body(receive)
+        if body is None:
+            return await _respond(send, 413, _encode({"error": "Request body too large", "status": "error"}),
+                                  origin=origin)
+        if api.batcher is not None:
+            result = await scoring().run_here(_predict_body_batched, body)
+        else:
+            result = await scoring().run(_predict_body, body)
+        if result is SHED:
+            return await _respond(send, 503, _encode({"error": "Server is busy, retry later", "status": "error"}),
+                                  JSON_HEADERS + [(b'retry-after', str(api.RETRY_AFTER_SECONDS).encode('ascii'))],
+                                  origin)
+        status, response = result
+        return await _respond(send, status, response, origin=origin)
+
+    route = GET_ROUTES.get(path)
+    if route is None:
+        # Unknown paths, including the Flask app's batch endpoint, are 404s as there
+        return await _respond(send, 404, _encode({"error": "Not found", "status": "error"}), origin=origin)
+    if method != 'GET':
+        return await _respond(send, 405, _encode({"error": "Method not allowed", "status": "error"}), origin=origin)
+    return await _respond(send, 200, route(), origin=origin)
+
+
+def _metrics():
+    metrics = api.metrics_status()
+    # The Flask app's limits do not apply here
+    metrics["admission"] = {"predict": scoring().stats()}
+    return _encode(metrics)
+
+
+# Response bodies of the GET routes
+GET_ROUTES = {
+    '/': lambda: HOME_JSON,
+    '/health': lambda: _encode(api.health_status()),
+    '/model-info': lambda: _encode(api.model_info_status()),
+    '/api/feature-impact': lambda: api.FEATURE_IMPACT_JSON.encode('utf-8'),
+    '/metrics': _metrics,
+}
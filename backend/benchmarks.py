@@ -0,0 +1,469 @@
+"""Performance benchmarks for the prediction service.
+
+Run from the backend directory, e.g. ``python benchmarks.py batch``. With no
+arguments every benchmark is run in turn.
+"""
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from model import load_or_train_bundle
+
+DATA_PATH = "Student Depression Dataset.csv"
+
+
+def load_records(n_records):
+    """Raw questionnaire-style records sampled (with replacement) from the dataset"""
+    df = pd.read_csv(DATA_PATH).drop(columns=['id', 'Depression'])
+    df = df.sample(n=n_records, replace=len(df) < n_records, random_state=42)
+    return df.to_dict('records')
+
+
+def time_per_call(fn, repeats):
+    """Mean wall-clock seconds per call of fn over repeats calls"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def bench_batch(predictor, n_records=10000, n_single=500):
+    """Looping predict_depression vs one vectorized predict_batch call"""
+    print("\n" + "="*60)
+    print(f"BATCH SCORING ({n_records} records)")
+    print("="*60)
+    records = load_records(n_records)
+
+    single = time_per_call(lambda: [predictor.predict_depression(r) for r in records[:n_single]], 1) / n_single
+    batch = time_per_call(lambda: predictor.predict_batch(records), 3) / n_records
+
+    print(f"predict_depression loop: {single*1e6:10.1f} us/record  ({1/single:12,.0f} records/s)")
+    print(f"predict_batch:           {batch*1e6:10.1f} us/record  ({1/batch:12,.0f} records/s)")
+    print(f"Speedup: {single/batch:.1f}x")
+
+
+def latency_percentiles(fn, repeats):
+    """(p50, p99) wall-clock seconds of individual fn calls"""
+    fn()
+    samples = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples[i] = time.perf_counter() - start
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def bench_single(predictor, repeats=5000):
+    """Single-record latency of predict_depression and its stages"""
+    print("\n" + "="*60)
+    print(f"SINGLE-RECORD LATENCY ({repeats} calls)")
+    print("="*60)
+    record = load_records(1)[0]
+    plan = predictor.inference_plan or predictor.compile_inference_plan()
+    row = np.empty((1, plan.n_features))
+
+    for label, fn in [
+        ('encode + scale', lambda: plan.encode([record], out=row)),
+        ('predict_many', lambda: plan.predict_many(row)),
+        ('predict_depression', lambda: predictor.predict_depression(record)),
+    ]:
+        p50, p99 = latency_percentiles(fn, repeats)
+        print(f"{label:20s} p50 {p50*1e6:8.1f} us   p99 {p99*1e6:8.1f} us")
+
+
+def bench_trees(predictor, batch_sizes=(1, 64, 10000)):
+    """Flattened NumPy tree ensemble vs best_model.predict_proba, with a bit-exactness check"""
+    from tree_engine import FlatTreeEnsemble, check_equivalence
+
+    print("\n" + "="*60)
+    print("TREE ENSEMBLE INFERENCE")
+    print("="*60)
+    plan = predictor.inference_plan or predictor.compile_inference_plan()
+    engine = FlatTreeEnsemble.from_gradient_boosting(predictor.best_model)
+    X = plan.encode(load_records(max(batch_sizes)))
+
+    check_equivalence(predictor.best_model, engine, X)
+    print(f"Equivalence: bit-identical to predict_proba on {len(X)} rows")
+
+    for n in batch_sizes:
+        repeats = max(5, 2000 // n)
+        sklearn_time = time_per_call(lambda: predictor.best_model.predict_proba(X[:n]), repeats)
+        flat_time = time_per_call(lambda: engine.predict_proba(X[:n]), repeats)
+        print(f"batch {n:6d}: predict_proba {sklearn_time*1e6:10.1f} us   flat {flat_time*1e6:10.1f} us   "
+              f"speedup {sklearn_time/flat_time:5.1f}x")
+
+
+def bench_load(predictor, repeats=20):
+    """Loading the memory-mapped flat model file vs unpickling with joblib"""
+    import os
+    import tempfile
+    import joblib
+    from flat_model import load_flat_model, write_flat_model
+
+    print("\n" + "="*60)
+    print("MODEL LOAD TIME")
+    print("="*60)
+    plan = predictor.inference_plan or predictor.compile_inference_plan()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pickle_path = os.path.join(tmp_dir, 'predictor.joblib')
+        flat_path = os.path.join(tmp_dir, 'model.flat')
+        joblib.dump(predictor, pickle_path)
+        write_flat_model(plan, flat_path)
+
+        joblib_time = time_per_call(lambda: joblib.load(pickle_path), repeats)
+        flat_time = time_per_call(lambda: load_flat_model(flat_path), repeats)
+        print(f"joblib.load (predictor): {joblib_time*1e3:8.2f} ms  ({os.path.getsize(pickle_path):,} bytes)")
+        print(f"load_flat_model (mmap):  {flat_time*1e3:8.2f} ms  ({os.path.getsize(flat_path):,} bytes)")
+        print(f"Speedup: {joblib_time/flat_time:.1f}x")
+
+
+def bench_dataset(predictor, repeats=10):
+    """Preprocessing the training CSV from scratch vs memory-mapping the dataset cache"""
+    import contextlib
+    import io
+    import tempfile
+    from model import DepressionPredictor
+
+    print("\n" + "="*60)
+    print("DATASET LOAD TIME")
+    print("="*60)
+
+    def load(**kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            DepressionPredictor().load_and_preprocess_data(csv_filename=DATA_PATH, **kwargs)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        parse_time = time_per_call(lambda: load(use_cache=False), repeats)
+        load(cache_dir=cache_dir)
+        cached_time = time_per_call(lambda: load(cache_dir=cache_dir), repeats)
+    print(f"parse + encode CSV:      {parse_time*1e3:8.2f} ms")
+    print(f"dataset cache (mmap):    {cached_time*1e3:8.2f} ms")
+    print(f"Speedup: {parse_time/cached_time:.1f}x")
+
+
+def bench_engines(predictor, sizes=(30_000, 1_000_000, 10_000_000), exact_max_rows=1_000_000):
+    """Training time and held-out accuracy of the exact vs hist engines on bootstrapped synthetic rows"""
+    import contextlib
+    import io
+    from sklearn.base import clone
+    from sklearn.metrics import accuracy_score, f1_score
+    from sklearn.model_selection import train_test_split
+    from model import DepressionPredictor
+
+    print("\n" + "="*60)
+    print("TRAINING ENGINES (synthetic rows bootstrapped from the training split)")
+    print("="*60)
+
+    engines = {}
+    for engine in ('exact', 'hist'):
+        trainer = DepressionPredictor()
+        trainer.initialize_models(engine=engine)
+        with contextlib.redirect_stdout(io.StringIO()):
+            X, y, _ = trainer.load_and_preprocess_data(csv_filename=DATA_PATH)
+        # Same split for both engines; only the preprocessing differs
+        X_train, X_test, y_train, y_test = train_test_split(
+            X.to_numpy(), y.to_numpy(), test_size=0.2, random_state=42, stratify=y
+        )
+        engines[engine] = (next(iter(trainer.models.values())), X_train, X_test, y_train, y_test)
+
+    rng = np.random.default_rng(42)
+    for n_rows in sizes:
+        rows = rng.integers(0, len(y_train), size=n_rows)
+        for engine, (model, X_train, X_test, y_train, y_test) in engines.items():
+            if engine == 'exact' and n_rows > exact_max_rows:
+                print(f"{n_rows:>12,} rows  {engine:5s}  skipped (over {exact_max_rows:,} rows)")
+                continue
+            X_big, y_big = X_train[rows], y_train[rows]
+            fitted = clone(model)
+            start = time.perf_counter()
+            fitted.fit(X_big, y_big)
+            fit_seconds = time.perf_counter() - start
+            y_pred = fitted.predict(X_test)
+            print(f"{n_rows:>12,} rows  {engine:5s}  fit {fit_seconds:8.1f} s   "
+                  f"accuracy {accuracy_score(y_test, y_pred):.4f}   F1 {f1_score(y_test, y_pred, average='weighted'):.4f}")
+            del X_big, y_big, fitted
+
+
+def weights_per_column(df):
+    """The per-column calculate_data_driven_weights loop analysis.py replaced, kept as the reference"""
+    feature_stats = {}
+    for column in df.columns:
+        if column in ['id', 'Depression']:
+            continue
+        correlation = df[column].corr(df['Depression'])
+        if df[column].dtype == 'object' or df[column].nunique() <= 10:
+            crosstab = pd.crosstab(df[column], df['Depression'])
+            if crosstab.shape == (2, 2):
+                odds_ratio = (crosstab.iloc[0,0] * crosstab.iloc[1,1]) / (crosstab.iloc[0,1] * crosstab.iloc[1,0] + 1e-8)
+            else:
+                odds_ratio = 1.0
+        else:
+            odds_ratio = 1.0
+        depression_rates = df.groupby(column)['Depression'].mean()
+        high_risk_threshold = depression_rates.mean() + depression_rates.std()
+        feature_stats[column] = {
+            'correlation': abs(correlation) if not pd.isna(correlation) else 0,
+            'odds_ratio': abs(np.log(odds_ratio)) if odds_ratio > 0 else 0,
+            'rate_difference': depression_rates.max() - depression_rates.min(),
+            'high_risk_values': depression_rates[depression_rates > high_risk_threshold].index.tolist(),
+            'depression_rates': depression_rates
+        }
+    max_correlation = max(stats['correlation'] for stats in feature_stats.values())
+    weights = {
+        feature: max(0.1, min(3.0, (stats['correlation'] / max_correlation) * 2
+                              * (1 + stats['rate_difference']) * (1 + stats['odds_ratio']/10)))
+        for feature, stats in feature_stats.items()
+    }
+    return weights, {feature: stats['high_risk_values'] for feature, stats in feature_stats.items()}, feature_stats
+
+
+def bench_weights(predictor, sizes=(None, 1_000_000), repeats=3):
+    """Batched calculate_data_driven_weights vs the per-column loop, with an exactness check"""
+    import contextlib
+    import io
+    import analysis
+    from model import DepressionPredictor
+
+    print("\n" + "="*60)
+    print("DATA-DRIVEN WEIGHTS")
+    print("="*60)
+    trainer = DepressionPredictor()
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, _, df = trainer.load_and_preprocess_data(csv_filename=DATA_PATH)
+
+    for n_rows in sizes:
+        # None is the dataset itself; larger sizes bootstrap its rows
+        data = df if n_rows is None else df.sample(n=n_rows, replace=True, random_state=42).reset_index(drop=True)
+        loop_result = weights_per_column(data)
+        batched_result = analysis.data_driven_weights(data)
+        assert loop_result[:2] == batched_result[:2]
+        for feature, stats in loop_result[2].items():
+            for key, value in stats.items():
+                if key == 'depression_rates':
+                    pd.testing.assert_series_equal(value, batched_result[2][feature][key], check_exact=True)
+                else:
+                    assert value == batched_result[2][feature][key]
+
+        loop_time = time_per_call(lambda: weights_per_column(data), repeats)
+        batched_time = time_per_call(lambda: analysis.data_driven_weights(data), repeats)
+        print(f"{len(data):>10,} rows: per-column {loop_time*1e3:9.1f} ms   batched {batched_time*1e3:9.1f} ms   "
+              f"speedup {loop_time/batched_time:5.1f}x   (identical)")
+
+
+def bench_scoring(predictor, sizes=(1, 1000, 1_000_000), n_encoded=10000, max_loop=1000):
+    """Risk scoring with score_one per record vs encode + score_matrix, with an agreement check
+
+    Records past n_encoded reuse the encoded rows, so score_matrix runs on
+    the full size without building a million dicts.
+    """
+    print("\n" + "="*60)
+    print("RISK SCORING")
+    print("="*60)
+    plan = predictor.scoring_plan_for()
+    records = load_records(n_encoded)
+    encoded = plan.encode(records)
+    _, totals = plan.score_matrix(encoded)
+    assert np.allclose(totals, [plan.score_one(record)[1] for record in records], rtol=0, atol=1e-9)
+
+    for n_records in sizes:
+        sample = records[:n_records]
+        matrix = np.resize(encoded, (n_records, encoded.shape[1]))
+        repeats = max(1, 10000 // n_records)
+        line = f"{n_records:>10,} records:"
+        if n_records <= max_loop:
+            loop = time_per_call(lambda: [plan.score_one(record) for record in sample], repeats)
+            line += f"  score_one loop {loop/n_records*1e6:7.2f} us/record"
+        if n_records <= n_encoded:
+            encode = time_per_call(lambda: plan.encode(sample), repeats)
+            line += f"  encode {encode/n_records*1e6:7.2f} us/record"
+        score = time_per_call(lambda: plan.score_matrix(matrix), repeats)
+        line += f"  score_matrix {score/n_records*1e6:7.3f} us/record ({n_records/score:12,.0f} records/s)"
+        print(line)
+
+
+def bench_stats(predictor, sizes=(None, 1_000_000), batch_size=1000, repeats=3):
+    """Rescanning the whole frame for weights and feature impact vs folding a new batch into a StatsStore"""
+    import copy
+    import analysis
+    import schema
+    from stats_store import StatsStore
+
+    print("\n" + "="*60)
+    print(f"INCREMENTAL STATISTICS (new batch of {batch_size} rows)")
+    print("="*60)
+    raw = pd.read_csv(DATA_PATH, **schema.read_csv_kwargs())
+    for n_rows in sizes:
+        # None is the dataset itself; larger sizes bootstrap its rows
+        data = raw if n_rows is None else raw.sample(n=n_rows, replace=True, random_state=42).reset_index(drop=True)
+        store = StatsStore()
+        store.update(data)
+        batch = raw.sample(n=batch_size, random_state=1)
+        # The imputed, label-encoded frame the full pipeline rescans
+        updated = pd.concat([data, batch], ignore_index=True)
+        expected = copy.deepcopy(store)
+        expected.update(batch)
+        encoded = updated.copy()
+        for col in expected.columns:
+            if expected.missing[col][0]:
+                encoded[col] = encoded[col].fillna(expected.fill_value(col))
+        for col, categories in expected.labels().items():
+            encoded[col] = pd.Categorical(encoded[col], categories=categories).codes.astype(np.int64)
+
+        def rescan():
+            return analysis.data_driven_weights(encoded), analysis.feature_impact(encoded)
+
+        def incremental():
+            fresh = copy.deepcopy(store)
+            fresh.update(batch)
+            return fresh.data_driven_weights(), fresh.feature_impact()
+
+        assert rescan()[0][1] == incremental()[0][1]
+        rescan_time = time_per_call(rescan, repeats)
+        incremental_time = time_per_call(incremental, repeats)
+        print(f"{len(updated):>10,} rows: rescan {rescan_time*1e3:9.1f} ms   store update + derive "
+              f"{incremental_time*1e3:7.1f} ms   speedup {rescan_time/incremental_time:6.1f}x   (same thresholds)")
+
+
+def bench_cache(predictor, n_requests=20000, n_distinct=(100, 1000, 10000), repeats=1):
+    """Single-record predictions with and without the prediction cache, for traffic of n distinct answer sets"""
+    from prediction_cache import PredictionCache, SharedPredictionCache, predict_cached
+
+    print("\n" + "="*60)
+    print(f"PREDICTION CACHE ({n_requests} requests)")
+    print("="*60)
+    plan = predictor.inference_plan or predictor.compile_inference_plan()
+    pool = load_records(max(n_distinct))
+    rng = np.random.default_rng(42)
+    uncached = None
+    for distinct in n_distinct:
+        requests = [pool[i] for i in rng.integers(0, distinct, n_requests)]
+        if uncached is None:
+            uncached = time_per_call(lambda: [plan.predict_one(r) for r in requests], repeats) / n_requests
+            print(f"{'uncached':>22s}: {uncached*1e6:6.1f} us/request")
+        for cache_class in (PredictionCache, SharedPredictionCache):
+            cache = cache_class()
+            cached = time_per_call(lambda: [predict_cached(cache, plan, 'v', r) for r in requests], repeats) / n_requests
+            stats = cache.stats()
+            print(f"{stats['kind']:>7s}, {distinct:>6} distinct: {cached*1e6:6.1f} us/request   "
+                  f"hit rate {stats['hit_rate']:5.1%}   speedup {uncached/cached:4.2f}x")
+
+
+def closed_loop(predict_one, records, n_clients, duration):
+    """(requests/s, p50 s, p99 s) of n_clients threads each calling predict_one back to back for duration seconds"""
+    import threading
+
+    latencies = [[] for _ in range(n_clients)]
+    stop = time.perf_counter() + duration
+
+    def client(k):
+        samples, i = latencies[k], k
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            predict_one(records[i % len(records)])
+            samples.append(time.perf_counter() - start)
+            i += n_clients
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(n_clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    samples = np.concatenate([np.array(s) for s in latencies])
+    return len(samples) / elapsed, np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def bench_microbatch(predictor, clients=(1, 8, 32, 64), windows_ms=(1, 2, 5), max_batch=64, duration=2.0):
+    """Throughput and p99 latency of concurrent single-record predictions, direct vs micro-batched"""
+    from micro_batch import MicroBatcher
+
+    print("\n" + "="*60)
+    print(f"MICRO-BATCHING (closed loop, {duration:.0f}s per run)")
+    print("="*60)
+    plan = predictor.inference_plan or predictor.compile_inference_plan()
+    records = load_records(1000)
+    modes = [('direct', plan.predict_one)]
+    for window_ms in windows_ms:
+        batcher = MicroBatcher(window_ms / 1e3, max_batch)
+        modes.append((f"{window_ms} ms window", lambda r, batcher=batcher: batcher.predict(plan, plan.encode_one(r))))
+    for n_clients in clients:
+        for label, predict_one in modes:
+            throughput, p50, p99 = closed_loop(predict_one, records, n_clients, duration)
+            print(f"{n_clients:3d} clients, {label:12s}: {throughput:9,.0f} req/s   "
+                  f"p50 {p50*1e3:7.2f} ms   p99 {p99*1e3:7.2f} ms")
+
+
+def bench_pool(predictor, n_batch=2048, n_single=300, pause=0.005):
+    """Single-record latency while another thread scores batch chunks, in that thread vs in the process pool"""
+    import threading
+
+    from process_pool import ScoringPool, result_text, score_chunk
+
+    print("\n" + "="*60)
+    print(f"PROCESS POOL (chunks of {n_batch} records next to single predictions)")
+    print("="*60)
+    plan = predictor.inference_plan or predictor.compile_inference_plan()
+    scoring_plan = predictor.scoring_plan_for()
+    records = [{col: value for col, value in record.items() if not pd.isna(value)} for record in load_records(n_batch)]
+    lines = [json.dumps(record).encode('utf-8') for record in records]
+    pool = ScoringPool(1, None, plan, scoring_plan)
+    result_text(pool.score_lines(plan, lines, 0))
+
+    def in_thread(chunk):
+        return score_chunk(plan, scoring_plan, [(k, record, None) for k, record in enumerate(chunk)])
+
+    modes = [('idle', None), ('batch in thread', in_thread),
+             ('batch in pool', lambda chunk: result_text(pool.score_lines(plan, lines, 0)))]
+    for label, score_batch in modes:
+        stop = threading.Event()
+        chunks = [0]
+
+        def batch_loop():
+            while not stop.is_set():
+                score_batch(records)
+                chunks[0] += 1
+
+        if score_batch is not None:
+            thread = threading.Thread(target=batch_loop)
+            thread.start()
+        samples = np.empty(n_single)
+        started = time.perf_counter()
+        for i in range(n_single):
+            time.sleep(pause)
+            start = time.perf_counter()
+            plan.predict_one(records[i])
+            scoring_plan.score_one(records[i])
+            samples[i] = time.perf_counter() - start
+        elapsed = time.perf_counter() - started
+        stop.set()
+        if score_batch is not None:
+            thread.join()
+        p50, p99 = np.percentile(samples, [50, 99])
+        print(f"{label:16s}: single p50 {p50*1e3:7.2f} ms   p99 {p99*1e3:7.2f} ms   "
+              f"batch {chunks[0] * n_batch / elapsed:8,.0f} records/s")
+
+
+BENCHMARKS = {
+    'batch': bench_batch,
+    'single': bench_single,
+    'trees': bench_trees,
+    'load': bench_load,
+    'dataset': bench_dataset,
+    'engines': bench_engines,
+    'weights': bench_weights,
+    'scoring': bench_scoring,
+    'stats': bench_stats,
+    'cache': bench_cache,
+    'microbatch': bench_microbatch,
+    'pool': bench_pool,
+}
+
+
+if __name__ == "__main__":
+    predictor = load_or_train_bundle(DATA_PATH)['predictor']
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name](predictor)
@@ -0,0 +1,131 @@
+"""On-disk cache of a parsed and encoded training CSV.
+
+Preprocessing the survey export means parsing it as text, imputing and
+label-encoding every categorical column and scaling. The first load of a CSV
+writes the results next to the other artifacts:
+
+    X_scaled.npy, encoded.npy   the encoded, scaled feature matrix and the
+                                encoded frame (features plus target)
+    y.npy                       the label vector
+    state.joblib                fitted label encoders, scaler and fill values
+    meta.json                   source file size, mtime and SHA-256
+
+Preprocessing variants (e.g. categorical codes left unscaled for the hist
+training engine) are cached side by side under their own directory.
+
+Later loads memory-map the .npy files and skip parsing and encoding entirely.
+The cache is reused while the source's size and mtime are unchanged (or, if
+only the mtime moved, while its SHA-256 still matches) and rebuilt otherwise.
+"""
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import artifacts
+
+# Bump whenever preprocessing or the cache layout changes
+CACHE_FORMAT = 4
+
+DEFAULT_CACHE_DIR = os.path.join(artifacts.DEFAULT_ARTIFACT_DIR, 'datasets')
+
+
+def cache_path(csv_filename, cache_dir=None, variant=''):
+    """Directory holding the cache for one source file and preprocessing variant"""
+    source = os.path.abspath(csv_filename)
+    name = hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+    suffix = f"-{variant}" if variant else ''
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, f"dataset-{name}{suffix}")
+
+
+def _source_stat(csv_filename):
+    stat = os.stat(csv_filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(path, meta):
+    tmp_path = os.path.join(path, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+
+def is_fresh(csv_filename, cache_dir=None, variant=''):
+    """Whether a complete cache for the current contents of csv_filename exists"""
+    path = cache_path(csv_filename, cache_dir, variant)
+    meta = _read_meta(path)
+    if meta is None or meta.get('format') != CACHE_FORMAT:
+        return False
+    size, mtime_ns = _source_stat(csv_filename)
+    if (size, mtime_ns) == (meta['size'], meta['mtime_ns']):
+        return True
+    if size != meta['size'] or artifacts.file_sha256(csv_filename) != meta['sha256']:
+        return False
+    # Touched but unchanged: remember the new mtime so the hash is skipped next time
+    meta['mtime_ns'] = mtime_ns
+    _write_meta(path, meta)
+    return True
+
+
+def save(csv_filename, X_scaled, y, df, state, cache_dir=None, variant=''):
+    """Write the cache for csv_filename; meta.json goes last so partial caches are never read"""
+    path = cache_path(csv_filename, cache_dir, variant)
+    os.makedirs(path, exist_ok=True)
+    meta_file = os.path.join(path, 'meta.json')
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+
+    size, mtime_ns = _source_stat(csv_filename)
+    np.save(os.path.join(path, 'X_scaled.npy'), np.ascontiguousarray(X_scaled.to_numpy(dtype=np.float64)))
+    np.save(os.path.join(path, 'encoded.npy'), np.ascontiguousarray(df.to_numpy(dtype=np.float64)))
+    np.save(os.path.join(path, 'y.npy'), y.to_numpy())
+    joblib.dump(state, os.path.join(path, 'state.joblib'))
+
+    _write_meta(path, {
+        'format': CACHE_FORMAT,
+        'source': os.path.abspath(csv_filename),
+        'size': size,
+        'mtime_ns': mtime_ns,
+        'sha256': artifacts.file_sha256(csv_filename),
+        'feature_names': list(X_scaled.columns),
+        'columns': list(df.columns),
+        'dtypes': [df[col].dtype.str for col in df.columns],
+        'target': y.name,
+    })
+    print(f"Cached preprocessed dataset in {path}")
+
+
+def load(csv_filename, cache_dir=None, variant=''):
+    """(X_scaled, y, df, state) from the cache, or None if it is missing or stale"""
+    try:
+        if not is_fresh(csv_filename, cache_dir, variant):
+            return None
+    except OSError:
+        return None
+    path = cache_path(csv_filename, cache_dir, variant)
+    meta = _read_meta(path)
+
+    # Copy-on-write mappings: pages are shared until something writes to them
+    X = np.load(os.path.join(path, 'X_scaled.npy'), mmap_mode='c')
+    encoded = np.load(os.path.join(path, 'encoded.npy'), mmap_mode='c')
+    X_scaled = pd.DataFrame(X, columns=meta['feature_names'], copy=False)
+    df = pd.DataFrame(encoded, columns=meta['columns'], copy=False)
+    # Integer columns (codes, id, target) go back to their original dtype
+    restore = {col: dtype for col, dtype in zip(meta['columns'], meta['dtypes']) if np.dtype(dtype) != np.float64}
+    if restore:
+        df = df.astype(restore)
+    y = pd.Series(np.load(os.path.join(path, 'y.npy'), mmap_mode='c'), name=meta['target'])
+    state = joblib.load(os.path.join(path, 'state.joblib'))
+    return X_scaled, y, df, state
+
@@ -0,0 +1,287 @@
+"""Flat, memory-mappable model file shared by all API workers.
+
+The file holds everything an InferencePlan needs to serve: the flattened tree
+arrays (of one ensemble, or of each member of a cross-validation fold
+ensemble), the scaler mean/scale vectors, encoded fill values and the category
+vocabularies. Layout::
+
+    b'MBFLAT01' | header length (uint64 LE) | JSON header | pad | arrays...
+
+Arrays are 64-byte aligned and described in the header by dtype, shape and
+offset. Loading maps the file read-only with np.memmap and wraps each array
+as a view into the mapping, so every worker process shares the same page
+cache pages and worker RSS does not grow with the number of workers.
+
+A new model version is published by writing a temp file next to the current
+one and os.replace()-ing it over the path. A watcher thread in each worker
+notices the new inode, maps and warms the new file and swaps it in with one
+reference assignment, so requests never wait on the swap; in-flight
+requests keep using the old mapping. The plan and its metadata are swapped
+as one (plan, metadata) snapshot, so a request that reads snapshot() once
+never pairs one model's predictions with another's version.
+"""
+import json
+import os
+import threading
+import time
+import weakref
+from functools import partial
+
+import numpy as np
+
+from cv_engine import FoldEnsemble
+from inference import InferencePlan
+from tree_engine import FlatTreeEnsemble
+
+MAGIC = b'MBFLAT01'
+# Format 2 added fold ensembles; format 1 files (single ensembles) read as before
+FORMAT = 2
+READABLE_FORMATS = (1, 2)
+ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def flattenable(plan):
+    """Whether plan can be written as a flat model file: a flattened tree ensemble, or a fold ensemble of them"""
+    if isinstance(plan.engine, FoldEnsemble):
+        return all(isinstance(member, FlatTreeEnsemble) for member in plan.engine.models)
+    return isinstance(plan.engine, FlatTreeEnsemble)
+
+
+def write_flat_model(plan, path, metadata=None):
+    """Atomically write plan (which must have a flattened engine) to path"""
+    if not flattenable(plan):
+        raise ValueError("Only models with a flattened tree engine can be written as flat files")
+
+    arrays = {
+        'mean': plan.mean,
+        'scale': plan.scale,
+        'fill_values': plan.fill_values,
+        'classes': plan.classes,
+    }
+    engine_header = {}
+    if isinstance(plan.engine, FoldEnsemble):
+        # Member k's arrays are engine.<k>.<name>
+        engine_header['fold_engines'] = []
+        for k, member in enumerate(plan.engine.models):
+            member_arrays, member_scalars = member.to_arrays()
+            arrays.update({f'engine.{k}.{name}': array for name, array in member_arrays.items()})
+            engine_header['fold_engines'].append(member_scalars)
+    else:
+        engine_arrays, engine_header['engine'] = plan.engine.to_arrays()
+        arrays.update({f'engine.{name}': array for name, array in engine_arrays.items()})
+
+    specs, offset = {}, 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        specs[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({
+        'format': FORMAT,
+        'feature_names': plan.feature_names,
+        # Categories listed in code order, so index == label code
+        'vocabularies': {
+            col: sorted(vocabulary, key=vocabulary.get) for col, vocabulary in plan.vocabularies.items()
+        },
+        **engine_header,
+        'threshold': plan.threshold,
+        'metadata': metadata or {},
+        'arrays': specs,
+    }).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + specs[name]['offset'])
+            f.write(array.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    # Readers see either the old file or the complete new one, never a mix
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    """Parse just the JSON header of a flat model file"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a flat model file")
+        header_length = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_length))
+    if header.get('format') not in READABLE_FORMATS:
+        raise ValueError(f"Unsupported flat model format {header.get('format')} in {path}")
+    header['data_start'] = _align(len(MAGIC) + 8 + header_length)
+    return header
+
+
+def load_flat_model(path):
+    """Map a flat model file read-only and return (plan, metadata) backed by the mapping"""
+    header = read_header(path)
+    mapping = np.memmap(path, dtype=np.uint8, mode='r')
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        arrays[name] = np.frombuffer(
+            mapping, dtype=dtype, count=count, offset=header['data_start'] + spec['offset']
+        ).reshape(spec['shape'])
+
+    if 'fold_engines' in header:
+        engine = FoldEnsemble([
+            _engine_from_arrays(arrays, f'engine.{k}.', scalars) for k, scalars in enumerate(header['fold_engines'])
+        ], arrays['classes'])
+    else:
+        engine = _engine_from_arrays(arrays, 'engine.', header['engine'])
+    vocabularies = {
+        col: {category: code for code, category in enumerate(categories)}
+        for col, categories in header['vocabularies'].items()
+    }
+    plan = InferencePlan(
+        header['feature_names'], vocabularies, arrays['fill_values'],
+        arrays['mean'], arrays['scale'], arrays['classes'], engine=engine,
+        threshold=header.get('threshold')
+    )
+    return plan, header['metadata']
+
+
+def _engine_from_arrays(arrays, prefix, scalars):
+    return FlatTreeEnsemble.from_arrays(
+        {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}, scalars
+    )
+
+
+def publish_if_changed(plan, path, metadata):
+    """Write plan to path unless the file there already holds the same model version
+
+    A model retrained from this version (see retrain.py) is left in place too.
+    """
+    if os.path.exists(path):
+        try:
+            served = read_header(path)['metadata']
+            if metadata.get('version') in (served.get('version'), served.get('base_version')):
+                return False
+        except ValueError:
+            pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    write_flat_model(plan, path, metadata)
+    return True
+
+
+class FlatModelHandle:
+    """Serves the plan in a flat model file, remapping it when the file is replaced"""
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._file_id = None
+        # Process the watcher thread runs in; forked workers start their own
+        self._watcher_pid = None
+        self._watcher_lock = threading.Lock()
+        # (plan, metadata), replaced as a whole
+        self._served = (None, {})
+        self._load()
+        # A lock held by another thread at fork stays held in the child forever
+        os.register_at_fork(after_in_child=partial(_reset_after_fork, weakref.ref(self)))
+
+    def _stat_id(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        file_id = self._stat_id()
+        plan, metadata = load_flat_model(self.path)
+        # Pay first-call costs before the plan goes live
+        plan.predict_one({})
+        # One reference assignment: readers get the old or the new snapshot, never a mix
+        self._served = (plan, metadata)
+        self._file_id = file_id
+
+    def check(self):
+        """Load the file if it was replaced since it was last loaded; True if a new plan went live"""
+        try:
+            changed = self._stat_id() != self._file_id
+        except OSError:
+            changed = False
+        if not changed or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._load()
+            return True
+        except (OSError, ValueError) as e:
+            print(f"Keeping current model, failed to load {self.path}: {e}")
+            return False
+        finally:
+            self._lock.release()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            if self.check():
+                print(f"Serving model {self.metadata.get('version')} from {self.path}")
+
+    def start_watching(self):
+        """Start this process's thread that checks every check_interval seconds for a new file"""
+        if self._watcher_pid != os.getpid():
+            with self._watcher_lock:
+                if self._watcher_pid != os.getpid():
+                    # Threads do not survive fork, so each worker starts its own
+                    self._watcher_pid = os.getpid()
+                    threading.Thread(target=self._watch, name='flat-model-watcher', daemon=True).start()
+
+    def snapshot(self):
+        """The live (plan, metadata); starts the watcher in this process on first use"""
+        self.start_watching()
+        return self._served
+
+    def peek(self):
+        """The live (plan, metadata), without starting a watcher (e.g. in a process about to fork)"""
+        return self._served
+
+    def current(self):
+        """The live plan"""
+        return self.snapshot()[0]
+
+    @property
+    def metadata(self):
+        return self._served[1]
+
+
+def _reset_after_fork(handle_ref):
+    handle = handle_ref()
+    if handle is not None:
+        handle._lock = threading.Lock()
+        handle._watcher_lock = threading.Lock()
+        handle._watcher_pid = None
+
+
+class PinnedModelHandle:
+    """Same interface as FlatModelHandle for a plan that only exists in memory"""
+
+    def __init__(self, plan, metadata):
+        self._served = (plan, metadata)
+
+    def start_watching(self):
+        pass
+
+    def snapshot(self):
+        return self._served
+
+    def peek(self):
+        return self._served
+
+    def current(self):
+        return self._served[0]
+
+    @property
+    def metadata(self):
+        return self._served[1]
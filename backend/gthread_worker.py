@@ -0,0 +1,27 @@
+"""gunicorn gthread worker that reports each request's wait for a thread to the app.
+
+A gthread worker queues readable connections for its thread pool, where
+the app cannot see them. This worker adds two headers to every request:
+X-Queue-Start, the time (epoch seconds) it was queued for a thread, and
+X-Queue-Depth, how many requests were queued or running in the worker at
+that moment. Admission control sheds requests that already waited too long
+and reports both in /metrics (see admission.py).
+"""
+import time
+
+from gunicorn.workers.gthread import ThreadWorker
+
+
+class QueueStampingThreadWorker(ThreadWorker):
+    """gthread worker that stamps each request with when it was queued for a thread and behind how many"""
+
+    def enqueue_req(self, conn):
+        conn.queued_at = time.time()
+        conn.queue_depth = len(self.futures)
+        super().enqueue_req(conn)
+
+    def handle_request(self, req, conn):
+        # Appended after any the client sent, which the app ignores
+        req.headers.append(('X-QUEUE-START', f"{conn.queued_at:.6f}"))
+        req.headers.append(('X-QUEUE-DEPTH', str(conn.queue_depth)))
+        return super().handle_request(req, conn)
@@ -0,0 +1,59 @@
+import gc
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threads per worker (gthread workers when above 1). Heavy batch and analysis
+# jobs run in the worker's process pool, so they do not stall its other threads.
+# With threads the worker sees its own queue, so admission control can shed
+# load there; the default limits leave one thread for /health.
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 120
+
+if threads > 1:
+    # gthread, with each request stamped with its wait for a thread (see gthread_worker.py)
+    worker_class = 'gthread_worker.QueueStampingThreadWorker'
+
+# Import api.py (and with it the fitted model) once in the master process, so
+# the workers forked afterwards share those memory pages copy-on-write.
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything allocated while preloading into the permanent GC
+    # generation. Otherwise the first collection in each worker writes to the
+    # model's object headers and copies the shared pages into every worker.
+    gc.freeze()
+
+    # Requests admitted to the limited routes hold a thread each, running or
+    # waiting; with none spare, /health queues behind them
+    api = sys.modules.get('api')
+    if api is not None and server.cfg.threads > 1:
+        from admission import admitted_total
+        admitted = admitted_total(api.admission_limits.values())
+        if admitted >= server.cfg.threads:
+            server.log.warning(
+                "Admission limits admit %d requests per worker but it has only %d threads, so none is "
+                "left for /health; lower the *_MAX_IN_FLIGHT / *_MAX_QUEUED settings or raise GUNICORN_THREADS",
+                admitted, server.cfg.threads
+            )
+        # Each row waits for its micro batch in a request thread
+        if api.batcher is not None and api.admission_limits['predict'].max_in_flight < api.batcher.max_batch:
+            server.log.info(
+                "Micro batches hold at most %d rows per worker (PREDICT_MAX_IN_FLIGHT), not PREDICT_BATCH_MAX=%d; "
+                "the ASGI app fills them",
+                api.admission_limits['predict'].max_in_flight, api.batcher.max_batch
+            )
+
+
+def post_worker_init(worker):
+    api = sys.modules.get('api')
+    if api is None:
+        return
+    # The model file watcher runs in each worker, never in the master: a
+    # fork while it held its lock would leave the worker unable to swap
+    api.serving.start_watching()
+    # Spawn the worker's process pool for heavy jobs now, not on the first one
+    if api.scoring_pool is not None:
+        api.scoring_pool.start()
@@ -0,0 +1,158 @@
+"""Compiled inference plan for serving predictions without pandas.
+
+The plan is built once from a fitted DepressionPredictor. Categorical columns
+become plain dict lookups (category -> label code) and the StandardScaler
+becomes precomputed mean/scale vectors, so encoding a record is a handful of
+dict and float operations written straight into a NumPy feature matrix.
+"""
+import math
+import threading
+
+import numpy as np
+
+import schema
+from tree_engine import FlatTreeEnsemble
+
+# Code used for categories never seen in training. LabelEncoder has no slot
+# for them, so (as before) they share the first code of their column.
+UNKNOWN_CODE = 0
+
+
+class InferencePlan:
+    """Precompiled encode -> scale -> predict steps for a fitted predictor"""
+
+    def __init__(self, feature_names, vocabularies, fill_values, mean, scale, classes, engine=None, model=None,
+                 threshold=None):
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        # {column: {category string: code}} for the categorical columns
+        self.vocabularies = vocabularies
+        # Encoded (unscaled) value used when a field is missing or unparseable
+        self.fill_values = np.asarray(fill_values, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.classes = np.asarray(classes)
+        # Pure-NumPy evaluator when the model supports one; the sklearn model
+        # is only needed otherwise (plans loaded from a flat file have none)
+        self.engine = engine
+        self.model = model
+        # Probability above which a record is predicted positive; None keeps
+        # the model's own argmax decision
+        self.threshold = threshold
+        # (index, name, aliases, frontend answers, vocabulary or None) for each column, in feature order
+        features = [schema.FEATURES_BY_NAME.get(name) for name in self.feature_names]
+        self._columns = [
+            (j, name, feature.aliases if feature else (), feature.answers if feature else {}, vocabularies.get(name))
+            for j, (name, feature) in enumerate(zip(self.feature_names, features))
+        ]
+        self._local = threading.local()
+
+    @classmethod
+    def from_predictor(cls, predictor):
+        """Compile the plan from a predictor's label encoders, scaler and best model"""
+        feature_names = predictor.feature_names
+        vocabularies = {
+            col: {category: code for code, category in enumerate(encoder.classes_)}
+            for col, encoder in predictor.label_encoders.items()
+            if col in feature_names
+        }
+
+        fill_values = []
+        for col in feature_names:
+            fill_value = predictor.fill_values.get(col, 0)
+            if col in vocabularies:
+                fill_values.append(vocabularies[col].get(str(fill_value), UNKNOWN_CODE))
+            else:
+                fill_values.append(float(fill_value))
+
+        # Columns the scaler was not fitted on pass through unchanged
+        mean = np.zeros(len(feature_names))
+        scale = np.ones(len(feature_names))
+        scaler = predictor.scaler
+        position = {col: j for j, col in enumerate(feature_names)}
+        for k, col in enumerate(scaler.feature_names_in_):
+            mean[position[col]] = scaler.mean_[k]
+            scale[position[col]] = scaler.scale_[k]
+
+        model = predictor.best_model
+        try:
+            # Composite models (e.g. a fold ensemble) flatten their own members
+            engine = model.flatten() if hasattr(model, 'flatten') else FlatTreeEnsemble.from_gradient_boosting(model)
+        except (AttributeError, ValueError):
+            engine = None
+        return cls(feature_names, vocabularies, fill_values, mean, scale, model.classes_, engine=engine, model=model,
+                   threshold=getattr(predictor, 'decision_threshold', None))
+
+    def encode_into(self, record, row):
+        """Write one record's encoded, unscaled features into the 1-D array row"""
+        fill_values = self.fill_values
+        for j, name, aliases, answers, vocabulary in self._columns:
+            value = record.get(name)
+            if value is None and aliases:
+                # Older clients send e.g. Academic_Pressure
+                for alias in aliases:
+                    value = record.get(alias)
+                    if value is not None:
+                        break
+            if answers and isinstance(value, str):
+                # Frontend answer labels, as schema.Feature.normalize maps them
+                value = answers.get(value, value)
+            if value is None:
+                row[j] = fill_values[j]
+            elif vocabulary is not None:
+                if isinstance(value, float) and math.isnan(value):
+                    row[j] = fill_values[j]
+                else:
+                    # Same string form LabelEncoder was fitted on; unseen
+                    # categories go to the unknown bucket
+                    row[j] = vocabulary.get(value if isinstance(value, str) else str(value), UNKNOWN_CODE)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                row[j] = fill_values[j] if math.isnan(value) else value
+            else:
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    value = math.nan
+                row[j] = fill_values[j] if math.isnan(value) else value
+
+    def encode(self, records, out=None):
+        """Encode and scale records into a (n_records, n_features) matrix, reusing out if given"""
+        if out is None:
+            out = np.empty((len(records), self.n_features), dtype=np.float64)
+        for i, record in enumerate(records):
+            self.encode_into(record, out[i])
+        out -= self.mean
+        out /= self.scale
+        return out
+
+    def predict_many(self, X):
+        """Predict classes and depression probabilities for an encoded, scaled feature matrix"""
+        probabilities = (self.engine or self.model).predict_proba(X)
+        if self.threshold is None:
+            return self.classes.take(probabilities.argmax(axis=1)), probabilities[:, 1]
+        return self.classes.take((probabilities[:, 1] >= self.threshold).astype(np.intp)), probabilities[:, 1]
+
+    def predict_records(self, records):
+        return self.predict_many(self.encode(records))
+
+    def encode_one(self, record):
+        """Encode and scale one record into this thread's preallocated (1, n_features) row buffer"""
+        buffer = getattr(self._local, 'row', None)
+        if buffer is None:
+            buffer = self._local.row = np.empty((1, self.n_features), dtype=np.float64)
+        return self.encode([record], out=buffer)
+
+    def predict_one(self, record):
+        """Predict a single record using a per-thread preallocated row buffer"""
+        predictions, probabilities = self.predict_many(self.encode_one(record))
+        return predictions[0], probabilities[0]
+
+    def __getstate__(self):
+        # Thread-local buffers cannot be pickled; they are recreated on demand
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
@@ -0,0 +1,188 @@
+"""Side-by-side HTTP load test of the Flask and ASGI (uvicorn) APIs under gunicorn.
+
+Starts both servers on local ports, each with the same number of worker
+processes, and drives POST /api/predict over keep-alive connections from an
+asyncio client: every client sends its next request as soon as the last
+response arrives. Each scenario is also run with slow clients alongside,
+which send their request headers and then trickle the body out over a few
+seconds, as a client on a poor mobile link would. Alongside every run a
+probe requests /health every 50 ms; its latency shows whether saturated
+prediction routes still leave the health check responsive, and 503s show
+how much load admission control shed.
+
+Run from the backend directory::
+
+    python loadtest.py [--clients 1 16 64] [--slow 0 4] [--duration 5] [--workers 2]
+                       [--servers flask asgi] [--env PREDICT_MAX_QUEUED=8 ...]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import load_records
+
+SERVERS = {
+    'flask': ['gunicorn', '--config', 'gunicorn.conf.py', 'api:app'],
+    'asgi': ['gunicorn', '--config', 'gunicorn.conf.py', '-k', 'uvicorn.workers.UvicornWorker',
+             'asgi_api:app'],
+}
+
+
+def start_server(command, port, workers, extra_env=None, timeout=300):
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers), **(extra_env or {}))
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"{command[-1]} did not come up on port {port}")
+
+
+def _request(port, body):
+    return (f"POST /api/predict HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode('ascii'), body
+
+
+async def _read_response(reader):
+    """(HTTP status, whether the server keeps the connection open) of one response, after reading its body"""
+    status_line = await reader.readline()
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'connection' and value.strip().lower() == b'close':
+            keep_alive = False
+    await reader.readexactly(length)
+    return int(status_line.split()[1]), keep_alive
+
+
+async def _client(port, bodies, deadline, latencies, errors, offset):
+    k = offset
+    writer = None
+    try:
+        while time.monotonic() < deadline:
+            head, body = _request(port, bodies[k % len(bodies)])
+            start = time.perf_counter()
+            if writer is None:
+                # Sync gunicorn workers close the connection after every response
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(head + body)
+            status, keep_alive = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+            k += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def _slow_client(port, body, deadline, trickle_seconds):
+    """Send one request at a time, its body a byte per trickle_seconds / len(body) seconds"""
+    while time.monotonic() < deadline:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        head, body = _request(port, body)
+        writer.write(head)
+        for k in range(len(body)):
+            writer.write(body[k:k + 1])
+            await writer.drain()
+            await asyncio.sleep(trickle_seconds / len(body))
+        await _read_response(reader)
+        writer.close()
+
+
+async def _health_probe(port, deadline, latencies, interval=0.05):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f"GET /health HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nConnection: close\r\n\r\n".encode('ascii'))
+        await _read_response(reader)
+        latencies.append(time.perf_counter() - start)
+        writer.close()
+        await asyncio.sleep(interval)
+
+
+async def _run(port, bodies, n_clients, n_slow, duration, trickle_seconds):
+    deadline = time.monotonic() + duration
+    latencies, errors, health = [], [], []
+    slow = [asyncio.ensure_future(_slow_client(port, bodies[0], deadline, trickle_seconds)) for _ in range(n_slow)]
+    slow.append(asyncio.ensure_future(_health_probe(port, deadline, health)))
+    # Let the slow clients take their connections first
+    await asyncio.sleep(0.2 if n_slow else 0)
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(port, bodies, deadline, latencies, errors, k * 7) for k in range(n_clients)))
+    elapsed = time.perf_counter() - start
+    for task in slow:
+        task.cancel()
+    await asyncio.gather(*slow, return_exceptions=True)
+    return (len(latencies) - len(errors)) / elapsed, latencies, errors, health
+
+
+def load_test(port, bodies, n_clients, n_slow, duration, trickle_seconds=2.0):
+    """Of the fast clients: (successful requests per second, p50 seconds, p99 seconds, 503s, other errors),
+    and the p99 seconds of the /health probe"""
+    throughput, latencies, errors, health = asyncio.run(
+        _run(port, bodies, n_clients, n_slow, duration, trickle_seconds)
+    )
+    p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (float('nan'), float('nan'))
+    health_p99 = np.percentile(health, 99) if health else float('nan')
+    shed = errors.count(503)
+    return throughput, p50, p99, shed, len(errors) - shed, health_p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Flask and ASGI prediction APIs side by side")
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--slow', type=int, nargs='+', default=[0, 4], help="slow clients running alongside")
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument('--env', nargs='*', default=[], metavar='NAME=VALUE', help="server environment settings")
+    args = parser.parse_args()
+    extra_env = dict(setting.split('=', 1) for setting in args.env)
+
+    # Distinct records, so the prediction cache does not answer most requests
+    records = [{col: value for col, value in record.items() if not pd.isna(value)} for record in load_records(5000)]
+    bodies = [json.dumps(record).encode('utf-8') for record in records]
+    print(f"{args.workers} workers per server, {args.duration:.0f}s per run")
+    for k, name in enumerate(args.servers):
+        port = args.port + k
+        process = start_server(SERVERS[name], port, args.workers, extra_env)
+        try:
+            for n_slow in args.slow:
+                for n_clients in args.clients:
+                    throughput, p50, p99, shed, errors, health_p99 = load_test(
+                        port, bodies, n_clients, n_slow, args.duration
+                    )
+                    print(f"{name:5s} {n_clients:3d} clients + {n_slow} slow: {throughput:7,.0f} req/s   "
+                          f"p50 {p50*1e3:8.2f} ms   p99 {p99*1e3:8.2f} ms   503s {shed:6d}   errors {errors}   "
+                          f"/health p99 {health_p99*1e3:7.2f} ms")
+                    sys.stdout.flush()
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Coalescing concurrent single-record predictions into batched model calls.
+
+A tree ensemble scores 64 rows for little more than the cost of one, but
+each /api/predict request calls the model for its own row. With micro
+batching on, a request encodes its row and hands it to the batcher, which
+waits up to window seconds (or until max_batch rows are queued) after the
+first row arrives, scores all queued rows with one predict_many call and
+wakes each caller with its own result. A lone request pays at most the
+window in added latency; under concurrent load the model calls, and the
+time they hold the interpreter, shrink with the batch size.
+
+Rows are grouped by the plan that encoded them, so a model swap mid-batch
+never scores a row with a model whose encoders did not produce it.
+
+Callers block on predict() (threaded workers) or await predict_async()
+(an asyncio event loop). The batching thread is started on first use in
+each process, so it also runs in workers forked after the batcher was
+created.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_WINDOW = 0.002
+DEFAULT_MAX_BATCH = 64
+
+
+class _Pending:
+    """One queued row and, once scored, its result or error"""
+    __slots__ = ('plan', 'row', 'done', 'result', 'error')
+
+    def __init__(self, plan, row, done):
+        self.plan = plan
+        self.row = row
+        self.done = done
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Queues encoded rows for up to window seconds and scores them with one predict_many per plan"""
+
+    def __init__(self, window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread_pid = None
+        self.batches = 0
+        self.records = 0
+        self.largest_batch = 0
+
+    def _ensure_thread(self):
+        if self._thread_pid != os.getpid():
+            with self._lock:
+                if self._thread_pid != os.getpid():
+                    # Threads do not survive fork, so each worker starts its own
+                    self._thread_pid = os.getpid()
+                    threading.Thread(target=self._run, name='micro-batcher', daemon=True).start()
+
+    def predict(self, plan, row):
+        """(prediction, probability) of one encoded (1, n_features) row, scored in a shared batch"""
+        self._ensure_thread()
+        pending = _Pending(plan, row.copy(), threading.Event())
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def predict_async(self, plan, row):
+        """Awaitable predict() for coroutines, which waits for the batch without blocking the event loop"""
+        # Copied now: the row is often a reused encode buffer that changes
+        # before the coroutine first runs
+        return self._predict_async(plan, row.copy())
+
+    async def _predict_async(self, plan, row):
+        self._ensure_thread()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # The batching thread resolves the future on the loop's own thread
+        pending = _Pending(plan, row, _FutureSetter(loop, future))
+        self._queue.put(pending)
+        await future
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        """The next batch: the first queued row and whatever else arrives within the window"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            by_plan = {}
+            for pending in batch:
+                by_plan.setdefault(id(pending.plan), []).append(pending)
+            for group in by_plan.values():
+                try:
+                    predictions, probabilities = group[0].plan.predict_many(np.vstack([p.row for p in group]))
+                    for pending, prediction, probability in zip(group, predictions.tolist(), probabilities.tolist()):
+                        pending.result = (prediction, probability)
+                except Exception as e:
+                    for pending in group:
+                        pending.error = e
+                for pending in group:
+                    pending.done.set()
+            self.batches += 1
+            self.records += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self):
+        return {
+            'window_ms': self.window * 1e3,
+            'max_batch': self.max_batch,
+            'batches': self.batches,
+            'records': self.records,
+            'mean_batch_size': self.records / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+        }
+
+
+class _FutureSetter:
+    """Event-like wrapper that resolves an asyncio future from another thread"""
+    __slots__ = ('loop', 'future')
+
+    def __init__(self, loop, future):
+        self.loop = loop
+        self.future = future
+
+    def set(self):
+        self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -1,8 +1,8 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV
+from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder, StandardScaler
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, AdaBoostClassifier, ExtraTreesClassifier
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, AdaBoostClassifier, ExtraTreesClassifier, HistGradientBoostingClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.svm import SVC
 from sklearn.neighbors import KNeighborsClassifier
@@ -10,10 +10,19 @@ from sklearn.naive_bayes import GaussianNB
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.neural_network import MLPClassifier
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report, confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
 from sklearn.inspection import permutation_importance
+import os
 import warnings
+import analysis
+import artifacts
+import dataset_cache
+import schema
+import tournament
+import cv_engine
+import tuning
+from inference import InferencePlan
+from scoring import DEFAULT_RISK_THRESHOLDS, ScoringPlan
+from streaming import stream_preprocess
 warnings.filterwarnings('ignore')
 
 class DepressionPredictor:
@@ -24,12 +33,69 @@ class DepressionPredictor:
         self.label_encoders = {}
         self.scaler = StandardScaler()
         self.feature_names = []
+        self.fill_values = {}
+        self.inference_plan = None
+        # 'exact' (GradientBoostingClassifier) or 'hist' (HistGradientBoostingClassifier)
+        self.engine = 'exact'
+        # Tournament settings; with a time budget, candidates train in parallel
+        self.time_budget = None
+        self.max_workers = None
+        self.tournament_report = None
+        # How cross-validation fits are used (see cv_engine.py)
+        self.cv_strategy = 'oof'
+        self.tune_threshold = False
+        # Served decision threshold; None keeps the model's argmax
+        self.decision_threshold = None
+        # Search summary from tune_hyperparameters, if it ran
+        self.tuning_result = None
+        # Boosting stops adding stages once a held-out validation loss plateaus
+        self.early_stopping = False
+        # Rows per chunk when training streams its CSV (see streaming.py);
+        # None reads it in one piece
+        self.chunksize = None
+        # Compiled risk scoring (see scoring.py) for the data-driven weights
+        # and for the feature-importance fallback
+        self.scoring_plan = None
+        self.fallback_scoring_plan = None
+        
+    def load_and_preprocess_data(self, csv_filename=None, data_string=None, chunksize=None, output_dir=None,
+                                 use_cache=True, cache_dir=None):
+        """Load and preprocess the dataset from CSV file or data string
+        
+        With chunksize set, the CSV is streamed in chunks of that many rows and
+        the encoded matrices are memory-mapped under output_dir, so datasets
+        larger than RAM can be preprocessed.
+        
+        Otherwise a CSV is preprocessed once and the result cached under
+        cache_dir (see dataset_cache); later loads of the unchanged file
+        memory-map the cached matrices instead of parsing and encoding again.
+        """
+        # The hist engine splits categorical columns on their raw label codes
+        scale_categoricals = self.engine != 'hist'
+        cache_variant = '' if scale_categoricals else 'unscaled-categoricals'
+        
+        if csv_filename and chunksize:
+            X_scaled, y, df, self.label_encoders, self.scaler, self.fill_values = stream_preprocess(
+                csv_filename, chunksize=chunksize, output_dir=output_dir, scale_categoricals=scale_categoricals
+            )
+            self.feature_names = list(X_scaled.columns)
+            return X_scaled, y, df
+        
+        if csv_filename and use_cache:
+            cached = dataset_cache.load(csv_filename, cache_dir, variant=cache_variant)
+            if cached is not None:
+                X_scaled, y, df, state = cached
+                self.label_encoders = state['label_encoders']
+                self.scaler = state['scaler']
+                self.fill_values = state['fill_values']
+                self.feature_names = state['feature_names']
+                print(f"Loaded {len(df)} preprocessed records for {csv_filename} from the dataset cache")
+                return X_scaled, y, df
         
-    def load_and_preprocess_data(self, csv_filename=None, data_string=None):
-        """Load and preprocess the dataset from CSV file or data string"""
         if csv_filename:
             try:
-                df = pd.read_csv(csv_filename)
+                # One typed pass: schema columns only, with their declared dtypes
+                df = schema.in_schema_order(pd.read_csv(csv_filename, **schema.read_csv_kwargs()))
                 print(f"Successfully loaded {len(df)} records from {csv_filename}")
             except Exception as e:
                 print(f"Error loading CSV file: {e}")
@@ -41,17 +107,14 @@ class DepressionPredictor:
             lines = data_string.strip().split('\n')
             headers = lines[0].split()
             
-            # Clean up headers
-            self.feature_names = [h.replace('?', '').strip() for h in headers[1:]]  # Skip 'id'
-            
             # Parse data rows
             data_rows = []
             for line in lines[1:]:
                 row = line.split()
                 data_rows.append(row)
             
-            # Create DataFrame
-            df = pd.DataFrame(data_rows, columns=headers)
+            # Create DataFrame with schema column names and dtypes
+            df = schema.in_schema_order(schema.normalize_frame(pd.DataFrame(data_rows, columns=headers)))
         
         # Display basic info about the dataset
         print(f"Dataset shape: {df.shape}")
@@ -65,43 +128,30 @@ class DepressionPredictor:
         missing_values = df.isnull().sum()
         print(missing_values[missing_values > 0])
         
+        categorical_columns = [col for col in schema.CATEGORICAL_FEATURES if col in df.columns]
+        numeric_columns = [col for col in df.columns if col not in categorical_columns and col != 'id']
+        
         # Fill missing values appropriately
         for col in df.columns:
-            if df[col].dtype == 'object':
-                df[col] = df[col].fillna(df[col].mode()[0] if not df[col].mode().empty else 'Unknown')
+            if col in categorical_columns:
+                fill_value = df[col].mode()[0] if not df[col].mode().empty else 'Unknown'
             else:
-                df[col] = df[col].fillna(df[col].median())
+                fill_value = df[col].median()
+            df[col] = df[col].fillna(fill_value)
+            # Keep the raw fill value so inference can impute the same way
+            self.fill_values[col] = fill_value
         
         # Store feature names for later use
         self.feature_names = [col for col in df.columns if col not in ['id', 'Depression']]
         
-        # Convert columns to appropriate types with error handling
-        numeric_columns = []
-        categorical_columns = []
-        
-        for col in df.columns:
-            if col == 'id':
-                continue
-            
-            # Try to convert to numeric
-            try:
-                df[col] = pd.to_numeric(df[col], errors='ignore')
-                if df[col].dtype in ['int64', 'float64']:
-                    numeric_columns.append(col)
-                else:
-                    categorical_columns.append(col)
-            except:
-                categorical_columns.append(col)
-        
         print(f"Numeric columns: {numeric_columns}")
         print(f"Categorical columns: {categorical_columns}")
         
         # Encode categorical variables
         for col in categorical_columns:
-            if col in df.columns and col != 'Depression':
-                le = LabelEncoder()
-                df[col] = le.fit_transform(df[col].astype(str))
-                self.label_encoders[col] = le
+            le = LabelEncoder()
+            df[col] = le.fit_transform(df[col].astype(str))
+            self.label_encoders[col] = le
         
         # Prepare features and target
         if 'Depression' in df.columns:
@@ -113,12 +163,27 @@ class DepressionPredictor:
             raise ValueError("Depression column not found in dataset")
         
         # Scale numerical features
-        numerical_cols = X.select_dtypes(include=[np.number]).columns.tolist()
+        numerical_cols = [
+            col for col in X.select_dtypes(include=[np.number]).columns
+            if scale_categoricals or col not in categorical_columns
+        ]
         
         X_scaled = X.copy()
         if numerical_cols:
             X_scaled[numerical_cols] = self.scaler.fit_transform(X[numerical_cols])
         
+        if csv_filename and use_cache:
+            state = {
+                'label_encoders': self.label_encoders,
+                'scaler': self.scaler,
+                'fill_values': self.fill_values,
+                'feature_names': self.feature_names,
+            }
+            try:
+                dataset_cache.save(csv_filename, X_scaled, y, df, state, cache_dir, variant=cache_variant)
+            except OSError as e:
+                print(f"Could not cache preprocessed dataset: {e}")
+        
         return X_scaled, y, df
     
     def load_sample_data(self):
@@ -132,11 +197,81 @@ class DepressionPredictor:
         
         return self.load_and_preprocess_data(data_string=data_string)
     
-    def initialize_models(self):
-        """Initialize only Gradient Boosting model"""
-        self.models = {
-            'Gradient Boosting': GradientBoostingClassifier(random_state=42)
-        }
+    def initialize_models(self, roster='default', time_budget=None, max_workers=None, engine='exact',
+                          cv_strategy='oof', tune_threshold=False, early_stopping=False,
+                          validation_fraction=0.1, patience=10, max_stages=None):
+        """Initialize only Gradient Boosting model, or every candidate for roster='full'
+        
+        With a time_budget (seconds per candidate), train_and_evaluate_models
+        runs the candidates as a parallel tournament (see tournament.py).
+        
+        engine='hist' swaps in HistGradientBoostingClassifier, which bins the
+        features, trains on all cores and splits the categorical columns
+        natively; preprocessing then leaves their label codes unscaled.
+        
+        cv_strategy picks what the 5-fold cross-validation fits are for:
+        'oof' (default) fits them in parallel with the final model and keeps
+        their out-of-fold probabilities, so it still fits six models;
+        'ensemble' serves the fold models as the final model instead of
+        refitting, the only strategy that drops the sixth fit; 'refit' fits the same models
+        as 'oof' one after the other. tune_threshold serves the decision
+        threshold that maximizes out-of-fold F1 instead of 0.5.
+        
+        early_stopping makes the boosting models hold out validation_fraction
+        of their training rows and stop adding stages once the validation
+        loss has not improved for patience stages. n_estimators (max_iter
+        for hist), or max_stages if given, becomes the upper limit.
+        """
+        if engine not in ('exact', 'hist'):
+            raise ValueError(f"Unknown training engine '{engine}', expected 'exact' or 'hist'")
+        if cv_strategy not in cv_engine.CV_STRATEGIES:
+            raise ValueError(f"Unknown cv_strategy '{cv_strategy}', expected one of {cv_engine.CV_STRATEGIES}")
+        self.engine = engine
+        self.cv_strategy = cv_strategy
+        self.tune_threshold = tune_threshold
+        if roster == 'full':
+            self.models = tournament.full_roster()
+        else:
+            self.models = {
+                'Gradient Boosting': GradientBoostingClassifier(random_state=42)
+            }
+        if engine == 'hist':
+            # Same slot in the roster, histogram-based implementation
+            self.models.pop('Gradient Boosting')
+            # 8 leaves and 100 iterations, the capacity of the default
+            # GradientBoostingClassifier (depth-3 trees, 100 stages)
+            self.models['Hist Gradient Boosting'] = HistGradientBoostingClassifier(
+                categorical_features=[name in schema.CATEGORICAL_FEATURES for name in schema.FEATURE_NAMES],
+                max_leaf_nodes=8, early_stopping=False, random_state=42
+            )
+        self.early_stopping = early_stopping
+        if early_stopping:
+            for model in self.models.values():
+                if isinstance(model, GradientBoostingClassifier):
+                    model.set_params(n_iter_no_change=patience, validation_fraction=validation_fraction)
+                    if max_stages is not None:
+                        model.set_params(n_estimators=max_stages)
+                elif isinstance(model, HistGradientBoostingClassifier):
+                    model.set_params(early_stopping=True, scoring='loss', n_iter_no_change=patience,
+                                     validation_fraction=validation_fraction)
+                    if max_stages is not None:
+                        model.set_params(max_iter=max_stages)
+        self.time_budget = time_budget
+        self.max_workers = max_workers
+    
+    def model_config(self):
+        """Hyperparameters of the configured models, used to key the training cache"""
+        config = {name: model.get_params() for name, model in self.models.items()}
+        if self.time_budget is not None:
+            # The budget decides which candidates finish, so it is part of the key
+            config['tournament'] = {'time_budget': self.time_budget}
+        if self.cv_strategy == 'ensemble' or self.tune_threshold:
+            # Both change the served model; 'oof' and 'refit' serve the same one
+            config['cv'] = {'strategy': self.cv_strategy, 'tune_threshold': self.tune_threshold}
+        if self.chunksize:
+            # Streamed preprocessing estimates medians of large columns, so it can differ
+            config['preprocessing'] = {'chunksize': self.chunksize}
+        return config
     
     def train_and_evaluate_models(self, X, y):
         """Train and evaluate all models"""
@@ -146,13 +281,29 @@ class DepressionPredictor:
             X, y, test_size=0.2, random_state=42, stratify=y
         )
         
+        if self.time_budget is not None:
+            results, self.tournament_report = tournament.run_tournament(
+                self.models, X_train, y_train, X_test, y_test,
+                time_budget=self.time_budget, max_workers=self.max_workers
+            )
+            if not results:
+                raise RuntimeError("No model finished training within the tournament time budget")
+            return results, X_test, y_test
+        
         results = {}
         
         for name, model in self.models.items():
             print(f"Training {name}...")
             
-            # Train the model
-            model.fit(X_train, y_train)
+            # Fold models (plus the final model unless serving the fold
+            # ensemble) fitted once, in parallel except for 'refit'; the CV
+            # score is their out-of-fold accuracy
+            model, fold_models, oof_proba, fold_scores = cv_engine.fit_folds(
+                model, X_train, y_train, cv=5, refit=self.cv_strategy != 'ensemble',
+                n_jobs=1 if self.cv_strategy == 'refit' else self.max_workers
+            )
+            cv_score = fold_scores.mean()
+            oof = cv_engine.oof_results(y_train, oof_proba)
             
             # Make predictions
             y_pred = model.predict(X_test)
@@ -164,9 +315,6 @@ class DepressionPredictor:
             recall = recall_score(y_test, y_pred, average='weighted')
             f1 = f1_score(y_test, y_pred, average='weighted')
             
-            # Cross-validation score
-            cv_score = cross_val_score(model, X_train, y_train, cv=5, scoring='accuracy').mean()
-            
             results[name] = {
                 'model': model,
                 'accuracy': accuracy,
@@ -175,15 +323,73 @@ class DepressionPredictor:
                 'f1_score': f1,
                 'cv_score': cv_score,
                 'y_pred': y_pred,
-                'y_pred_proba': y_pred_proba
+                'y_pred_proba': y_pred_proba,
+                'stages': fitted_stages(model),
+                **oof
             }
         
         return results, X_test, y_test
     
-    def get_feature_importance(self, X):
+    def tune_hyperparameters(self, X, y, prefer='recommended', **search_options):
+        """Successive-halving search for the boosting model's size and learning rate (see tuning.py)
+        
+        Only the training split of train_and_evaluate_models is searched, so
+        the test split stays unseen. prefer='recommended' applies the fastest
+        configuration within the tournament's F1 tolerance of the best one;
+        prefer='best' applies the top-F1 configuration regardless of latency.
+        """
+        if prefer not in ('recommended', 'best'):
+            raise ValueError(f"Unknown prefer '{prefer}', expected 'recommended' or 'best'")
+        X_train, _, y_train, _ = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+        name, model = next(iter(self.models.items()))
+        print(f"Tuning {name}...")
+        rungs, reference = tuning.successive_halving(model, X_train, y_train, **search_options)
+        # The current configuration competes too, unless it reached the last rung anyway
+        candidates = rungs[-1] + [e for e in [reference] if all(e is not other for other in rungs[-1])]
+        frontier = tuning.pareto_frontier(candidates)
+        best, recommended = tuning.choose(candidates)
+        tuning.print_report(candidates, frontier, best, recommended, reference)
+        
+        chosen = recommended if prefer == 'recommended' else best
+        model.set_params(**chosen['params'])
+        summary = ['params', 'f1_score', 'single_row_us', 'batch_us_per_row', 'n_nodes']
+        self.tuning_result = {
+            'model': name,
+            'prefer': prefer,
+            'chosen': chosen['params'],
+            'best': {key: best[key] for key in summary},
+            'recommended': {key: recommended[key] for key in summary},
+            'frontier': [{key: e[key] for key in summary} for e in frontier],
+            'evaluations': sum(len(rung) for rung in rungs),
+        }
+        print(f"Using {tuning._format_params(chosen['params'])}")
+        return chosen['params']
+    
+    def early_stopping_report(self, model, X):
+        """Stages an early-stopped boosting model kept and the single-row latency that saved"""
+        stages = fitted_stages(model)
+        if stages is None:
+            return None
+        params = model.models[0].get_params() if isinstance(model, cv_engine.FoldEnsemble) else model.get_params()
+        max_stages = params.get('n_estimators', params.get('max_iter'))
+        report = {'max_stages': max_stages, 'stages': stages}
+        if isinstance(stages, list):
+            # Fold ensemble: one stage count per member, no single model to time
+            print(f"Early stopping kept {stages} of {max_stages} stages per fold model")
+            return report
+        fitted_us, full_us = tuning.stage_latency(model, max_stages, np.asarray(X, dtype=np.float64))
+        report.update({'single_row_us': fitted_us, 'estimated_full_us': full_us, 'saved_us': full_us - fitted_us})
+        print(f"Early stopping kept {stages} of {max_stages} stages: {fitted_us:.1f} us per prediction, "
+              f"saving {full_us - fitted_us:.1f} us against {full_us:.1f} us for all {max_stages}")
+        return report
+    
+    def get_feature_importance(self, X, y=None):
         """Calculate feature importance using the best model"""
         if hasattr(self.best_model, 'feature_importances_'):
             importance = self.best_model.feature_importances_
+        elif hasattr(self.best_model, 'coef_'):
+            # Features are standardized, so coefficient magnitudes are comparable
+            importance = np.abs(self.best_model.coef_[0])
         else:
             # Use permutation importance for models without built-in feature importance
             perm_importance = permutation_importance(self.best_model, X, y, n_repeats=10, random_state=42)
@@ -196,229 +402,236 @@ class DepressionPredictor:
         
         return feature_importance_df
     
+    def compile_inference_plan(self):
+        """Compile the fitted encoders, scaler and best model into an array-native inference plan"""
+        self.inference_plan = InferencePlan.from_predictor(self)
+        return self.inference_plan
+    
     def predict_depression(self, user_data):
         """Predict depression for a single user"""
-        # Convert user data to the same format as training data
-        user_df = pd.DataFrame([user_data])
-        
-        # Apply same preprocessing
-        categorical_cols = ['Gender', 'City', 'Profession', 'Sleep Duration', 
-                          'Dietary Habits', 'Degree', 'Have you ever had suicidal thoughts ?', 
-                          'Family History of Mental Illness']
-        
-        for col in categorical_cols:
-            if col in user_df.columns and col in self.label_encoders:
-                try:
-                    user_df[col] = self.label_encoders[col].transform(user_df[col].astype(str))
-                except ValueError:
-                    # Handle unseen categories
-                    user_df[col] = 0
-        
-        # Scale numerical features
-        numerical_cols = ['Age', 'Academic Pressure', 'Work Pressure', 'CGPA', 
-                         'Study Satisfaction', 'Job Satisfaction', 'Work/Study Hours', 
-                         'Financial Stress']
-        
-        user_df[numerical_cols] = self.scaler.transform(user_df[numerical_cols])
-        
-        # Make prediction
-        prediction = self.best_model.predict(user_df)[0]
-        prediction_proba = self.best_model.predict_proba(user_df)[0][1] if hasattr(self.best_model, 'predict_proba') else prediction
-        
+        plan = self.inference_plan or self.compile_inference_plan()
+        prediction, prediction_proba = plan.predict_one(user_data)
         return prediction, prediction_proba
     
+    def predict_batch(self, records):
+        """Predict depression for many users with one vectorized encode, scale and predict_proba pass"""
+        plan = self.inference_plan or self.compile_inference_plan()
+        return plan.predict_records(list(records))
+    
+    def warm_up(self, rounds=3):
+        """Run a few throwaway predictions so the first real request is not the slow one"""
+        typical_user = {col: self.fill_values.get(col) for col in self.feature_names}
+        for _ in range(rounds):
+            self.predict_depression(typical_user)
+    
     def calculate_data_driven_weights(self, df):
-        """Calculate weights based on actual data correlation and statistical significance"""
-        weights = {}
-        risk_thresholds = {}
-        
-        # For each feature, calculate its correlation with depression
-        feature_stats = {}
+        """Calculate weights based on actual data correlation and statistical significance
         
-        for column in df.columns:
-            if column in ['id', 'Depression']:
-                continue
-                
-            # Calculate correlation with depression
-            correlation = df[column].corr(df['Depression'])
-            
-            # Calculate odds ratio for categorical variables
-            if df[column].dtype == 'object' or df[column].nunique() <= 10:
-                # For categorical/discrete variables
-                crosstab = pd.crosstab(df[column], df['Depression'])
-                if crosstab.shape == (2, 2):  # 2x2 contingency table
-                    # Calculate odds ratio
-                    odds_ratio = (crosstab.iloc[0,0] * crosstab.iloc[1,1]) / (crosstab.iloc[0,1] * crosstab.iloc[1,0] + 1e-8)
-                else:
-                    odds_ratio = 1.0
-            else:
-                odds_ratio = 1.0
-            
-            # Calculate depression rate by feature value
-            depression_rates = df.groupby(column)['Depression'].mean()
-            max_depression_rate = depression_rates.max()
-            min_depression_rate = depression_rates.min()
-            rate_difference = max_depression_rate - min_depression_rate
-            
-            # Determine high-risk categories/values
-            high_risk_threshold = depression_rates.mean() + depression_rates.std()
-            high_risk_values = depression_rates[depression_rates > high_risk_threshold].index.tolist()
-            
-            feature_stats[column] = {
-                'correlation': abs(correlation) if not pd.isna(correlation) else 0,
-                'odds_ratio': abs(np.log(odds_ratio)) if odds_ratio > 0 else 0,
-                'rate_difference': rate_difference,
-                'high_risk_values': high_risk_values,
-                'depression_rates': depression_rates
-            }
-        
-        # Calculate composite weights
-        correlations = [stats['correlation'] for stats in feature_stats.values()]
-        max_correlation = max(correlations) if correlations else 1
-        
-        for feature, stats in feature_stats.items():
-            # Normalize correlation to 0-2 scale
-            normalized_correlation = (stats['correlation'] / max_correlation) * 2
-            
-            # Combine multiple factors for weight
-            weight = normalized_correlation * (1 + stats['rate_difference']) * (1 + stats['odds_ratio']/10)
-            
-            weights[feature] = max(0.1, min(3.0, weight))  # Cap between 0.1 and 3.0
-            risk_thresholds[feature] = stats['high_risk_values']
-        
-        return weights, risk_thresholds, feature_stats
+        Every feature is scanned once in a batched pass (see analysis.py).
+        """
+        return analysis.data_driven_weights(df)
 
     def generate_detailed_score(self, user_data, weights=None, risk_thresholds=None):
-        """Generate detailed scoring based on data-driven feature importance"""
-        scores = {}
-        total_risk_score = 0
+        """Generate detailed scoring based on data-driven feature importance
+        
+        Scores with a compiled ScoringPlan (see scoring.py): the one built
+        at training time for the data-driven weights, which the API scores
+        with too, or the fallback built once from the feature importance
+        when there is none.
+        """
+        return self.scoring_plan_for(weights, risk_thresholds, user_data).score_one(user_data)
+
+    def score_batch(self, records, weights=None, risk_thresholds=None):
+        """(per-factor risk scores, 0-100 risk scores) of many records, vectorized
         
-        # Use provided weights or fall back to feature importance
+        Same plan and scores as generate_detailed_score, one row per record.
+        """
+        return self.scoring_plan_for(weights, risk_thresholds).score_records(records)
+    
+    def scoring_plan_for(self, weights=None, risk_thresholds=None, user_data=None):
+        """The compiled scoring plan for these weights and thresholds, compiling it only if they changed"""
         if weights is None or risk_thresholds is None:
-            # Fallback to feature importance weights
-            if self.feature_importance is not None:
-                weights = dict(zip(self.feature_importance['feature'], 
-                                 self.feature_importance['importance'] * 2))  # Scale up
-                risk_thresholds = {
-                    'Academic Pressure': [4, 5],
-                    'Work Pressure': [4, 5], 
-                    'Financial Stress': [4, 5],
-                    'Sleep Duration': ['Less than 5 hours'],
-                    'Study Satisfaction': [1, 2],
-                    'Job Satisfaction': [1, 2],
-                    'Have you ever had suicidal thoughts ?': ['Yes', 1],
-                    'Family History of Mental Illness': ['Yes', 1],
-                    'Dietary Habits': ['Unhealthy'],
-                    'Work/Study Hours': [10, 11, 12]
-                }
-            else:
-                # Emergency fallback
-                weights = {col: 1.0 for col in user_data.keys()}
-                risk_thresholds = {col: [] for col in user_data.keys()}
-        
-        for factor in user_data.keys():
-            if factor in weights:
-                value = user_data[factor]
-                high_risk_values = risk_thresholds.get(factor, [])
-                is_high_risk = value in high_risk_values
-                weight = weights[factor]
-                risk_score = weight * (1.0 if is_high_risk else 0.2)
-                
-                scores[factor] = {
-                    'value': value,
-                    'risk_score': risk_score,
-                    'weight': weight,
-                    'is_high_risk': is_high_risk,
-                    'high_risk_threshold': high_risk_values
-                }
-                total_risk_score += risk_score
-        
-        # Normalize to 0-100 scale
-        max_possible_score = sum(weights.values())
-        normalized_score = min(100, (total_risk_score / max_possible_score) * 100)
-        
-        return scores, normalized_score
+            if self.scoring_plan is not None:
+                return self.scoring_plan
+            return self.importance_scoring_plan(user_data)
+        if self.scoring_plan is None or not self.scoring_plan.compiled_from(weights, risk_thresholds):
+            self.scoring_plan = ScoringPlan.from_label_encoders(weights, risk_thresholds, self.label_encoders)
+        return self.scoring_plan
+
+    def importance_scoring_plan(self, user_data=None):
+        """Scoring plan from the feature importance and the default high-risk answers"""
+        if self.feature_importance is None:
+            # Emergency fallback: every answered field weighs the same and none is high risk
+            return ScoringPlan({col: 1.0 for col in schema.canonical_record(user_data or {})}, {})
+        if self.fallback_scoring_plan is None:
+            # Fallback to feature importance weights, scaled up
+            importance_weights = dict(zip(self.feature_importance['feature'], self.feature_importance['importance'] * 2))
+            self.fallback_scoring_plan = ScoringPlan.from_label_encoders(
+                importance_weights, DEFAULT_RISK_THRESHOLDS, self.label_encoders
+            )
+        return self.fallback_scoring_plan
 
     def analyze_feature_impact(self, df):
-        """Comprehensive analysis of how each feature impacts depression"""
-        analysis = {}
-        
-        print("\n" + "="*80)
-        print("DATA-DRIVEN FEATURE IMPACT ANALYSIS")
-        print("="*80)
-        
-        for column in df.columns:
-            if column in ['id', 'Depression']:
-                continue
-                
-            print(f"\n📊 {column.upper()}")
-            print("-" * 50)
-            
-            # Basic statistics
-            correlation = df[column].corr(df['Depression'])
-            print(f"Correlation with Depression: {correlation:.4f}")
-            
-            # Depression rates by category/value
-            depression_by_value = df.groupby(column).agg({
-                'Depression': ['count', 'sum', 'mean']
-            }).round(4)
-            depression_by_value.columns = ['Total_Count', 'Depressed_Count', 'Depression_Rate']
-            
-            print("Depression rates by value:")
-            print(depression_by_value)
-            
-            # Chi-square test for independence (if categorical)
-            from scipy.stats import chi2_contingency
-            try:
-                contingency_table = pd.crosstab(df[column], df['Depression'])
-                chi2, p_value, dof, expected = chi2_contingency(contingency_table)
-                print(f"Chi-square test p-value: {p_value:.6f}")
-                significance = "SIGNIFICANT" if p_value < 0.05 else "NOT SIGNIFICANT"
-                print(f"Statistical significance: {significance}")
-            except:
-                print("Chi-square test: Not applicable")
-            
-            analysis[column] = {
-                'correlation': correlation,
-                'depression_rates': depression_by_value,
-                'p_value': p_value if 'p_value' in locals() else None
-            }
-        
-        return analysis
+        """Comprehensive analysis of how each feature impacts depression
+        
+        Correlations, per-value depression rates and chi-square tests for
+        every feature from one batched pass, as JSON-ready data with the
+        categorical answers decoded (see analysis.feature_impact).
+        """
+        labels = {col: [str(label) for label in encoder.classes_] for col, encoder in self.label_encoders.items()}
+        return analysis.feature_impact(df, labels=labels)
 
-# Example usage
-def main():
-    csv_filename = "Student Depression Dataset.csv"
-    predictor = DepressionPredictor()
+def fitted_stages(model):
+    """Boosting stages a fitted model kept (a list for a fold ensemble), or None for other models"""
+    if isinstance(model, cv_engine.FoldEnsemble):
+        stages = [fitted_stages(member) for member in model.models]
+        return None if None in stages else stages
+    if isinstance(model, GradientBoostingClassifier):
+        return int(model.n_estimators_)
+    if isinstance(model, HistGradientBoostingClassifier):
+        return int(model.n_iter_)
+    return None
+
+def build_training_bundle(predictor, csv_filename=None):
+    """Run every training step and collect the results into one bundle"""
     print("Loading and preprocessing data from CSV file...")
     try:
-        X, y, df = predictor.load_and_preprocess_data(csv_filename=csv_filename)
+        X, y, df = predictor.load_and_preprocess_data(csv_filename=csv_filename, chunksize=predictor.chunksize)
     except Exception as e:
         print(f"Error loading CSV: {e}")
         print("Using sample data for demonstration...")
         X, y, df = predictor.load_sample_data()
 
-    print(f"\n📊 Dataset loaded successfully!")
-    print(f"Total records: {len(df)}")
-    print(f"Features: {len(X.columns)}")
-    print(f"Depression cases: {sum(y)} ({sum(y)/len(y)*100:.1f}%)")
-    print(f"Non-depression cases: {len(y)-sum(y)} ({(len(y)-sum(y))/len(y)*100:.1f}%)")
-
-    # Initialize only Gradient Boosting
-    predictor.initialize_models()
-
     # Train only Gradient Boosting
     print("\nTraining Gradient Boosting model...")
     results, X_test, y_test = predictor.train_and_evaluate_models(X, y)
-    predictor.best_model = results['Gradient Boosting']['model']
+    best_model_name = tournament.select_best(results)
+    predictor.best_model = results[best_model_name]['model']
+    if predictor.tournament_report:
+        tournament.print_report(predictor.tournament_report, best_model_name)
+    
+    best = results[best_model_name]
+    cv_summary = {'strategy': predictor.cv_strategy}
+    if 'oof_proba' in best:
+        cv_summary.update({key: float(best[key]) for key in
+                           ['oof_accuracy', 'oof_f1_score', 'oof_roc_auc', 'threshold', 'oof_tuned_f1_score']})
+        print(f"Out-of-fold F1 {best['oof_f1_score']:.4f} at 0.5, {best['oof_tuned_f1_score']:.4f} "
+              f"at threshold {best['threshold']:.2f} (ROC AUC {best['oof_roc_auc']:.4f})")
+        if predictor.tune_threshold:
+            predictor.decision_threshold = best['threshold']
+
+    early_stopping = predictor.early_stopping_report(best['model'], X_test) if predictor.early_stopping else None
 
     # Analyze feature impact with actual data
     print("Analyzing feature impact...")
     feature_analysis = predictor.analyze_feature_impact(df)
-    
+
     # Calculate data-driven weights
     print("Calculating data-driven weights...")
     weights, risk_thresholds, feature_stats = predictor.calculate_data_driven_weights(df)
+
+    predictor.feature_importance = predictor.get_feature_importance(X_test, y_test)
+    predictor.compile_inference_plan()
+    # Compile both scoring plans now, so they are saved with the bundle
+    predictor.fallback_scoring_plan = None
+    predictor.importance_scoring_plan()
+    predictor.scoring_plan_for(weights, risk_thresholds)
+
+    metrics = {
+        name: {metric: float(result[metric]) for metric in ['accuracy', 'precision', 'recall', 'f1_score', 'cv_score']}
+        for name, result in results.items()
+    }
+
+    return {
+        'predictor': predictor,
+        'best_model_name': best_model_name,
+        'metrics': metrics,
+        'weights': weights,
+        'risk_thresholds': risk_thresholds,
+        'feature_stats': feature_stats,
+        'feature_importance': predictor.feature_importance,
+        'feature_analysis': feature_analysis,
+        'n_records': len(df),
+        'n_depressed': int(y.sum()),
+        'n_features': X.shape[1],
+        'tournament': predictor.tournament_report,
+        'cv': cv_summary,
+        'oof_proba': best.get('oof_proba'),
+        'tuning': predictor.tuning_result,
+        'early_stopping': early_stopping,
+    }
+
+def load_or_train_bundle(csv_filename, artifact_dir=None, roster='default', time_budget=None, engine='exact',
+                         cv_strategy='oof', tune_threshold=False, tune=False, early_stopping=False, chunksize=None):
+    """Load the training bundle for this dataset and config, training only if it is not cached
+    
+    With tune=True the hyperparameter search runs first and the tuned
+    parameters become part of the cache key; the search's own evaluation
+    cache makes repeated runs cheap. With chunksize set, the CSV is
+    streamed in chunks of that many rows into memory-mapped matrices
+    instead of being read whole.
+    """
+    predictor = DepressionPredictor()
+    predictor.initialize_models(roster=roster, time_budget=time_budget, engine=engine,
+                                cv_strategy=cv_strategy, tune_threshold=tune_threshold,
+                                early_stopping=early_stopping)
+    predictor.chunksize = chunksize
+    if tune and os.path.exists(csv_filename):
+        X, y, _ = predictor.load_and_preprocess_data(csv_filename=csv_filename, chunksize=chunksize)
+        predictor.tune_hyperparameters(X, y)
+    if not os.path.exists(csv_filename):
+        print(f"{csv_filename} not found, training on sample data without caching")
+        bundle = build_training_bundle(predictor)
+        bundle.update({'version': 'uncached', 'trained_at': pd.Timestamp.now(tz='UTC').isoformat()})
+        return bundle
+    return artifacts.load_or_build_bundle(
+        csv_filename, predictor.model_config(),
+        lambda: build_training_bundle(predictor, csv_filename),
+        artifact_dir=artifact_dir
+    )
+
+def bundle_options_from_env(environ=None):
+    """load_or_train_bundle options from the environment, as the API and the retrain job read them"""
+    environ = os.environ if environ is None else environ
+    return {
+        # MODEL_ROSTER=full trains every candidate model as a parallel tournament,
+        # each limited to MODEL_TIME_BUDGET seconds (see tournament.py)
+        'roster': environ.get('MODEL_ROSTER', 'default'),
+        'time_budget': float(environ['MODEL_TIME_BUDGET']) if environ.get('MODEL_TIME_BUDGET') else None,
+        # MODEL_ENGINE=hist trains HistGradientBoosting with native categorical splits
+        'engine': environ.get('MODEL_ENGINE', 'exact'),
+        # MODEL_TUNE=1 runs the successive-halving hyperparameter search before training
+        'tune': environ.get('MODEL_TUNE', '') not in ('', '0'),
+        # MODEL_EARLY_STOPPING=1 stops adding boosting stages once validation loss plateaus
+        'early_stopping': environ.get('MODEL_EARLY_STOPPING', '') not in ('', '0'),
+        # MODEL_CV_STRATEGY=oof|ensemble|refit picks what the cross-validation fits are for
+        # (see DepressionPredictor.initialize_models)
+        'cv_strategy': environ.get('MODEL_CV_STRATEGY', 'oof'),
+        # MODEL_TUNE_THRESHOLD=1 serves the decision threshold with the best out-of-fold F1
+        'tune_threshold': environ.get('MODEL_TUNE_THRESHOLD', '') not in ('', '0'),
+        # MODEL_CHUNKSIZE=N streams the training CSV in chunks of N rows, for
+        # datasets larger than memory (see streaming.py)
+        'chunksize': int(environ['MODEL_CHUNKSIZE']) if environ.get('MODEL_CHUNKSIZE') else None,
+    }
+
+# Example usage
+def main():
+    csv_filename = "Student Depression Dataset.csv"
+    bundle = load_or_train_bundle(csv_filename)
+    predictor = bundle['predictor']
+    results = bundle['metrics']
+    weights = bundle['weights']
+    risk_thresholds = bundle['risk_thresholds']
+    feature_stats = bundle['feature_stats']
+    feature_analysis = bundle['feature_analysis']
+    analysis.print_feature_impact(feature_analysis)
+
+    n_records, n_depressed = bundle['n_records'], bundle['n_depressed']
+    print(f"\n📊 Model bundle {bundle['version']} (trained {bundle['trained_at']})")
+    print(f"Total records: {n_records}")
+    print(f"Features: {bundle['n_features']}")
+    print(f"Depression cases: {n_depressed} ({n_depressed/n_records*100:.1f}%)")
+    print(f"Non-depression cases: {n_records-n_depressed} ({(n_records-n_depressed)/n_records*100:.1f}%)")
     
     print("\n" + "="*60)
     print("DATA-DRIVEN WEIGHTS (Based on Actual Data)")
@@ -433,9 +646,7 @@ def main():
     
     print(weight_df)
     
-    # Find best model
-    best_model_name = max(results.keys(), key=lambda k: results[k]['f1_score'])
-    predictor.best_model = results[best_model_name]['model']
+    best_model_name = bundle['best_model_name']
     
     print("\n" + "="*60)
     print("MODEL COMPARISON RESULTS")
@@ -461,8 +672,7 @@ def main():
     print("FEATURE IMPORTANCE (Top Contributing Factors)")
     print("="*60)
     
-    feature_importance = predictor.get_feature_importance(X)
-    predictor.feature_importance = feature_importance  # Store for later use
+    feature_importance = bundle['feature_importance']
     print(feature_importance.head(10))
     
     # Example prediction with data-driven weights (using more realistic example)
@@ -476,18 +686,18 @@ def main():
         'Age': 22,
         'City': 'Delhi', 
         'Profession': 'Student',
-        'Academic_Pressure': 4,  # High pressure
-        'Work_Pressure': 1,      # Low work pressure (student)
+        'Academic Pressure': 4,  # High pressure
+        'Work Pressure': 1,      # Low work pressure (student)
         'CGPA': 6.2,            # Average CGPA
-        'Study_Satisfaction': 2, # Low satisfaction
-        'Job_Satisfaction': 0,   # N/A for student
-        'Sleep_Duration': 'Less than 5 hours',  # Poor sleep
-        'Dietary_Habits': 'Moderate',
+        'Study Satisfaction': 2, # Low satisfaction
+        'Job Satisfaction': 0,  # N/A for student
+        'Sleep Duration': 'Less than 5 hours',  # Poor sleep
+        'Dietary Habits': 'Moderate',
         'Degree': 'BSc',
-        'Have_you_ever_had_suicidal_thoughts': 'Yes',  # High risk factor
-        'Work_Study_Hours': 8,   # Normal study hours
-        'Financial_Stress': 4,   # High financial stress
-        'Family_History_of_Mental_Illness': 'No'
+        'Have you ever had suicidal thoughts ?': 'Yes',  # High risk factor
+        'Work/Study Hours': 8,  # Normal study hours
+        'Financial Stress': 4,  # High financial stress
+        'Family History of Mental Illness': 'No'
     }
     
     prediction, probability = predictor.predict_depression(example_user)
@@ -0,0 +1,245 @@
+"""Cache of single-record predictions by model version and encoded feature vector.
+
+Questionnaire answers come from small option sets, so many requests encode
+to the same feature vector. The encoded (imputed, scaled) row is the cache
+key, so different spellings of the same answers (aliases, frontend labels,
+"4" and 4) share an entry, and the model version is part of the key, so a
+new model never serves an old model's predictions.
+
+PredictionCache lives in one process: an LRU of at most max_entries entries,
+each expiring ttl seconds after it was stored, and emptied as soon as a new
+model version is asked for. SharedPredictionCache keeps its entries in an
+anonymous shared mapping created before the API workers fork, so every
+worker sees every worker's entries. A key hash picks a pair of slots; a new
+entry goes into the free, expired or older one of the pair (no full LRU order
+across processes).
+Workers write slots without a lock, so each slot carries a checksum of its
+contents and a reader ignores a slot that is half-written or mixed from two
+writers.
+
+Both count hits, misses, evictions and expirations per process and the
+time hits saved: the mean time a miss spent predicting, per hit.
+"""
+import hashlib
+import mmap
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_TTL = 300.0
+
+
+class PredictionCache:
+    """In-process LRU cache of (prediction, probability) with a TTL, invalidated on model change"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        # {key: (expires at, value)}, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        self.miss_seconds = 0.0
+
+    def get(self, version, key):
+        """The cached value for key under model version, or None"""
+        now = time.monotonic()
+        with self._lock:
+            if version != self.version:
+                # A new model: nothing cached so far can be served
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.version = version
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, version, key, value, compute_seconds=0.0):
+        """Store value, computed in compute_seconds, for key under model version"""
+        with self._lock:
+            self.miss_seconds += compute_seconds
+            if version != self.version:
+                # The model changed while this value was computed
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        mean_miss_seconds = self.miss_seconds / self.misses if self.misses else 0.0
+        return {
+            'kind': 'local',
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'model_version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'mean_miss_us': mean_miss_seconds * 1e6,
+            'saved_seconds': self.hits * mean_miss_seconds,
+        }
+
+
+# digest, expires at, prediction, probability, checksum of the fields before it
+SLOT = struct.Struct('<16sdqd8s')
+CHECKED_BYTES = SLOT.size - 8
+
+
+class SharedPredictionCache:
+    """PredictionCache over slots in an anonymous shared mapping, inherited by forked workers"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        # Slots come in pairs; an entry may live in either slot of its pair
+        self.max_entries = max_entries + max_entries % 2
+        self.ttl = ttl
+        # MAP_SHARED | MAP_ANONYMOUS: children forked after this see the same pages
+        self._mapping = mmap.mmap(-1, self.max_entries * SLOT.size)
+        self._lock = threading.Lock()
+        self.version = None
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self.miss_seconds = 0.0
+
+    def _locate(self, version, key):
+        """(offsets of the two slots the entry may occupy, its digest)"""
+        digest = hashlib.blake2b(str(version).encode('utf-8') + b'\0' + key, digest_size=16).digest()
+        pair = int.from_bytes(digest[:8], 'little') % (self.max_entries // 2) * 2
+        return (pair * SLOT.size, (pair + 1) * SLOT.size), digest
+
+    def _read(self, offset):
+        """The slot's (digest, expires, prediction, probability), or None if it is torn or empty"""
+        # One copy of the slot, checked against its own checksum
+        raw = self._mapping[offset:offset + SLOT.size]
+        digest, expires, prediction, probability, checksum = SLOT.unpack(raw)
+        if checksum != hashlib.blake2b(raw[:CHECKED_BYTES], digest_size=8).digest():
+            return None
+        return digest, expires, prediction, probability
+
+    def get(self, version, key):
+        offsets, digest = self._locate(version, key)
+        now = time.monotonic()
+        result, expired = None, False
+        for offset in offsets:
+            entry = self._read(offset)
+            if entry is not None and entry[0] == digest:
+                if entry[1] >= now:
+                    result = (entry[2], entry[3])
+                else:
+                    expired = True
+                break
+        with self._lock:
+            self.version = version
+            if result is not None:
+                self.hits += 1
+            else:
+                self.expirations += expired
+                self.misses += 1
+        return result
+
+    def put(self, version, key, value, compute_seconds=0.0):
+        offsets, digest = self._locate(version, key)
+        now = time.monotonic()
+        # The slot holding this key, else an empty or expired one, else the
+        # one written longer ago
+        entries = [self._read(offset) for offset in offsets]
+        ranks = [
+            (0 if entry is not None and entry[0] == digest else 1 if entry is None or entry[1] < now else 2,
+             entry[1] if entry is not None else 0.0)
+            for entry in entries
+        ]
+        slot = min(range(2), key=lambda k: ranks[k])
+        prediction, probability = value
+        raw = bytearray(SLOT.pack(digest, now + self.ttl, prediction, probability, bytes(8)))
+        raw[CHECKED_BYTES:] = hashlib.blake2b(bytes(raw[:CHECKED_BYTES]), digest_size=8).digest()
+        with self._lock:
+            self.miss_seconds += compute_seconds
+            self.evictions += ranks[slot][0] == 2
+        self._mapping[offsets[slot]:offsets[slot] + SLOT.size] = raw
+
+    def __len__(self):
+        now = time.monotonic()
+        entries = (self._read(offset) for offset in range(0, len(self._mapping), SLOT.size))
+        return sum(1 for entry in entries if entry is not None and entry[1] >= now)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        mean_miss_seconds = self.miss_seconds / self.misses if self.misses else 0.0
+        return {
+            'kind': 'shared',
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'model_version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'mean_miss_us': mean_miss_seconds * 1e6,
+            'saved_seconds': self.hits * mean_miss_seconds,
+        }
+
+
+def predict_cached(cache, plan, version, record, predict_row=None):
+    """(prediction, probability) of one record by an InferencePlan of model version, through cache
+
+    predict_row(plan, row) scores a miss's encoded row; by default the plan itself does.
+    """
+    row = plan.encode_one(record)
+    key = row.tobytes()
+    cached = cache.get(version, key)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    if predict_row is not None:
+        result = predict_row(plan, row)
+    else:
+        predictions, probabilities = plan.predict_many(row)
+        result = (int(predictions[0]), float(probabilities[0]))
+    cache.put(version, key, result, time.perf_counter() - start)
+    return result
+
+
+async def predict_cached_async(cache, plan, version, record, predict_row_async):
+    """predict_cached for a coroutine, awaiting predict_row_async(plan, row) on a miss"""
+    row = plan.encode_one(record)
+    key = row.tobytes()
+    cached = cache.get(version, key)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    result = await predict_row_async(plan, row)
+    cache.put(version, key, result, time.perf_counter() - start)
+    return result
+
+
+def make_cache(kind, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+    """'local', 'shared' or 'off' (None)"""
+    if kind in ('', 'off', '0', 'none'):
+        return None
+    if kind == 'shared':
+        return SharedPredictionCache(max_entries, ttl)
+    if kind == 'local':
+        return PredictionCache(max_entries, ttl)
+    raise ValueError(f"Unknown prediction cache {kind!r}, expected local, shared or off")
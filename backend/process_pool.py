@@ -0,0 +1,370 @@
+"""Process pool for the API's CPU-heavy jobs: large batch chunks and feature impact analysis.
+
+Scoring a batch chunk or analyzing an uploaded CSV is pure Python for most
+of its time, so in an API worker it holds the GIL and every other request on
+that worker (other threads, or the ASGI event loop) waits for it. A
+ScoringPool hands such jobs to a few persistent worker processes instead.
+
+Each pool process loads the model once, when it starts: it maps the flat
+model file (and, like the API workers, picks up a newly published model
+without a restart) or unpickles the in-memory plan, and keeps the scoring
+plan it was given. A batch chunk is only scored there by the model version
+its request started with; see ScoringPool.score_lines. Jobs do not pickle their data: the caller copies the
+request bytes (NDJSON lines, the element texts of a JSON array, or CSV)
+into a shared-memory buffer and passes
+its name; the pool process writes the response bytes into a shared-memory
+buffer of its own and returns that name and length, which the caller copies
+out of and unlinks. Only those few small arguments cross the pipe.
+
+Pool processes are spawned (never forked from a threaded API worker) on
+the first job in each API worker, or by start(). If one dies, its jobs run
+in the calling thread and a new pool is started for the next job.
+"""
+import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+import schema
+
+# Smaller batch chunks are scored in the calling thread; handing them over
+# costs more than it saves
+DEFAULT_MIN_RECORDS = 256
+
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def split_json_array(text):
+    """The source text of every element of a JSON array, as UTF-8 bytes
+
+    Each element is parsed once, to find where it ends, and its text is
+    passed on as is: scoring parses it again, in the pool, rather than the
+    request thread encoding parsed records back to JSON. Line breaks in a
+    pretty-printed element become spaces, so every element is one NDJSON
+    line; JSON strings cannot hold raw line breaks, so only whitespace
+    between tokens changes. Raises ValueError unless text is a single JSON
+    array.
+    """
+    pos = _WHITESPACE.match(text).end()
+    if text[pos:pos + 1] != '[':
+        raise ValueError("Expected a JSON array")
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    elements = []
+    if text[pos:pos + 1] != ']':
+        while True:
+            _, end = _DECODER.raw_decode(text, pos)
+            elements.append(text[pos:end].replace('\n', ' ').replace('\r', ' ').encode('utf-8'))
+            pos = _WHITESPACE.match(text, end).end()
+            separator = text[pos:pos + 1]
+            if separator not in (',', ']'):
+                raise ValueError(f"Expected ',' or ']' at character {pos}")
+            pos = _WHITESPACE.match(text, pos + 1).end()
+            if separator == ']':
+                break
+    else:
+        pos = _WHITESPACE.match(text, pos + 1).end()
+    if pos != len(text):
+        raise ValueError(f"Extra data after the JSON array at character {pos}")
+    return elements
+
+
+def parse_line(line):
+    """(record, error) of one NDJSON line"""
+    try:
+        return json.loads(line), None
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+
+
+def score_chunk(plan, scoring_plan, chunk):
+    """NDJSON results of a chunk of (index, record, parse error) entries"""
+    valid, errors = [], {}
+    for index, record, error in chunk:
+        if error is None:
+            record_errors, warnings = schema.validate_record(record)
+            if record_errors:
+                error = "; ".join(record_errors)
+            else:
+                valid.append((index, record, warnings))
+        if error is not None:
+            errors[index] = error
+
+    results = {}
+    if valid:
+        valid_records = [record for _, record, _ in valid]
+        predictions, probabilities = plan.predict_records(valid_records)
+        factors = scoring_plan.encode(valid_records)
+        factor_scores, risk_scores = scoring_plan.score_matrix(factors)
+        for k, ((index, record, warnings), prediction, probability) in enumerate(zip(valid, predictions, probabilities)):
+            results[index] = {
+                "index": index,
+                "risk_score": float(risk_scores[k]),
+                "prediction": int(prediction),
+                "probability": float(probability),
+                "risk_breakdown": scoring_plan.breakdown(factors[k], factor_scores[k]),
+                "status": "success"
+            }
+            if warnings:
+                results[index]["warnings"] = warnings
+
+    lines = []
+    for index, record, error in chunk:
+        result = results.get(index) or {"index": index, "error": errors[index], "status": "error"}
+        lines.append(json.dumps(result))
+    return "\n".join(lines) + "\n"
+
+
+def score_ndjson(plan, scoring_plan, payload, start):
+    """score_chunk of the newline-separated JSON records in payload, indexed from start"""
+    lines = payload.split(b'\n')
+    return score_chunk(plan, scoring_plan, [(start + k, *parse_line(line)) for k, line in enumerate(lines)])
+
+
+def feature_impact_csv(payload):
+    """JSON feature impact analysis of a labeled survey CSV (see stats_store.StatsStore.feature_impact)"""
+    from stats_store import StatsStore
+
+    store = StatsStore()
+    store.update(pd.read_csv(io.BytesIO(payload), **schema.read_csv_kwargs()))
+    return json.dumps({"rows": store.n_rows, "features": store.feature_impact()})
+
+
+# Model and scoring plan of a pool process, loaded once by _init_process
+_model = None
+_scoring_plan = None
+
+
+def _init_process(flat_model_path, pinned_plan, scoring_plan):
+    global _model, _scoring_plan
+    if flat_model_path is not None:
+        from flat_model import FlatModelHandle
+        _model = FlatModelHandle(flat_model_path)
+    else:
+        _model = pinned_plan
+    _scoring_plan = scoring_plan
+
+
+class ModelVersionChanged(Exception):
+    """A pool process does not serve the model version a job was submitted for"""
+
+
+def _plan_for(version):
+    """This process's plan for model version; ModelVersionChanged if it serves another"""
+    if not hasattr(_model, 'snapshot'):
+        return _model
+    plan, metadata = _model.snapshot()
+    if metadata.get('version') != version:
+        # The API worker may have seen a new file before this process did
+        _model.check()
+        plan, metadata = _model.snapshot()
+        if metadata.get('version') != version:
+            raise ModelVersionChanged(f"Pool serves {metadata.get('version')}, job needs {version}")
+    return plan
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run_job(job, input_name, length, *args):
+    """Run job on the bytes in shared memory input_name; (output name, output length)"""
+    source = shared_memory.SharedMemory(name=input_name)
+    try:
+        payload = bytes(source.buf[:length])
+    finally:
+        source.close()
+    if job == 'score':
+        version, start = args
+        result = score_ndjson(_plan_for(version), _scoring_plan, payload, start)
+    else:
+        result = feature_impact_csv(payload)
+    return _to_shared(result.encode('utf-8'))
+
+
+def _to_shared(data):
+    """(name, length) of a new shared memory block holding data"""
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    np.ndarray(len(data), dtype=np.uint8, buffer=block.buf)[:] = np.frombuffer(data, dtype=np.uint8)
+    name = block.name
+    block.close()
+    return name, len(data)
+
+
+def _unlink(name):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _from_shared(name, length):
+    """The bytes in shared memory block name, which is then unlinked"""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:length])
+    finally:
+        block.close()
+        block.unlink()
+
+
+class ScoringPool:
+    """Persistent pool of processes for batch chunks and feature impact jobs of one API worker"""
+
+    def __init__(self, processes, flat_model_path, pinned_plan, scoring_plan, min_records=DEFAULT_MIN_RECORDS):
+        self.processes = processes
+        self.min_records = min_records
+        # The flat model file when the API serves one, else the plan itself
+        self._initargs = (flat_model_path, None if flat_model_path else pinned_plan, scoring_plan)
+        self._scoring_plan = scoring_plan
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.pool_jobs = self.thread_jobs = self.failures = 0
+        self.pool_seconds = 0.0
+
+    def executor(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Created in each API worker; a pool inherited over fork is not usable
+                    self._executor = ProcessPoolExecutor(
+                        self.processes, mp_context=get_context('spawn'),
+                        initializer=_init_process, initargs=self._initargs
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def start(self):
+        """Spawn the pool processes now instead of on the first job"""
+        self.executor().submit(_ping)
+
+    def _submit(self, job, payload, args, fallback):
+        """Result of job on payload, run in a pool process, or by fallback() here if the pool is broken"""
+        input_name, length = _to_shared(payload)
+        try:
+            future = self.executor().submit(_run_job, job, input_name, length, *args)
+        except BrokenProcessPool:
+            _unlink(input_name)
+            self._restart()
+            return self._run_here(fallback)
+        return _PoolResult(self, future, input_name, fallback)
+
+    def _run_here(self, fallback):
+        with self._lock:
+            self.thread_jobs += 1
+        return fallback()
+
+    def _finished(self, seconds):
+        with self._lock:
+            self.pool_jobs += 1
+            self.pool_seconds += seconds
+
+    def _restart(self):
+        with self._lock:
+            self._pid = None
+            self.failures += 1
+
+    def score_lines(self, plan, lines, start, version=None):
+        """NDJSON results (str, or a result() pending in the pool) of raw JSON record texts indexed from start
+
+        lines are NDJSON lines or split_json_array elements. Small chunks
+        are scored here, with plan. A pool process serving a flat model file
+        scores a chunk only if it serves version, plan's model version;
+        across a hot swap, when it serves another, the chunk is scored here
+        with plan instead, so every chunk of a request gets the same model.
+        """
+        def score_here():
+            return score_chunk(plan, self._scoring_plan, [(start + k, *parse_line(line)) for k, line in enumerate(lines)])
+        if len(lines) < self.min_records:
+            return self._run_here(score_here)
+        return self._submit('score', b'\n'.join(lines), (version, start), score_here)
+
+    def feature_impact(self, payload):
+        """JSON feature impact analysis of a labeled CSV, computed in a pool process"""
+        return result_text(self._submit('impact', payload, (), lambda: feature_impact_csv(payload)))
+
+    def stats(self):
+        return {
+            'processes': self.processes,
+            'min_records': self.min_records,
+            'pool_jobs': self.pool_jobs,
+            'mean_pool_job_ms': self.pool_seconds / self.pool_jobs * 1e3 if self.pool_jobs else 0.0,
+            'thread_jobs': self.thread_jobs,
+            'failures': self.failures,
+        }
+
+
+class _PoolResult:
+    """A job submitted to the pool, whose result() is its response text
+
+    Its shared memory is freed by result(), or by discard() when the
+    result will never be read.
+    """
+    __slots__ = ('pool', 'future', 'input_name', 'fallback', 'start', 'collected')
+
+    def __init__(self, pool, future, input_name, fallback):
+        self.pool = pool
+        self.future = future
+        self.input_name = input_name
+        self.fallback = fallback
+        self.start = time.perf_counter()
+        self.collected = False
+
+    def _release_input(self):
+        name, self.input_name = self.input_name, None
+        if name is not None:
+            _unlink(name)
+
+    def result(self):
+        self.collected = True
+        try:
+            output_name, length = self.future.result()
+        except BrokenProcessPool:
+            # A pool process died: this job runs here, the next in a new pool
+            self.pool._restart()
+            return self.pool._run_here(self.fallback)
+        except ModelVersionChanged:
+            return self.pool._run_here(self.fallback)
+        finally:
+            self._release_input()
+        self.pool._finished(time.perf_counter() - self.start)
+        return _from_shared(output_name, length).decode('utf-8')
+
+    def discard(self):
+        """Drop the job unread: free its shared memory now if it never started, else once it finishes"""
+        if self.collected:
+            return
+        self.collected = True
+        if self.future.cancel():
+            self._release_input()
+        else:
+            # The pool process may still be reading the input
+            self.future.add_done_callback(self._discard_done)
+
+    def _discard_done(self, future):
+        self._release_input()
+        if not future.cancelled() and future.exception() is None:
+            _unlink(future.result()[0])
+
+
+def result_text(result):
+    """The text of a score_lines result"""
+    return result if isinstance(result, str) else result.result()
+
+
+def discard_result(result):
+    """Drop a score_lines result that will not be read, e.g. after its client disconnected"""
+    if not isinstance(result, str):
+        result.discard()
@@ -0,0 +1,233 @@
+"""Background retraining of the served model, swapped into the running API.
+
+Two modes, run as a separate process (e.g. from cron) next to the API:
+
+* ``warm``: copy the served boosting model and add stages fitted on newly
+  arrived labeled rows (scikit-learn's warm_start). The label encoders,
+  scaler and existing stages are kept, so this costs a fit of the new
+  stages on the new rows only.
+* ``full``: retrain from scratch on the whole dataset, as the API does on
+  boot (load_or_train_bundle with the same environment options).
+
+The candidate is validated against the served model on held-out labeled
+rows: a share of the new rows in warm mode, a holdout CSV (or a sample of
+the dataset) in full mode. Only a candidate whose weighted F1 is within
+F1_TOLERANCE of the served model's, or better, is published. Publishing
+writes the flat model file next to the served one and os.replace()s it over
+it; every API worker's FlatModelHandle maps and warms the new file in a
+background thread and swaps it in with one reference assignment, so there
+is no restart, no dropped request and no request pays for the load.
+
+Each published candidate is also saved as a bundle, which the next warm
+start continues from, and the API keeps serving it across restarts as long
+as its training bundle is unchanged (see flat_model.publish_if_changed).
+
+Only models the API serves from the flat file can be swapped in: a
+gradient boosting model on the exact engine, or (MODEL_CV_STRATEGY=ensemble)
+a fold ensemble of them. MODEL_ENGINE=hist is refused before anything is
+trained, as are warm starts of a fold ensemble, which has no single model
+to add stages to; a candidate that turns out not to flatten (e.g. another
+tournament winner) is dropped before anything is saved. The API's risk scoring weights and
+feature impact analysis come from the bundle it booted from and are not
+swapped; a full retrain's new ones take effect when the API restarts.
+
+Run from the backend directory::
+
+    python retrain.py warm new_rows.csv [--stages 50]
+    python retrain.py full [dataset.csv] [--holdout holdout.csv] [--every 86400]
+"""
+import argparse
+import copy
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier, HistGradientBoostingClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+import artifacts
+import schema
+from flat_model import flattenable, load_flat_model, read_header, write_flat_model
+from model import bundle_options_from_env, fitted_stages, load_or_train_bundle
+from tournament import F1_TOLERANCE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.environ.get('DATA_PATH', os.path.join(BASE_DIR, 'Student Depression Dataset.csv'))
+FLAT_MODEL_PATH = os.environ.get('FLAT_MODEL_PATH', os.path.join(BASE_DIR, 'artifacts', 'current.flat'))
+# Boosting stages a warm start adds
+WARM_START_STAGES = 50
+
+
+def load_labeled_records(csv_filename):
+    """(records, labels) of a labeled survey CSV, records as the API receives them"""
+    df = pd.read_csv(csv_filename, **schema.read_csv_kwargs())
+    y = df.pop(schema.TARGET).to_numpy()
+    # Missing answers are left out, as a client would leave them out
+    records = [{col: value for col, value in record.items() if not pd.isna(value)} for record in df.to_dict('records')]
+    return records, y
+
+
+def warm_start(model, X, y, extra_stages=WARM_START_STAGES):
+    """Copy of a fitted boosting model with extra_stages more stages fitted on (X, y)"""
+    stages = fitted_stages(model)
+    candidate = copy.deepcopy(model)
+    if isinstance(model, GradientBoostingClassifier):
+        candidate.set_params(warm_start=True, n_estimators=stages + extra_stages)
+    elif isinstance(model, HistGradientBoostingClassifier):
+        candidate.set_params(warm_start=True, max_iter=stages + extra_stages)
+    else:
+        raise ValueError(f"Warm start needs a single gradient boosting model, not {type(model).__name__}")
+    candidate.fit(X, y)
+    # A later fit() on the candidate starts from scratch again
+    candidate.set_params(warm_start=False)
+    return candidate
+
+
+def weighted_f1(plan, records, y):
+    predictions, _ = plan.predict_records(records)
+    return float(f1_score(y, predictions, average='weighted'))
+
+
+def validate(candidate_plan, served_plan, records, y, f1_tolerance=F1_TOLERANCE):
+    """(accepted, candidate F1, served F1) on held-out labeled records"""
+    candidate_f1 = weighted_f1(candidate_plan, records, y)
+    served_f1 = weighted_f1(served_plan, records, y)
+    return candidate_f1 >= served_f1 - f1_tolerance, candidate_f1, served_f1
+
+
+def unpublishable_reason(options, mode='full'):
+    """Why a mode retrain of models trained with these load_or_train_bundle options can never be swapped in, or None"""
+    if options.get('engine') == 'hist':
+        return "MODEL_ENGINE=hist models cannot be written as flat model files"
+    if mode == 'warm' and options.get('cv_strategy') == 'ensemble':
+        return "MODEL_CV_STRATEGY=ensemble serves a fold ensemble, which cannot be warm started"
+    return None
+
+
+def served_model(flat_path=FLAT_MODEL_PATH, data_path=DATA_PATH):
+    """(bundle, served plan) of the model the API serves
+
+    The bundle is the retrained one the flat file was published from, or
+    the API's own training bundle.
+    """
+    metadata = read_header(flat_path)['metadata'] if os.path.exists(flat_path) else {}
+    bundle_file = metadata.get('bundle_path')
+    if bundle_file and os.path.exists(bundle_file):
+        bundle = artifacts.load_bundle(bundle_file)
+    else:
+        bundle = load_or_train_bundle(data_path, **bundle_options_from_env())
+    if metadata.get('version') == bundle['version']:
+        return bundle, load_flat_model(flat_path)[0]
+    return bundle, bundle['predictor'].inference_plan or bundle['predictor'].compile_inference_plan()
+
+
+def publish(bundle, base_version, mode, metrics, flat_path=FLAT_MODEL_PATH):
+    """Save the candidate bundle and atomically replace the served flat model file with it
+
+    base_version is the training bundle the candidate descends from; the
+    API keeps serving the candidate while it boots from that bundle.
+    """
+    trained_at = datetime.now(timezone.utc)
+    bundle.update({
+        'version': f"{base_version}-{mode}-{trained_at:%Y%m%d%H%M%S}",
+        'base_version': base_version,
+        'trained_at': trained_at.isoformat(),
+    })
+    bundle_file = os.path.join(os.path.dirname(flat_path), 'retrained', f"bundle-{bundle['version']}.joblib")
+    artifacts.save_bundle(bundle, bundle_file)
+    write_flat_model(bundle['predictor'].inference_plan, flat_path, {
+        'version': bundle['version'],
+        'base_version': base_version,
+        'trained_at': bundle['trained_at'],
+        'model': bundle.get('best_model_name'),
+        'metrics': metrics,
+        'bundle_path': bundle_file,
+    })
+    return bundle['version']
+
+
+def retrain_warm(csv_filename, extra_stages=WARM_START_STAGES, validation_fraction=0.2, flat_path=FLAT_MODEL_PATH):
+    """Add boosting stages fitted on the new rows in csv_filename and publish them if they validate"""
+    base_bundle, served_plan = served_model(flat_path)
+    predictor = copy.copy(base_bundle['predictor'])
+    records, y = load_labeled_records(csv_filename)
+    fit_records, holdout_records, y_fit, y_holdout = train_test_split(
+        records, y, test_size=validation_fraction, random_state=42, stratify=y
+    )
+
+    start = time.perf_counter()
+    plan = predictor.inference_plan or predictor.compile_inference_plan()
+    # Encoded and scaled exactly as the served model sees requests
+    X_fit = pd.DataFrame(plan.encode(fit_records), columns=plan.feature_names)
+    predictor.best_model = warm_start(predictor.best_model, X_fit, np.asarray(y_fit), extra_stages)
+    predictor.compile_inference_plan()
+    print(f"Warm start: {extra_stages} stages on {len(fit_records)} new rows in {time.perf_counter() - start:.1f}s")
+    bundle = dict(base_bundle, predictor=predictor)
+    base_version = base_bundle.get('base_version', base_bundle['version'])
+    return _validate_and_publish(bundle, base_version, served_plan, holdout_records, y_holdout, 'warm', flat_path)
+
+
+def retrain_full(csv_filename=DATA_PATH, holdout_csv=None, flat_path=FLAT_MODEL_PATH):
+    """Retrain from scratch on csv_filename and publish the result if it validates"""
+    base_bundle, served_plan = served_model(flat_path)
+    bundle = load_or_train_bundle(csv_filename, **bundle_options_from_env())
+    if bundle['version'] == base_bundle.get('base_version', base_bundle['version']):
+        print("Dataset and model config unchanged since the served model was trained, nothing to do")
+        return None
+    if holdout_csv:
+        holdout_records, y_holdout = load_labeled_records(holdout_csv)
+    else:
+        # Rows the candidate trained on: only a sanity check that it is not worse
+        records, y = load_labeled_records(csv_filename)
+        _, holdout_records, _, y_holdout = train_test_split(records, y, test_size=0.2, random_state=0, stratify=y)
+    return _validate_and_publish(dict(bundle), bundle['version'], served_plan, holdout_records, y_holdout, 'full',
+                                 flat_path)
+
+
+def _validate_and_publish(bundle, base_version, served_plan, records, y, mode, flat_path):
+    predictor = bundle['predictor']
+    plan = predictor.inference_plan or predictor.compile_inference_plan()
+    if not flattenable(plan):
+        print(f"Candidate {bundle.get('best_model_name')} has no flattened tree engine and cannot be published, "
+              "the served model stays")
+        return None
+    accepted, candidate_f1, served_f1 = validate(plan, served_plan, records, y)
+    print(f"Validation on {len(records)} held-out rows: candidate F1 {candidate_f1:.4f}, served F1 {served_f1:.4f}")
+    if not accepted:
+        print("Candidate rejected, the served model stays")
+        return None
+    version = publish(bundle, base_version, mode, {'f1_score': candidate_f1, 'served_f1_score': served_f1}, flat_path)
+    print(f"Published model {version} to {flat_path}")
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the served model and swap it into the running API")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    warm = subparsers.add_parser('warm', help="add boosting stages fitted on new labeled rows")
+    warm.add_argument('csv', help="CSV of newly arrived labeled rows")
+    warm.add_argument('--stages', type=int, default=WARM_START_STAGES)
+    full = subparsers.add_parser('full', help="retrain from scratch on the whole dataset")
+    full.add_argument('csv', nargs='?', default=DATA_PATH)
+    full.add_argument('--holdout', help="labeled CSV to validate the candidate on")
+    full.add_argument('--every', type=float, help="retrain again every this many seconds")
+    args = parser.parse_args()
+    reason = unpublishable_reason(bundle_options_from_env(), args.mode)
+    if reason:
+        parser.exit(1, f"Not retraining: {reason}, so the API could not swap the result in\n")
+
+    if args.mode == 'warm':
+        retrain_warm(args.csv, extra_stages=args.stages)
+        return
+    while True:
+        retrain_full(args.csv, args.holdout)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Declared schema of the student depression survey.
+
+One place lists every feature column with its kind, dtype, known categories,
+valid range and alternative spellings. Training reads the CSV with these
+dtypes in one pass, preprocessing encodes by kind instead of trying a numeric
+conversion on every column, and inference and the API resolve aliases (the
+underscore names used by the sample data and older clients) and validate
+records against it.
+
+The frontend questionnaire asks some questions with its own answer labels
+("Moderate", "<5", "Bachelor's"). Each feature lists what those answers mean
+in the dataset, and normalize_record maps them, so prediction and risk
+scoring see dataset values whichever client sent the record.
+"""
+import math
+import re
+
+import pandas as pd
+
+TARGET = 'Depression'
+ID_COLUMN = 'id'
+
+
+class Feature:
+    """One survey column: numeric with a valid range, or categorical with known categories"""
+
+    def __init__(self, name, kind, categories=None, value_range=None, aliases=(), answers=None):
+        self.name = name
+        self.kind = kind
+        # Known answers for categorical columns with a fixed set of them;
+        # None for free-text columns like City
+        self.categories = categories
+        self.value_range = value_range
+        # The underscore spelling (e.g. Academic_Pressure) is always accepted
+        underscore = re.sub(r'[^0-9A-Za-z]+', '_', name).strip('_')
+        self.aliases = tuple(dict.fromkeys(alias for alias in (underscore,) + tuple(aliases) if alias != name))
+        # {frontend answer: dataset value} for questions asked with other labels
+        self.answers = answers or {}
+
+    @property
+    def categorical(self):
+        return self.kind == 'categorical'
+
+    @property
+    def dtype(self):
+        return str if self.categorical else 'float64'
+
+    def normalize(self, value):
+        """The dataset value for an answer: frontend labels mapped, numeric strings parsed"""
+        if not isinstance(value, str):
+            return value
+        if value in self.answers:
+            return self.answers[value]
+        if not self.categorical:
+            try:
+                return float(value)
+            except ValueError:
+                return value
+        return value
+
+
+# Frontend questionnaire scales, on the dataset's 1-5 ratings
+PRESSURE_ANSWERS = {'None': 1, 'Low': 2, 'Moderate': 3, 'High': 4, 'Extreme': 5}
+SATISFACTION_ANSWERS = {'Very Unsatisfied': 1, 'Unsatisfied': 2, 'Neutral': 3, 'Satisfied': 4, 'Very Satisfied': 5}
+
+FEATURES = [
+    Feature('Gender', 'categorical', ['Female', 'Male']),
+    Feature('Age', 'numeric', value_range=(0, 120)),
+    Feature('City', 'categorical'),
+    Feature('Profession', 'categorical'),
+    Feature('Academic Pressure', 'numeric', value_range=(0, 5), answers=PRESSURE_ANSWERS),
+    # The dataset records no work pressure (students, mostly) as 0
+    Feature('Work Pressure', 'numeric', value_range=(0, 5), answers={**PRESSURE_ANSWERS, 'None': 0}),
+    Feature('CGPA', 'numeric', value_range=(0, 10)),
+    Feature('Study Satisfaction', 'numeric', value_range=(0, 5), answers=SATISFACTION_ANSWERS),
+    # and non-workers' job satisfaction as 0 too
+    Feature('Job Satisfaction', 'numeric', value_range=(0, 5),
+            answers={**SATISFACTION_ANSWERS, 'Not Applicable': 0}),
+    # The dataset has no 6-7 hour bucket; it files other answers under Others
+    Feature('Sleep Duration', 'categorical',
+            ['5-6 hours', '7-8 hours', 'Less than 5 hours', 'More than 8 hours', 'Others'],
+            answers={'<5': 'Less than 5 hours', '5-6': '5-6 hours', '6-7': 'Others', '7-8': '7-8 hours',
+                     '>8': 'More than 8 hours'}),
+    Feature('Dietary Habits', 'categorical', ['Healthy', 'Moderate', 'Others', 'Unhealthy'],
+            answers={'Average': 'Moderate'}),
+    # The dataset records specific degrees; generic levels without one go to Others
+    Feature('Degree', 'categorical',
+            answers={'High School': 'Class 12', "Bachelor's": 'Others', 'Bachelor\u2019s': 'Others',
+                     "Master's": 'Others', 'Master\u2019s': 'Others', 'Other': 'Others'}),
+    Feature('Have you ever had suicidal thoughts ?', 'categorical', ['No', 'Yes'],
+            aliases=('Have you ever had suicidal thoughts',)),
+    Feature('Work/Study Hours', 'numeric', value_range=(0, 24)),
+    Feature('Financial Stress', 'numeric', value_range=(0, 5), answers=PRESSURE_ANSWERS),
+    Feature('Family History of Mental Illness', 'categorical', ['No', 'Yes']),
+]
+
+FEATURES_BY_NAME = {feature.name: feature for feature in FEATURES}
+FEATURE_NAMES = [feature.name for feature in FEATURES]
+NUMERIC_FEATURES = [feature.name for feature in FEATURES if not feature.categorical]
+CATEGORICAL_FEATURES = [feature.name for feature in FEATURES if feature.categorical]
+# {alias: canonical name}, covering the canonical names themselves
+CANONICAL_NAMES = {name: name for name in FEATURE_NAMES}
+CANONICAL_NAMES.update({alias: feature.name for feature in FEATURES for alias in feature.aliases})
+CANONICAL_NAMES[TARGET] = TARGET
+CANONICAL_NAMES[ID_COLUMN] = ID_COLUMN
+
+
+def read_csv_kwargs(include_id=False):
+    """usecols= and dtype= for reading the survey CSV in one typed pass"""
+    columns = ([ID_COLUMN] if include_id else []) + FEATURE_NAMES + [TARGET]
+    dtype = {feature.name: feature.dtype for feature in FEATURES}
+    dtype[TARGET] = 'int64'
+    return {'usecols': columns, 'dtype': dtype}
+
+
+def in_schema_order(df):
+    """df with the schema's columns in declared order (id, features, target), any others after them
+
+    Positional settings such as the hist engine's categorical_features mask
+    follow FEATURE_NAMES, so training frames must too, whatever the column
+    order of the CSV export.
+    """
+    order = [col for col in [ID_COLUMN] + FEATURE_NAMES + [TARGET] if col in df.columns]
+    return df[order + [col for col in df.columns if col not in order]]
+
+
+def canonical_name(name):
+    """The schema name for a column or field name, or None if it is not part of the schema"""
+    return CANONICAL_NAMES.get(name)
+
+
+def canonical_record(record):
+    """Copy of record keyed by schema names; aliases are resolved and unknown fields dropped"""
+    canonical = {}
+    for key, value in record.items():
+        name = CANONICAL_NAMES.get(key)
+        # A canonical name wins over an alias for the same feature
+        if name is not None and (name == key or name not in canonical):
+            canonical[name] = value
+    return canonical
+
+
+def normalize_record(record):
+    """Copy of record keyed by schema names with every answer normalized to its dataset value"""
+    normalized = canonical_record(record)
+    for name, value in normalized.items():
+        feature = FEATURES_BY_NAME.get(name)
+        if feature is not None:
+            normalized[name] = feature.normalize(value)
+    return normalized
+
+
+def validate_record(record):
+    """(errors, warnings) for one input record
+
+    Errors make the record unusable: it is not an object, or a numeric answer
+    is outside the valid range. Warnings flag answers the model cannot use and
+    will impute or treat as an unseen category, so they are no longer silent.
+    """
+    if not isinstance(record, dict):
+        return ["Record must be a JSON object"], []
+
+    errors, warnings = [], []
+    for key in record:
+        if key not in CANONICAL_NAMES:
+            warnings.append(f"Unknown field '{key}' ignored")
+
+    for name, value in canonical_record(record).items():
+        feature = FEATURES_BY_NAME.get(name)
+        if feature is None or value is None or value == '':
+            continue
+        value = feature.normalize(value)
+        if feature.categorical:
+            if feature.categories is not None and str(value) not in feature.categories:
+                warnings.append(f"'{name}': {value!r} is not one of {feature.categories}, treated as unseen")
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            warnings.append(f"'{name}': {value!r} is not a number, using the typical value")
+            continue
+        if isinstance(value, bool) or math.isnan(number):
+            continue
+        low, high = feature.value_range
+        if not low <= number <= high:
+            errors.append(f"'{name}' must be between {low} and {high}, got {value!r}")
+    return errors, warnings
+
+
+def normalize_frame(df):
+    """Rename aliased columns and cast a frame of raw strings to the schema dtypes"""
+    df = df.rename(columns=lambda col: CANONICAL_NAMES.get(col, col))
+    for col in df.columns:
+        feature = FEATURES_BY_NAME.get(col)
+        if feature is not None and feature.categorical:
+            # Whitespace-separated sample data spells spaces as underscores
+            df[col] = df[col].astype(str).str.replace('_', ' ', regex=False)
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
@@ -0,0 +1,209 @@
+"""Compiled risk-scoring plan for the detailed, per-factor risk score.
+
+Every factor the user answered scores its weight when the answer is one of
+the factor's high-risk values and a fifth of it otherwise; the total is
+normalized by the sum of all weights to 0-100. The plan compiles weights and
+high-risk values once: weights into a vector with its sum precomputed,
+high-risk values into frozensets for single records and, per factor, into a
+boolean mask over label codes (categorical factors) or a sorted value array
+(numeric factors) for scoring a whole matrix at once.
+
+High-risk values computed from the encoded training frame are label codes
+for categorical factors. Given the label encoders' vocabularies the plan
+accepts the answers they stand for as well, so 'Yes' matches as the code
+for 'Yes' does. Frontend answer labels are normalized to dataset values
+first (see schema.Feature.normalize), so 'High' pressure scores as 4.
+
+The API and the command-line assessment both score through a plan: one
+record at a time with score_one, or a batch with encode and score_matrix.
+"""
+import math
+
+import numpy as np
+
+import schema
+
+HIGH_RISK_SCORE = 1.0
+LOW_RISK_SCORE = 0.2
+
+# Fixed high-risk answers, used with the feature-importance weights when no
+# data-driven thresholds are given
+DEFAULT_RISK_THRESHOLDS = {
+    'Academic Pressure': [4, 5],
+    'Work Pressure': [4, 5],
+    'Financial Stress': [4, 5],
+    'Sleep Duration': ['Less than 5 hours'],
+    'Study Satisfaction': [1, 2],
+    'Job Satisfaction': [1, 2],
+    'Have you ever had suicidal thoughts ?': ['Yes', 1],
+    'Family History of Mental Illness': ['Yes', 1],
+    'Dietary Habits': ['Unhealthy'],
+    'Work/Study Hours': [10, 11, 12]
+}
+
+# Matrix entries for answers that are present but match no code or number
+UNKNOWN_CODE = -1
+NOT_A_NUMBER = math.inf
+
+
+class ScoringPlan:
+    """Weights and high-risk values compiled for scoring one record or a matrix of them"""
+
+    def __init__(self, weights, risk_thresholds, vocabularies=None):
+        vocabularies = vocabularies or {}
+        self.factors = list(weights)
+        self.weights = np.array([weights[factor] for factor in self.factors], dtype=np.float64)
+        # Same sum (and summation order) as sum(weights.values())
+        self.max_score = sum(weights.values())
+        # As given, for the per-factor breakdown and to recognize the source
+        self.risk_thresholds = {factor: list(risk_thresholds.get(factor, [])) for factor in self.factors}
+        self._index = {factor: j for j, factor in enumerate(self.factors)}
+        self._source = (weights, risk_thresholds)
+        # (weight, high-risk score, low-risk score) per factor as plain floats for score_one
+        self._scores = [(weight, weight * HIGH_RISK_SCORE, weight * LOW_RISK_SCORE) for weight in self.weights.tolist()]
+
+        self.high_risk_values = []
+        self.vocabularies = {}
+        self.high_risk_codes = {}
+        self.high_risk_numbers = {}
+        for factor in self.factors:
+            values = self.risk_thresholds[factor]
+            vocabulary = vocabularies.get(factor)
+            feature = schema.FEATURES_BY_NAME.get(factor)
+            if vocabulary is None and feature is not None and feature.categorical:
+                # No encoder: the string answers in the thresholds are the only ones that matter
+                vocabulary = {label: code for code, label in enumerate(sorted({v for v in values if isinstance(v, str)}))}
+            high = set(_hashable(values))
+            if vocabulary is not None:
+                labels = {code: label for label, code in vocabulary.items()}
+                high |= {labels[value] for value in high if _is_code(value) and int(value) in labels}
+                # High-risk answers the encoder never saw still need a code of their own
+                vocabulary = dict(vocabulary)
+                for label in sorted(v for v in high if isinstance(v, str) and v not in vocabulary):
+                    vocabulary[label] = len(vocabulary)
+                self.vocabularies[factor] = vocabulary
+                mask = np.zeros(len(vocabulary), dtype=bool)
+                for label, code in vocabulary.items():
+                    mask[code] = label in high or code in high
+                self.high_risk_codes[factor] = mask
+            else:
+                self.high_risk_numbers[factor] = np.array(
+                    sorted(float(v) for v in high if isinstance(v, (int, float, np.number))))
+            self.high_risk_values.append(frozenset(high))
+        # (index, factor, aliases, normalize or None, vocabulary or None) for encode(), in factor order
+        features = [schema.FEATURES_BY_NAME.get(factor) for factor in self.factors]
+        self._columns = [
+            (j, factor, feature.aliases if feature else (), feature.normalize if feature else None,
+             self.vocabularies.get(factor))
+            for j, (factor, feature) in enumerate(zip(self.factors, features))
+        ]
+
+    @classmethod
+    def from_label_encoders(cls, weights, risk_thresholds, label_encoders):
+        vocabularies = {
+            col: {str(category): code for code, category in enumerate(encoder.classes_)}
+            for col, encoder in label_encoders.items()
+        }
+        return cls(weights, risk_thresholds, vocabularies)
+
+    def compiled_from(self, weights, risk_thresholds):
+        """Whether the plan was compiled from these weights and thresholds"""
+        if weights is self._source[0] and risk_thresholds is self._source[1]:
+            return True
+        return (dict(zip(self.factors, self.weights.tolist())) == dict(weights)
+                and self.risk_thresholds == {factor: list(risk_thresholds.get(factor, [])) for factor in self.factors})
+
+    def score_one(self, record):
+        """(per-factor scores, 0-100 risk score) for one record; only answered factors score"""
+        scores = {}
+        total_risk_score = 0
+        for factor, value in schema.normalize_record(record).items():
+            j = self._index.get(factor)
+            if j is None:
+                continue
+            try:
+                is_high_risk = value in self.high_risk_values[j]
+            except TypeError:
+                # Unhashable answers (lists, objects) are never high risk
+                is_high_risk = False
+            weight, high_score, low_score = self._scores[j]
+            risk_score = high_score if is_high_risk else low_score
+            scores[factor] = {
+                'value': value,
+                'risk_score': risk_score,
+                'weight': weight,
+                'is_high_risk': is_high_risk,
+                'high_risk_threshold': self.risk_thresholds[factor]
+            }
+            total_risk_score += risk_score
+        return scores, float(min(100, (total_risk_score / self.max_score) * 100))
+
+    def encode(self, records):
+        """(n_records, n_factors) matrix: label codes for categorical factors, numbers otherwise
+
+        Answers are normalized as in score_one. Unanswered factors are NaN.
+        Answers outside the vocabulary, or that are not numbers, get
+        UNKNOWN_CODE / NOT_A_NUMBER: they still score, but never as high
+        risk, as in score_one.
+        """
+        matrix = np.full((len(records), len(self.factors)), np.nan)
+        for i, record in enumerate(records):
+            row = matrix[i]
+            for j, factor, aliases, normalize, vocabulary in self._columns:
+                if factor in record:
+                    value = record[factor]
+                else:
+                    for alias in aliases:
+                        if alias in record:
+                            value = record[alias]
+                            break
+                    else:
+                        continue
+                if normalize is not None and isinstance(value, str):
+                    value = normalize(value)
+                if vocabulary is not None:
+                    if isinstance(value, str):
+                        row[j] = vocabulary.get(value, UNKNOWN_CODE)
+                    else:
+                        row[j] = value if _is_code(value) and 0 <= value < len(vocabulary) else UNKNOWN_CODE
+                elif isinstance(value, (int, float, np.number)) and not math.isnan(value):
+                    row[j] = value
+                else:
+                    row[j] = NOT_A_NUMBER
+        return matrix
+
+    def score_matrix(self, matrix):
+        """(per-factor risk scores, 0-100 risk scores) for an encode() matrix, vectorized"""
+        is_high_risk = np.zeros(matrix.shape, dtype=bool)
+        for j, factor in enumerate(self.factors):
+            column = matrix[:, j]
+            mask = self.high_risk_codes.get(factor)
+            if mask is not None:
+                valid = (column >= 0) & (column < len(mask))
+                is_high_risk[valid, j] = mask[column[valid].astype(np.intp)]
+            elif len(self.high_risk_numbers[factor]):
+                is_high_risk[:, j] = np.isin(column, self.high_risk_numbers[factor])
+        risk_scores = self.weights * np.where(is_high_risk, HIGH_RISK_SCORE, LOW_RISK_SCORE)
+        risk_scores[np.isnan(matrix)] = 0.0
+        totals = risk_scores.sum(axis=1)
+        return risk_scores, np.minimum(100, (totals / self.max_score) * 100)
+
+    def score_records(self, records):
+        return self.score_matrix(self.encode(records))
+
+    def breakdown(self, row, risk_scores):
+        """{factor: risk score} for the answered factors of one encode() row and its score_matrix scores"""
+        return {factor: float(score) for factor, value, score in zip(self.factors, row, risk_scores) if not np.isnan(value)}
+
+
+def _hashable(values):
+    for value in values:
+        try:
+            hash(value)
+        except TypeError:
+            continue
+        yield value
+
+
+def _is_code(value):
+    return isinstance(value, (int, np.integer)) or (isinstance(value, float) and value.is_integer())
@@ -0,0 +1,305 @@
+"""Incremental store of the aggregates behind the data-driven weights.
+
+The weights, high-risk thresholds and feature impact analysis only need, per
+feature, the target correlation and the rows and depressed rows of every
+value (see analysis.py). This store keeps those aggregates on disk and folds
+each new batch of labeled rows into them, so a daily batch costs a scan of
+that batch alone and deriving the statistics costs O(features x values),
+whatever the size of the data seen so far.
+
+Per column the store keeps:
+
+* {value: [rows, depressed rows]} over the raw answers, and the rows (and
+  depressed rows) with the answer missing;
+* for numeric columns, the running co-moments of value and target
+  (count, means, sums of squares and of cross products), merged batch by
+  batch with the parallel update of Chan et al.
+
+Derived statistics reproduce the full pipeline, which imputes missing
+answers (mode or median) and label-encodes categorical columns before
+computing the weights: the fill values come from the stored counts, missing
+rows are added under them, and categorical values are coded by their rank
+among the sorted answers, as LabelEncoder codes them. A categorical
+column's correlation is computed on those codes from its table, because a
+new answer shifts the codes of every answer sorted after it.
+
+Run ``python stats_store.py new_batch.csv ...`` from the backend directory
+to fold CSV files into the store and print the feature impact analysis.
+"""
+import hashlib
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import analysis
+import artifacts
+import schema
+
+# Bump whenever the stored aggregates change layout
+STORE_FORMAT = 1
+DEFAULT_STORE_FILE = os.path.join(artifacts.DEFAULT_ARTIFACT_DIR, 'stats', 'store.joblib')
+
+
+def batch_id(df):
+    """Hash of a batch's rows, so the same batch is never counted twice"""
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def _merge_moments(a, b):
+    """Co-moments [n, mean_x, mean_y, m2_x, m2_y, c_xy] of two disjoint groups of rows combined"""
+    n_a, mean_x_a, mean_y_a, m2_x_a, m2_y_a, c_xy_a = a
+    n_b, mean_x_b, mean_y_b, m2_x_b, m2_y_b, c_xy_b = b
+    n = n_a + n_b
+    if n_a == 0 or n_b == 0:
+        return list(a if n_b == 0 else b)
+    dx, dy = mean_x_b - mean_x_a, mean_y_b - mean_y_a
+    return [
+        n,
+        mean_x_a + dx * n_b / n,
+        mean_y_a + dy * n_b / n,
+        m2_x_a + m2_x_b + dx * dx * n_a * n_b / n,
+        m2_y_a + m2_y_b + dy * dy * n_a * n_b / n,
+        c_xy_a + c_xy_b + dx * dy * n_a * n_b / n,
+    ]
+
+
+def _batch_moments(X, y):
+    """Co-moments of every column of X with y over the rows where the column is present"""
+    present = ~np.isnan(X)
+    n = present.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.where(present, X, 0).sum(axis=0) / n
+        mean_y = (present * y[:, None]).sum(axis=0) / n
+    dx = np.where(present, X - mean_x, 0)
+    dy = np.where(present, y[:, None] - mean_y, 0)
+    return [
+        [int(n[j]), mean_x[j], mean_y[j], (dx[:, j] ** 2).sum(), (dy[:, j] ** 2).sum(), (dx[:, j] * dy[:, j]).sum()]
+        for j in range(X.shape[1])
+    ]
+
+
+def _correlation(moments):
+    n, _, _, m2_x, m2_y, c_xy = moments
+    if n < 2 or m2_x <= 0 or m2_y <= 0:
+        return np.nan
+    return float(np.clip(c_xy / np.sqrt(m2_x) / np.sqrt(m2_y), -1, 1))
+
+
+def _is_nan(value):
+    return isinstance(value, float) and np.isnan(value)
+
+
+def _median(values, counts):
+    """Median of values (sorted) repeated counts times, as Series.median computes it"""
+    n = counts.sum()
+    if n == 0:
+        return np.nan
+    ends = np.cumsum(counts)
+    low, high = values[np.searchsorted(ends, (n - 1) // 2, side='right')], values[np.searchsorted(ends, n // 2, side='right')]
+    return low if low == high else np.mean([low, high])
+
+
+class StatsStore:
+    """Per-feature value counts and target co-moments, updated one batch of labeled rows at a time"""
+
+    def __init__(self):
+        self.format = STORE_FORMAT
+        self.n_rows = 0
+        self.n_depressed = 0
+        self.columns = []
+        # {column: {value: [rows, depressed rows]}} over the answered rows
+        self.counts = {}
+        # {column: [rows, depressed rows]} with the answer missing
+        self.missing = {}
+        # {numeric column: [n, mean_x, mean_y, m2_x, m2_y, c_xy]} over the answered rows
+        self.moments = {}
+        self.batch_ids = []
+
+    def categorical(self, col):
+        feature = schema.FEATURES_BY_NAME.get(col)
+        return feature.categorical if feature is not None else col not in self.moments
+
+    def update(self, df, target=schema.TARGET):
+        """Fold a batch of labeled rows (raw answers, schema dtypes) into the store
+
+        Returns False, changing nothing, for a batch already folded in.
+        """
+        df = df.rename(columns=lambda col: schema.CANONICAL_NAMES.get(col, col))
+        key = batch_id(df)
+        if key in self.batch_ids:
+            return False
+        y = df[target].to_numpy() == 1
+        n_rows, n_depressed = len(df), int(y.sum())
+
+        columns = [col for col in df.columns if col not in (schema.ID_COLUMN, target)]
+        for col in columns:
+            if col not in self.counts:
+                # Rows seen before the column existed did not answer it
+                self.columns.append(col)
+                self.counts[col] = {}
+                self.missing[col] = [self.n_rows, self.n_depressed]
+                feature = schema.FEATURES_BY_NAME.get(col)
+                if (feature is None and df[col].dtype != 'object') or (feature is not None and not feature.categorical):
+                    self.moments[col] = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        for col in self.columns:
+            if col not in df.columns:
+                self.missing[col][0] += n_rows
+                self.missing[col][1] += n_depressed
+
+        # One bincount pass for the value tables of the whole batch
+        tables = analysis.value_counts_by_target(df, columns, target)
+        for col in columns:
+            uniques, counts, positives = tables[col]
+            stored = self.counts[col]
+            for value, count, positive in zip(uniques.tolist(), counts.tolist(), positives.tolist()):
+                tally = stored.setdefault(value, [0, 0])
+                tally[0] += count
+                tally[1] += positive
+            answered = int(counts.sum())
+            self.missing[col][0] += n_rows - answered
+            self.missing[col][1] += n_depressed - int(positives.sum())
+
+        numeric = [col for col in columns if col in self.moments]
+        if numeric:
+            X = df[numeric].to_numpy(dtype=np.float64)
+            for col, moments in zip(numeric, _batch_moments(X, y.astype(np.float64))):
+                self.moments[col] = _merge_moments(self.moments[col], moments)
+
+        self.n_rows += n_rows
+        self.n_depressed += n_depressed
+        self.batch_ids.append(key)
+        return True
+
+    def update_from_csv(self, csv_filename, chunksize=None):
+        """Fold a CSV of labeled rows into the store (in chunks of chunksize rows); returns the rows added"""
+        added = 0
+        if chunksize:
+            chunks = pd.read_csv(csv_filename, chunksize=chunksize, **schema.read_csv_kwargs())
+        else:
+            chunks = [pd.read_csv(csv_filename, **schema.read_csv_kwargs())]
+        for chunk in chunks:
+            if self.update(chunk):
+                added += len(chunk)
+        return added
+
+    def fill_value(self, col):
+        """The value the pipeline imputes for a missing answer: the mode, or the median of a numeric column"""
+        stored = self.counts[col]
+        if not stored:
+            return 'Unknown' if self.categorical(col) else np.nan
+        values = sorted(stored)
+        counts = np.array([stored[value][0] for value in values])
+        if self.categorical(col):
+            # Series.mode()[0]: the smallest of the most frequent values
+            return values[int(np.argmax(counts))]
+        return _median(np.array(values, dtype=np.float64), counts)
+
+    def labels(self):
+        """{categorical column: sorted answers}, the classes_ a LabelEncoder would have"""
+        labels = {}
+        for col in self.columns:
+            if self.categorical(col):
+                fill_value = self.fill_value(col) if self.missing[col][0] else None
+                labels[col] = sorted(set(self.counts[col]) | ({fill_value} if fill_value is not None else set()))
+        return labels
+
+    def tables(self):
+        """{column: (sorted values, rows per value, depressed rows per value)} of the imputed, encoded data
+
+        The value_counts_by_target tables of the frame the full pipeline
+        computes the weights from: categorical values are label codes.
+        """
+        labels = self.labels()
+        tables = {}
+        for col in self.columns:
+            stored = dict(self.counts[col])
+            missing_rows, missing_depressed = self.missing[col]
+            fill_value = self.fill_value(col) if missing_rows else None
+            # With nothing to impute from (no answers at all) the rows stay missing
+            if fill_value is not None and not _is_nan(fill_value):
+                rows, depressed = stored.get(fill_value, [0, 0])
+                stored[fill_value] = [rows + missing_rows, depressed + missing_depressed]
+            if col in labels:
+                uniques = pd.Index(np.arange(len(labels[col]), dtype=np.int64))
+                tallies = [stored[value] for value in labels[col]]
+            else:
+                values = sorted(stored)
+                uniques = pd.Index(np.array(values, dtype=np.float64))
+                tallies = [stored[value] for value in values]
+            tallies = np.array(tallies, dtype=np.int64).reshape(-1, 2)
+            tables[col] = (uniques, tallies[:, 0], tallies[:, 1])
+        return tables
+
+    def correlations(self, tables=None):
+        """Target correlation of every column of the imputed, encoded data"""
+        tables = tables or self.tables()
+        correlations = []
+        for col in self.columns:
+            if col in self.moments:
+                moments = self.moments[col]
+                missing_rows, missing_depressed = self.missing[col]
+                fill_value = self.fill_value(col) if missing_rows else None
+                if fill_value is not None and not _is_nan(fill_value):
+                    # Imputed rows: every value the median, the target as recorded
+                    rate = missing_depressed / missing_rows
+                    moments = _merge_moments(
+                        moments, [missing_rows, float(fill_value), rate, 0.0, missing_rows * rate * (1 - rate), 0.0]
+                    )
+                correlations.append(_correlation(moments))
+            else:
+                # Label codes are the table's row positions
+                codes, counts, positives = tables[col]
+                codes = codes.to_numpy(dtype=np.float64)
+                n = counts.sum()
+                if n == 0:
+                    correlations.append(np.nan)
+                    continue
+                mean_x, mean_y = (codes * counts).sum() / n, positives.sum() / n
+                dx = codes - mean_x
+                m2_x = (dx * dx * counts).sum()
+                m2_y = n * mean_y * (1 - mean_y)
+                c_xy = (dx * (positives - counts * mean_y)).sum()
+                correlations.append(_correlation([n, mean_x, mean_y, m2_x, m2_y, c_xy]))
+        return np.array(correlations)
+
+    def data_driven_weights(self):
+        """(weights, risk_thresholds, feature_stats), as analysis.data_driven_weights computes them on all rows"""
+        tables = self.tables()
+        return analysis.weights_from_tables(self.columns, self.correlations(tables), tables)
+
+    def feature_impact(self, alpha=0.05):
+        """analysis.feature_impact of all rows, with categorical answers decoded"""
+        tables = self.tables()
+        return analysis.impact_from_tables(self.columns, self.correlations(tables), tables, self.labels(), alpha)
+
+    def save(self, path=None):
+        path = path or DEFAULT_STORE_FILE
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename, so readers never see a partial store
+        tmp_path = f"{path}.tmp"
+        joblib.dump(self, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=None):
+        """The store saved at path, or a new empty one if there is none (or it is from older code)"""
+        path = path or DEFAULT_STORE_FILE
+        if os.path.exists(path):
+            store = joblib.load(path)
+            if getattr(store, 'format', None) == STORE_FORMAT:
+                return store
+            print(f"Ignoring statistics store {path} written by older code")
+        return cls()
+
+
+if __name__ == "__main__":
+    store = StatsStore.load()
+    for csv_filename in sys.argv[1:]:
+        added = store.update_from_csv(csv_filename, chunksize=100_000)
+        print(f"{csv_filename}: {added} new rows" if added else f"{csv_filename}: already in the store")
+    store.save()
+    print(f"Statistics store: {store.n_rows} rows, {store.n_depressed} depressed, {len(store.batch_ids)} batches")
+    analysis.print_feature_impact(store.feature_impact())
@@ -0,0 +1,235 @@
+"""Chunked preprocessing for survey exports larger than RAM.
+
+The in-memory path in DepressionPredictor.load_and_preprocess_data needs the
+whole CSV as one DataFrame: mode()/median() for imputation, fit_transform for
+the encoders and scaler. Here the CSV is read in chunks, twice:
+
+1. Profile pass: per-column counters (categorical vocabularies and modes),
+   a bottom-k reservoir sample for approximate medians, and mergeable
+   mean/variance moments for the scaler.
+2. Encode pass: each chunk is imputed, label-encoded and scaled with the
+   statistics from pass 1 and written straight into memory-mapped matrices.
+
+Peak memory is bounded by the chunk size plus the reservoir samples.
+"""
+import os
+import shutil
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+import schema
+
+# Values kept per numeric column for the median estimate; medians are exact
+# for columns with at most this many non-missing values
+RESERVOIR_SIZE = 100_000
+
+
+class RunningMoments:
+    """Count, mean and sum of squared deviations, mergeable across chunks"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values):
+            mean = values.mean()
+            self.merge(len(values), mean, float(((values - mean) ** 2).sum()))
+
+    def merge(self, n, mean, m2):
+        # Chan et al.'s pairwise combination of two (n, mean, M2) summaries
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+
+    @property
+    def variance(self):
+        # Population variance, as StandardScaler uses
+        return self.m2 / self.n if self.n else 0.0
+
+
+class ReservoirSample:
+    """Uniform sample of a stream: the values with the k smallest random keys"""
+
+    def __init__(self, size=RESERVOIR_SIZE, seed=42):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.empty(0)
+        self.values = np.empty(0)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        keys = np.concatenate([self.keys, self.rng.random(len(values))])
+        values = np.concatenate([self.values, values])
+        if len(keys) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            keys, values = keys[keep], values[keep]
+        self.keys, self.values = keys, values
+
+    def median(self):
+        return float(np.median(self.values)) if len(self.values) else 0.0
+
+
+class ColumnProfile:
+    """Everything pass 1 learns about one column"""
+
+    def __init__(self, categorical):
+        self.categorical = categorical
+        self.n_missing = 0
+        self.counts = Counter()
+        self.moments = RunningMoments()
+        self.sample = ReservoirSample()
+
+    def update(self, series):
+        missing = series.isna()
+        self.n_missing += int(missing.sum())
+        present = series[~missing]
+        if self.categorical:
+            self.counts.update(present.astype(str).value_counts().to_dict())
+        else:
+            values = pd.to_numeric(present, errors='coerce').dropna().to_numpy()
+            # Unparseable values are imputed like missing ones
+            self.n_missing += len(present) - len(values)
+            self.moments.update(values)
+            self.sample.update(values)
+
+    def fill_value(self):
+        """Mode for categorical columns (smallest on ties, like pandas), median otherwise"""
+        if self.categorical:
+            if not self.counts:
+                return 'Unknown'
+            top = max(self.counts.values())
+            return min(value for value, count in self.counts.items() if count == top)
+        return self.sample.median()
+
+    def classes(self):
+        """Sorted category strings, as LabelEncoder.fit would produce after imputation"""
+        categories = set(self.counts)
+        if self.n_missing:
+            categories.add(self.fill_value())
+        return np.array(sorted(categories))
+
+    def scaler_moments(self, fill_value, classes=None):
+        """(mean, variance) of the column after imputation and encoding"""
+        if self.categorical:
+            codes = {value: code for code, value in enumerate(classes)}
+            counts = Counter(self.counts)
+            counts[fill_value] += self.n_missing
+            n = sum(counts.values())
+            mean = sum(codes[value] * count for value, count in counts.items()) / n
+            m2 = sum(count * (codes[value] - mean) ** 2 for value, count in counts.items())
+            return mean, m2 / n
+        moments = RunningMoments()
+        moments.merge(self.moments.n, self.moments.mean, self.moments.m2)
+        if self.n_missing:
+            # Imputed values are all the median: a block with zero spread
+            moments.merge(self.n_missing, float(fill_value), 0.0)
+        return moments.mean, moments.variance
+
+
+def _fitted_scaler(columns, means, variances, n_samples):
+    """A StandardScaler with the given moments, as if fit() had seen the data"""
+    scaler = StandardScaler()
+    scaler.mean_ = np.asarray(means, dtype=np.float64)
+    scaler.var_ = np.asarray(variances, dtype=np.float64)
+    scale = np.sqrt(scaler.var_)
+    # Same guard as sklearn: (near-)constant columns are left unscaled
+    scale[scale < 10 * np.finfo(np.float64).eps] = 1.0
+    scaler.scale_ = scale
+    scaler.n_samples_seen_ = n_samples
+    scaler.n_features_in_ = len(columns)
+    scaler.feature_names_in_ = np.asarray(columns, dtype=object)
+    return scaler
+
+
+def profile_csv(csv_filename, chunksize):
+    """Pass 1: read the CSV in chunks and profile every feature column"""
+    profiles = {
+        name: ColumnProfile(categorical=name in schema.CATEGORICAL_FEATURES) for name in schema.FEATURE_NAMES
+    }
+    n_rows = 0
+    for chunk in pd.read_csv(csv_filename, chunksize=chunksize, **schema.read_csv_kwargs()):
+        for col in schema.FEATURE_NAMES:
+            profiles[col].update(chunk[col])
+        n_rows += len(chunk)
+    return list(schema.FEATURE_NAMES), profiles, n_rows
+
+
+def stream_preprocess(csv_filename, chunksize=100_000, output_dir=None, scale_categoricals=True):
+    """Profile and encode a CSV in chunks into memory-mapped matrices
+
+    Returns (X_scaled, y, df, label_encoders, scaler, fill_values) with the
+    same meaning as the in-memory path; the frames are views over .dat files
+    in output_dir. Without an output_dir they are written to a temporary
+    directory that is removed before returning: the mappings stay valid,
+    and the disk space is freed once the frames are released. With scale_categoricals=False the categorical columns keep
+    their raw label codes and the scaler only covers the numeric ones.
+    """
+    feature_names, profiles, n_rows = profile_csv(csv_filename, chunksize)
+    target = schema.TARGET
+    print(f"Profiled {n_rows} records from {csv_filename} in chunks of {chunksize}")
+
+    fill_values, label_encoders, scaled_columns, means, variances = {}, {}, [], [], []
+    for col in feature_names:
+        profile = profiles[col]
+        fill_values[col] = profile.fill_value()
+        classes = None
+        if profile.categorical:
+            encoder = LabelEncoder()
+            encoder.classes_ = classes = profile.classes()
+            label_encoders[col] = encoder
+        if profile.categorical and not scale_categoricals:
+            continue
+        mean, variance = profile.scaler_moments(fill_values[col], classes)
+        scaled_columns.append(col)
+        means.append(mean)
+        variances.append(variance)
+    scaler = _fitted_scaler(scaled_columns, means, variances, n_rows)
+    # Unscaled columns pass through as (x - 0) / 1
+    position = {col: k for k, col in enumerate(scaled_columns)}
+    shift = np.array([scaler.mean_[position[col]] if col in position else 0.0 for col in feature_names])
+    divisor = np.array([scaler.scale_[position[col]] if col in position else 1.0 for col in feature_names])
+
+    temporary = not output_dir
+    output_dir = output_dir or tempfile.mkdtemp(prefix='mindbridge-stream-')
+    os.makedirs(output_dir, exist_ok=True)
+    n_features = len(feature_names)
+    X = np.memmap(os.path.join(output_dir, 'X_scaled.dat'), dtype=np.float64, mode='w+', shape=(n_rows, n_features))
+    # Encoded but unscaled features plus the target, i.e. the encoded df
+    encoded = np.memmap(os.path.join(output_dir, 'encoded.dat'), dtype=np.float64, mode='w+', shape=(n_rows, n_features + 1))
+
+    codes = {col: {value: code for code, value in enumerate(encoder.classes_)} for col, encoder in label_encoders.items()}
+    start = 0
+    for chunk in pd.read_csv(csv_filename, chunksize=chunksize, **schema.read_csv_kwargs()):
+        stop = start + len(chunk)
+        block = encoded[start:stop]
+        for j, col in enumerate(feature_names):
+            if col in codes:
+                values = chunk[col].where(chunk[col].notna(), fill_values[col]).astype(str)
+                block[:, j] = values.map(codes[col]).to_numpy(dtype=np.float64)
+            else:
+                block[:, j] = pd.to_numeric(chunk[col], errors='coerce').fillna(fill_values[col]).to_numpy(dtype=np.float64)
+        block[:, n_features] = chunk[target].to_numpy(dtype=np.float64)
+        X[start:stop] = (block[:, :n_features] - shift) / divisor
+        start = stop
+    X.flush()
+    encoded.flush()
+    if temporary:
+        # Unlinking mapped files leaves the mappings intact (POSIX)
+        shutil.rmtree(output_dir)
+        print(f"Encoded feature matrix ({n_rows} x {n_features}) in unlinked temporary files")
+    else:
+        print(f"Wrote encoded feature matrix ({n_rows} x {n_features}) to {output_dir}")
+
+    X_scaled = pd.DataFrame(X, columns=feature_names, copy=False)
+    df = pd.DataFrame(encoded, columns=feature_names + [target], copy=False)
+    y = df[target].astype(np.int64)
+    return X_scaled, y, df, label_encoders, scaler, fill_values
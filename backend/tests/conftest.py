@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The backend modules are imported flat, as the API and scripts import them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataset_cache
+from model import DepressionPredictor, build_training_bundle
+
+DATA_PATH = "Student Depression Dataset.csv"
+
+
+@pytest.fixture(scope='session')
+def plans(tmp_path_factory):
+    """(inference plan, scoring plan) of a small model trained on the first rows of the dataset"""
+    tmp = tmp_path_factory.mktemp('plans')
+    csv = tmp / 'train.csv'
+    pd.read_csv(DATA_PATH, nrows=1500).to_csv(csv, index=False)
+    cache_dir, dataset_cache.DEFAULT_CACHE_DIR = dataset_cache.DEFAULT_CACHE_DIR, str(tmp / 'datasets')
+    try:
+        predictor = DepressionPredictor()
+        predictor.initialize_models()
+        predictor.models['Gradient Boosting'].set_params(n_estimators=20)
+        bundle = build_training_bundle(predictor, str(csv))
+    finally:
+        dataset_cache.DEFAULT_CACHE_DIR = cache_dir
+    return predictor.inference_plan, predictor.scoring_plan_for(bundle['weights'], bundle['risk_thresholds'])
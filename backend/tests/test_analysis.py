@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import chi2_contingency
+
+import analysis
+from benchmarks import weights_per_column
+
+
+@pytest.fixture(scope='module')
+def frame():
+    rng = np.random.RandomState(0)
+    n = 2000
+    df = pd.DataFrame({
+        'id': np.arange(n),
+        'Binary': rng.randint(0, 2, n),
+        'Levels': rng.randint(0, 5, n),
+        'Sparse': rng.choice([3, 40, 7000], n),
+        'Wide': rng.randint(0, 30, n),
+        'Score': rng.normal(size=n).round(2),
+        'Constant': np.ones(n, dtype=np.int64),
+    })
+    logit = 0.8 * df['Binary'] + 0.4 * df['Levels'] - 0.05 * df['Wide'] + df['Score']
+    df['Depression'] = (logit + rng.logistic(size=n) > 1).astype(np.int64)
+    return df
+
+
+def feature_columns(df):
+    return [col for col in df.columns if col not in ('id', 'Depression')]
+
+
+def test_target_correlations_match_series_corr(frame):
+    columns = feature_columns(frame)
+    expected = np.array([frame[col].corr(frame['Depression']) for col in columns])
+    np.testing.assert_array_equal(analysis.target_correlations(frame, columns), expected)
+
+
+def test_target_correlations_with_missing_values(frame):
+    df = frame.astype({'Levels': np.float64})
+    df.loc[::7, 'Levels'] = np.nan
+    columns = feature_columns(df)
+    expected = np.array([df[col].corr(df['Depression']) for col in columns])
+    np.testing.assert_array_equal(analysis.target_correlations(df, columns), expected)
+
+
+def test_chi_square_tests_match_chi2_contingency(frame):
+    columns = feature_columns(frame)
+    tests = analysis.chi_square_tests(analysis.value_counts_by_target(frame, columns))
+    for col in columns:
+        statistic, p_value, dof, _ = chi2_contingency(pd.crosstab(frame[col], frame['Depression']))
+        assert tests[col][1] == dof
+        assert tests[col][0] == pytest.approx(statistic, rel=1e-9, abs=1e-12)
+        assert tests[col][2] == pytest.approx(p_value, rel=1e-9, abs=1e-12)
+    # A binary column has dof 1 (Yates corrected), a constant one dof 0
+    assert tests['Binary'][1] == 1
+    assert tests['Constant'] == (0.0, 0, 1.0)
+
+
+def test_chi_square_tests_with_a_single_target_class(frame):
+    df = frame[frame['Depression'] == 1]
+    columns = feature_columns(df)
+    tests = analysis.chi_square_tests(analysis.value_counts_by_target(df, columns))
+    for col in columns:
+        statistic, p_value, dof, _ = chi2_contingency(pd.crosstab(df[col], df['Depression']))
+        assert tests[col] == (statistic, dof, p_value) == (0.0, 0, 1.0)
+
+
+def test_data_driven_weights_match_the_per_column_loop(frame):
+    expected = weights_per_column(frame)
+    actual = analysis.data_driven_weights(frame)
+    assert actual[:2] == expected[:2]
+    for feature, stats in expected[2].items():
+        for key, value in stats.items():
+            if key == 'depression_rates':
+                pd.testing.assert_series_equal(actual[2][feature][key], value, check_exact=True)
+            else:
+                assert actual[2][feature][key] == value
@@ -0,0 +1,70 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier
+
+from cv_engine import FoldEnsemble, fit_folds
+from flat_model import FlatModelHandle, flattenable, load_flat_model, write_flat_model
+from inference import InferencePlan
+
+DATA_PATH = "Student Depression Dataset.csv"
+
+
+def _watchers():
+    return [thread for thread in threading.enumerate() if thread.name == 'flat-model-watcher']
+
+
+def test_peek_starts_no_watcher_and_snapshot_starts_one(plans, tmp_path):
+    plan, _ = plans
+    path = str(tmp_path / 'model.flat')
+    write_flat_model(plan, path, {'version': 'v1'})
+    before = len(_watchers())
+
+    handle = FlatModelHandle(path, check_interval=60)
+    assert handle.peek()[1]['version'] == 'v1'
+    assert len(_watchers()) == before
+    threads = [threading.Thread(target=handle.snapshot) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(_watchers()) == before + 1
+
+
+def test_forked_child_can_swap_even_if_forked_mid_check(plans, tmp_path):
+    plan, _ = plans
+    path = str(tmp_path / 'model.flat')
+    write_flat_model(plan, path, {'version': 'v1'})
+    handle = FlatModelHandle(path, check_interval=60)
+    write_flat_model(plan, path + '.tmp', {'version': 'v2'})
+    os.replace(path + '.tmp', path)
+
+    # As if the watcher were loading the new file when the worker forked
+    with handle._lock:
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if handle.check() and handle.peek()[1]['version'] == 'v2' else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def test_fold_ensemble_round_trips_through_a_flat_file(plans, tmp_path):
+    plan, _ = plans
+    df = pd.read_csv(DATA_PATH, nrows=600, skiprows=range(1, 3000))
+    y = df.pop('Depression').to_numpy()
+    X = plan.encode(df.drop(columns=['id']).to_dict('records'))
+    ensemble, _, _, _ = fit_folds(GradientBoostingClassifier(n_estimators=10, random_state=0), X, y, cv=3, refit=False,
+                                  n_jobs=1)
+    assert isinstance(ensemble, FoldEnsemble)
+    fold_plan = InferencePlan(plan.feature_names, plan.vocabularies, plan.fill_values, plan.mean, plan.scale,
+                              ensemble.classes_, engine=ensemble.flatten(), model=ensemble)
+    assert flattenable(fold_plan)
+
+    path = str(tmp_path / 'folds.flat')
+    write_flat_model(fold_plan, path, {'version': 'folds'})
+    loaded, metadata = load_flat_model(path)
+    assert metadata == {'version': 'folds'}
+    assert isinstance(loaded.engine, FoldEnsemble) and len(loaded.engine.models) == 3
+    np.testing.assert_array_equal(loaded.engine.predict_proba(X), ensemble.predict_proba(X))
@@ -0,0 +1,33 @@
+import asyncio
+
+import numpy as np
+
+from micro_batch import MicroBatcher
+
+
+class SumPlan:
+    """Stand-in plan: predicts each row's sum, recording the size of every call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict_many(self, rows):
+        self.calls.append(len(rows))
+        sums = rows.sum(axis=1)
+        return sums.astype(int), sums / 100
+
+
+def test_concurrent_async_predictions_share_batches():
+    plan = SumPlan()
+    batcher = MicroBatcher(window=0.05, max_batch=16)
+    n = 40
+
+    async def predict_all():
+        return await asyncio.gather(*[batcher.predict_async(plan, np.full((1, 3), k, dtype=float)) for k in range(n)])
+
+    results = asyncio.run(predict_all())
+    assert results == [(3 * k, 3 * k / 100) for k in range(n)]
+    assert sum(plan.calls) == n
+    assert len(plan.calls) < n
+    assert max(plan.calls) == 16
+    assert batcher.stats()['largest_batch'] == 16
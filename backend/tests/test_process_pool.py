@@ -0,0 +1,81 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from flat_model import write_flat_model
+from process_pool import (DEFAULT_MIN_RECORDS, ScoringPool, discard_result, result_text, score_ndjson,
+                          split_json_array)
+
+DATA_PATH = "Student Depression Dataset.csv"
+
+
+@pytest.fixture(scope='module')
+def records():
+    df = pd.read_csv(DATA_PATH, nrows=DEFAULT_MIN_RECORDS + 44, skiprows=range(1, 2000)).drop(columns=['id', 'Depression'])
+    records = [{col: value for col, value in record.items() if not pd.isna(value)} for record in df.to_dict('records')]
+    records[3] = {"Age": 500}
+    records[7] = "not a record"
+    return records
+
+
+def test_split_json_array_keeps_pretty_printed_elements_whole():
+    text = json.dumps([{"a": "line\nbreak", "b": [1, 2]}, 3, "s"], indent=2)
+    elements = split_json_array(text)
+    assert all(b'\n' not in element for element in elements)
+    assert [json.loads(element) for element in elements] == json.loads(text)
+
+
+def test_pretty_printed_batch_scores_in_the_pool(plans, records):
+    plan, scoring_plan = plans
+    compact = [json.dumps(record).encode('utf-8') for record in records]
+    expected = score_ndjson(plan, scoring_plan, b'\n'.join(compact), 0)
+
+    pool = ScoringPool(1, None, plan, scoring_plan)
+    elements = split_json_array(json.dumps(records, indent=2))
+    assert len(elements) >= pool.min_records
+    result = result_text(pool.score_lines(plan, elements, 0))
+    assert pool.stats()['pool_jobs'] == 1
+    assert result == expected
+    lines = [json.loads(line) for line in result.splitlines()]
+    assert [line['index'] for line in lines] == list(range(len(records)))
+    assert [line['status'] for line in lines].count('error') == 2
+    pool.executor().shutdown()
+
+
+def _shared_blocks():
+    return {name for name in os.listdir('/dev/shm') if name.startswith('psm_')}
+
+
+def test_discarded_results_free_their_shared_memory(plans, records):
+    plan, scoring_plan = plans
+    compact = [json.dumps(record).encode('utf-8') for record in records]
+    before = _shared_blocks()
+
+    pool = ScoringPool(1, None, plan, scoring_plan)
+    pending = [pool.score_lines(plan, compact, 0) for _ in range(4)]
+    result_text(pending[0])
+    for result in pending:
+        discard_result(result)
+        discard_result(result)
+    pool.executor().shutdown(wait=True)
+    assert _shared_blocks() == before
+
+
+def test_chunks_of_another_model_version_are_scored_here(plans, records, tmp_path):
+    plan, scoring_plan = plans
+    compact = [json.dumps(record).encode('utf-8') for record in records]
+    expected = score_ndjson(plan, scoring_plan, b'\n'.join(compact), 0)
+    path = str(tmp_path / 'model.flat')
+    write_flat_model(plan, path, {'version': 'v1'})
+
+    pool = ScoringPool(1, path, None, scoring_plan)
+    assert result_text(pool.score_lines(plan, compact, 0, 'v1')) == expected
+    assert pool.stats()['pool_jobs'] == 1
+    # The request started before the pool process saw v2, or after it did
+    assert result_text(pool.score_lines(plan, compact, 0, 'v2')) == expected
+    assert pool.stats()['pool_jobs'] == 1
+    assert pool.stats()['thread_jobs'] == 1
+    pool.executor().shutdown()
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier
+
+from tree_engine import FlatTreeEnsemble, check_equivalence
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(400, 5))
+    y = (X[:, 0] + 0.5 * X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=400) > 0).astype(int)
+    model = GradientBoostingClassifier(n_estimators=40, max_depth=3, random_state=0).fit(X, y)
+    return model, FlatTreeEnsemble.from_gradient_boosting(model), X
+
+
+def reference_walk(model, X):
+    """Decision function by walking every tree from the root, NaN going right (x <= threshold is False)"""
+    raw = np.full(len(X), model._raw_predict_init(np.zeros((1, X.shape[1]), dtype=np.float32))[0, 0])
+    X32 = np.asarray(X, dtype=np.float32)
+    for estimator in model.estimators_[:, 0]:
+        tree = estimator.tree_
+        for i, row in enumerate(X32):
+            node = 0
+            while tree.children_left[node] >= 0:
+                goes_left = row[tree.feature[node]] <= tree.threshold[node]
+                node = tree.children_left[node] if goes_left else tree.children_right[node]
+            raw[i] += model.learning_rate * tree.value[node, 0, 0]
+    return raw
+
+
+def test_training_rows_match_exactly(fitted):
+    model, engine, X = fitted
+    assert np.array_equal(engine.predict_proba(X), model.predict_proba(X))
+
+
+def test_random_rows_match_exactly(fitted):
+    model, engine, _ = fitted
+    X = np.random.RandomState(1).normal(scale=2.0, size=(1000, 5))
+    check_equivalence(model, engine, X)
+
+
+def test_out_of_range_rows_match_exactly(fitted):
+    model, engine, X = fitted
+    extreme = np.vstack([
+        np.full((1, 5), 1e30), np.full((1, 5), -1e30),
+        X.max(axis=0) + 100, X.min(axis=0) - 100,
+        np.full((1, 5), np.finfo(np.float32).max), np.zeros((1, 5)),
+    ])
+    assert np.array_equal(engine.predict_proba(extreme), model.predict_proba(extreme))
+
+
+def test_threshold_boundaries_match_exactly(fitted):
+    model, engine, X = fitted
+    # Rows sitting exactly on split thresholds, and one float32 step either side
+    thresholds = engine.threshold[engine.left >= 0]
+    features = engine.feature[engine.left >= 0]
+    rows = np.repeat(X[:1], len(thresholds) * 3, axis=0)
+    for k, (feature, threshold) in enumerate(zip(features, thresholds)):
+        t32 = np.float32(threshold)
+        for j, value in enumerate((t32, np.nextafter(t32, np.float32(-np.inf)), np.nextafter(t32, np.float32(np.inf)))):
+            rows[3 * k + j, feature] = value
+    assert np.array_equal(engine.predict_proba(rows), model.predict_proba(rows))
+
+
+def test_nan_rows_follow_the_right_branch(fitted):
+    model, engine, X = fitted
+    # predict_proba rejects NaN; the engine sends it right at every split, like a plain tree walk
+    rows = X[:20].copy()
+    rows[::2, 0] = np.nan
+    rows[1::3, 3] = np.nan
+    raw = engine.raw_predict(rows)
+    assert np.all(np.isfinite(engine.predict_proba(rows)))
+    np.testing.assert_allclose(raw, reference_walk(model, rows), rtol=0, atol=1e-12)
+    with pytest.raises(ValueError):
+        model.predict_proba(rows)
+
+
+def test_flat_arrays_round_trip(fitted):
+    model, engine, X = fitted
+    rebuilt = FlatTreeEnsemble.from_arrays(*engine.to_arrays())
+    assert np.array_equal(rebuilt.predict_proba(X), model.predict_proba(X))
+
+
+def test_check_equivalence_reports_a_mismatch(fitted):
+    model, engine, X = fitted
+    other = GradientBoostingClassifier(n_estimators=5, max_depth=2, random_state=0).fit(X, X[:, 0] > 0)
+    with pytest.raises(AssertionError):
+        check_equivalence(other, engine, X)
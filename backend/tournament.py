@@ -0,0 +1,221 @@
+"""Parallel model tournament with per-candidate time budgets.
+
+Every candidate in the roster is fitted and evaluated in its own worker
+process, up to max_workers at a time. A candidate still running when its
+wall-clock budget runs out is terminated, and so is one that crashes; the
+rest of the tournament carries on without it. The winner is the candidate
+with the best F1, where candidates within f1_tolerance of the best F1 count
+as tied and the tie goes to the fastest single-row predict_proba.
+
+Run ``python tournament.py [--budget SECONDS] [--workers N]`` from the backend
+directory for a report on the full roster.
+"""
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from multiprocessing.connection import wait
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, AdaBoostClassifier, ExtraTreesClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+from threadpoolctl import threadpool_limits
+
+import cv_engine
+
+# Seconds each candidate may spend fitting, cross-validating and being timed
+DEFAULT_TIME_BUDGET = 120
+# Candidates whose F1 is this close to the best are ranked by latency instead
+F1_TOLERANCE = 0.002
+# Single-row predict_proba calls timed per candidate
+LATENCY_REPEATS = 200
+
+
+def full_roster():
+    """Every classifier family the predictor can train, with their default settings"""
+    return {
+        'Gradient Boosting': GradientBoostingClassifier(random_state=42),
+        'Random Forest': RandomForestClassifier(random_state=42),
+        'Extra Trees': ExtraTreesClassifier(random_state=42),
+        'AdaBoost': AdaBoostClassifier(random_state=42),
+        'Logistic Regression': LogisticRegression(max_iter=1000, random_state=42),
+        'SVM': SVC(probability=True, random_state=42),
+        'KNN': KNeighborsClassifier(),
+        'Naive Bayes': GaussianNB(),
+        'Decision Tree': DecisionTreeClassifier(random_state=42),
+        'Neural Network': MLPClassifier(max_iter=500, random_state=42),
+    }
+
+
+def evaluate_candidate(model, X_train, y_train, X_test, y_test, cv=5):
+    """Fit one model and collect its metrics, timings and pickled size
+
+    With cv folds, the CV score and out-of-fold metrics come from the fold
+    fits' predictions on their held-out rows (see cv_engine.fit_folds).
+    """
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    cv_score, oof = float('nan'), {}
+    if cv:
+        # The candidates already run side by side, so the folds run one at a time
+        _, _, oof_proba, fold_scores = cv_engine.fit_folds(model, X_train, y_train, cv=cv, refit=False, n_jobs=1)
+        cv_score = fold_scores.mean()
+        oof = cv_engine.oof_results(y_train, oof_proba)
+
+    start = time.perf_counter()
+    y_pred_proba = model.predict_proba(X_test)[:, 1]
+    batch_seconds = time.perf_counter() - start
+    y_pred = model.predict(X_test)
+
+    row = X_test[:1]
+    samples = np.empty(LATENCY_REPEATS)
+    for i in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        model.predict_proba(row)
+        samples[i] = time.perf_counter() - start
+
+    return {
+        'model': model,
+        'accuracy': accuracy_score(y_test, y_pred),
+        'precision': precision_score(y_test, y_pred, average='weighted'),
+        'recall': recall_score(y_test, y_pred, average='weighted'),
+        'f1_score': f1_score(y_test, y_pred, average='weighted'),
+        'cv_score': cv_score,
+        'y_pred': y_pred,
+        'y_pred_proba': y_pred_proba,
+        'fit_seconds': fit_seconds,
+        'predict_us_per_row': batch_seconds / len(X_test) * 1e6,
+        'single_row_us': float(np.median(samples)) * 1e6,
+        'model_bytes': len(pickle.dumps(model)),
+        **oof
+    }
+
+
+def _run_candidate(conn, model, X_train, y_train, X_test, y_test, cv):
+    """Worker process body: evaluate one candidate and send back the result or the error"""
+    try:
+        # Candidates run side by side, so each keeps its BLAS/OpenMP to one thread
+        with threadpool_limits(1):
+            result = evaluate_candidate(model, X_train, y_train, X_test, y_test, cv)
+        conn.send(('ok', result))
+    except Exception as e:
+        conn.send(('failed', f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def run_tournament(models, X_train, y_train, X_test, y_test, time_budget=DEFAULT_TIME_BUDGET, max_workers=None, cv=5):
+    """Evaluate every model in its own process, terminating any that exceed time_budget seconds
+
+    Returns (results, report): results maps the name of each candidate that
+    finished to the same dict train_and_evaluate_models produces plus its
+    timings; report has one row per candidate, including the ones that timed
+    out or failed.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    # Plain arrays: cheaper to hand to workers, and the served model sees
+    # arrays too (InferencePlan passes encoded matrices, not DataFrames)
+    X_train, y_train, X_test, y_test = (np.asarray(data) for data in (X_train, y_train, X_test, y_test))
+    # fork shares the training data with the workers without pickling it
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    pending = list(models.items())
+    running = {}
+    results, report = {}, {}
+
+    while pending or running:
+        while pending and len(running) < max_workers:
+            name, model = pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_run_candidate, args=(sender, model, X_train, y_train, X_test, y_test, cv), daemon=True
+            )
+            process.start()
+            sender.close()
+            running[receiver] = (name, process, time.monotonic())
+            print(f"Started {name} (budget {time_budget}s)")
+
+        now = time.monotonic()
+        next_deadline = min(started + time_budget for _, _, started in running.values())
+        for receiver in wait(list(running), timeout=max(0.0, next_deadline - now)):
+            name, process, started = running.pop(receiver)
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                status, payload = 'failed', f"worker exited with code {process.exitcode}"
+            receiver.close()
+            process.join()
+            elapsed = time.monotonic() - started
+            if status == 'ok':
+                results[name] = payload
+                print(f"Finished {name} in {elapsed:.1f}s (F1 {payload['f1_score']:.4f})")
+            else:
+                print(f"{name} failed: {payload}")
+            report[name] = _report_row(name, status, elapsed, payload if status == 'ok' else None, payload if status != 'ok' else None)
+
+        now = time.monotonic()
+        for receiver, (name, process, started) in list(running.items()):
+            if now - started >= time_budget:
+                process.terminate()
+                process.join()
+                receiver.close()
+                del running[receiver]
+                print(f"Cancelled {name}: over its {time_budget}s budget")
+                report[name] = _report_row(name, 'timeout', now - started, None, f"exceeded {time_budget}s budget")
+
+    # Report rows in roster order
+    return results, [report[name] for name in models if name in report]
+
+
+def _report_row(name, status, elapsed, result, error):
+    row = {'model': name, 'status': status, 'elapsed_seconds': elapsed}
+    if result is not None:
+        for key in ['f1_score', 'accuracy', 'cv_score', 'fit_seconds', 'predict_us_per_row', 'single_row_us', 'model_bytes']:
+            row[key] = float(result[key])
+    if error is not None:
+        row['error'] = error
+    return row
+
+
+def select_best(results, f1_tolerance=F1_TOLERANCE):
+    """Name of the best candidate: highest F1, ties within f1_tolerance going to the lowest latency"""
+    best_f1 = max(result['f1_score'] for result in results.values())
+    contenders = [name for name, result in results.items() if result['f1_score'] >= best_f1 - f1_tolerance]
+    return min(contenders, key=lambda name: (results[name].get('single_row_us', 0.0), -results[name]['f1_score']))
+
+
+def print_report(report, best_model_name=None):
+    print("\n" + "="*96)
+    print("MODEL TOURNAMENT")
+    print("="*96)
+    print(f"{'Model':22s} {'Status':8s} {'F1':>7s} {'CV':>7s} {'Fit s':>8s} {'us/row':>9s} {'1-row us':>9s} {'Size KB':>10s}")
+    for row in report:
+        if row['status'] == 'ok':
+            marker = '  <- best' if row['model'] == best_model_name else ''
+            print(f"{row['model']:22s} {row['status']:8s} {row['f1_score']:7.4f} {row['cv_score']:7.4f} "
+                  f"{row['fit_seconds']:8.2f} {row['predict_us_per_row']:9.2f} {row['single_row_us']:9.1f} "
+                  f"{row['model_bytes']/1024:10.1f}{marker}")
+        else:
+            print(f"{row['model']:22s} {row['status']:8s} {row.get('error', '')}")
+
+
+if __name__ == "__main__":
+    from model import DepressionPredictor
+
+    args = sys.argv[1:]
+    budget = float(args[args.index('--budget') + 1]) if '--budget' in args else DEFAULT_TIME_BUDGET
+    workers = int(args[args.index('--workers') + 1]) if '--workers' in args else None
+
+    predictor = DepressionPredictor()
+    predictor.initialize_models(roster='full', time_budget=budget, max_workers=workers)
+    X, y, df = predictor.load_and_preprocess_data(csv_filename="Student Depression Dataset.csv")
+    results, _, _ = predictor.train_and_evaluate_models(X, y)
+    print_report(predictor.tournament_report, select_best(results))
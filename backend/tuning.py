@@ -0,0 +1,248 @@
+"""Successive-halving hyperparameter search for the gradient boosting model.
+
+Every configuration in the grid is first trained on a small subsample of the
+training split; only the best 1/factor of them move on to the next rung,
+which trains on factor times more rows, until the survivors are trained on
+the whole fit pool. Each rung's fits run in parallel across cores.
+
+Each (configuration, rung size) evaluation is scored on a fixed validation
+split and timed: fit seconds, single-row and per-row batch latency of the
+serving engine (the flattened ensemble where the model supports one) and
+node count. Results are appended to an on-disk cache keyed by the data and
+the configuration, so repeating or widening a search only trains what has
+not been evaluated before.
+
+Run ``python tuning.py`` from the backend directory for the full report.
+"""
+import copy
+import hashlib
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+import artifacts
+from tournament import F1_TOLERANCE
+from tree_engine import FlatTreeEnsemble
+
+# Search spaces by estimator: stages, tree size and learning rate
+SPACES = {
+    'GradientBoostingClassifier': {
+        'n_estimators': [50, 100, 200, 400],
+        'max_depth': [2, 3, 4, 5],
+        'learning_rate': [0.03, 0.05, 0.1, 0.2],
+    },
+    'HistGradientBoostingClassifier': {
+        'max_iter': [50, 100, 200, 400],
+        'max_leaf_nodes': [4, 8, 16, 31],
+        'learning_rate': [0.03, 0.05, 0.1, 0.2],
+    },
+}
+DEFAULT_CACHE_FILE = os.path.join(artifacts.DEFAULT_ARTIFACT_DIR, 'tuning', 'evaluations.jsonl')
+# Single-row predict_proba calls timed per evaluation
+LATENCY_REPEATS = 100
+
+
+def data_fingerprint(X, y):
+    """Hash of the training data, so cached scores are never reused for different data"""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(np.asarray(X, dtype=np.float64)).tobytes())
+    digest.update(np.ascontiguousarray(np.asarray(y, dtype=np.int64)).tobytes())
+    return digest.hexdigest()
+
+
+def evaluation_key(fingerprint, estimator, params, n_rows):
+    payload = json.dumps({
+        'data': fingerprint, 'estimator': type(estimator).__name__,
+        'base_params': estimator.get_params(), 'params': params, 'n_rows': n_rows,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_cache(path):
+    """{key: evaluation} for every evaluation recorded in the cache file"""
+    cache = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    evaluation = json.loads(line)
+                except ValueError:
+                    # A partial last line from an interrupted search
+                    continue
+                cache[evaluation['key']] = evaluation
+    return cache
+
+
+def append_cache(path, evaluations):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        for evaluation in evaluations:
+            f.write(json.dumps(evaluation) + '\n')
+
+
+def serving_latency(model, X, repeats=LATENCY_REPEATS):
+    """(single-row us, batch us/row, node count) of the engine the model would be served with"""
+    try:
+        engine = FlatTreeEnsemble.from_gradient_boosting(model)
+        n_nodes = len(engine.feature)
+    except (AttributeError, ValueError):
+        engine, n_nodes = model, None
+    row = X[:1]
+    engine.predict_proba(row)
+    samples = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        engine.predict_proba(row)
+        samples[i] = time.perf_counter() - start
+    start = time.perf_counter()
+    engine.predict_proba(X)
+    batch = (time.perf_counter() - start) / len(X)
+    return float(np.median(samples)) * 1e6, batch * 1e6, n_nodes
+
+
+def resized(model, n_stages):
+    """Shallow copy of a fitted boosting model with its stages cut or cycled to n_stages
+
+    A lengthened copy predicts nonsense, but it costs as much to evaluate as
+    a model trained for n_stages with trees of the same size.
+    """
+    copied = copy.copy(model)
+    if hasattr(model, 'estimators_'):
+        copied.estimators_ = np.resize(model.estimators_, (n_stages, model.estimators_.shape[1]))
+    else:
+        copied._predictors = [model._predictors[i % len(model._predictors)] for i in range(n_stages)]
+    return copied
+
+
+def stage_latency(model, max_stages, X, repeats=1000):
+    """(single-row us as fitted, single-row us with max_stages stages) of a boosting model"""
+    fitted_us = serving_latency(model, X, repeats)[0]
+    full_us = serving_latency(resized(model, max_stages), X, repeats)[0]
+    return fitted_us, full_us
+
+
+def evaluate(estimator, params, X_fit, y_fit, X_val, y_val, n_rows):
+    """Fit one configuration on the first n_rows of the fit pool and score and time it"""
+    model = clone(estimator).set_params(**params)
+    start = time.perf_counter()
+    model.fit(X_fit[:n_rows], y_fit[:n_rows])
+    fit_seconds = time.perf_counter() - start
+    f1 = f1_score(y_val, model.predict(X_val), average='weighted')
+    single_row_us, batch_us_per_row, n_nodes = serving_latency(model, X_val)
+    return {
+        'params': params,
+        'n_rows': n_rows,
+        'f1_score': float(f1),
+        'fit_seconds': fit_seconds,
+        'single_row_us': single_row_us,
+        'batch_us_per_row': batch_us_per_row,
+        'n_nodes': n_nodes,
+    }
+
+
+def search_space(estimator):
+    try:
+        return SPACES[type(estimator).__name__]
+    except KeyError:
+        raise ValueError(f"No search space for {type(estimator).__name__}") from None
+
+
+def successive_halving(estimator, X, y, space=None, factor=3, n_rungs=3, validation_size=0.2,
+                       n_jobs=None, cache_file=None):
+    """Search space (dict of parameter lists) by successive halving over training rows
+
+    Returns (rungs, reference): rungs is a list of evaluation lists, one per
+    rung, the last holding the configurations trained on the full fit pool;
+    reference is the estimator's own configuration evaluated the same way.
+    """
+    space = space or search_space(estimator)
+    cache_file = cache_file or DEFAULT_CACHE_FILE
+    X, y = np.asarray(X, dtype=np.float64), np.asarray(y)
+    # Stratified shuffle, so every prefix of the fit pool is a stratified subsample
+    X_fit, X_val, y_fit, y_val = train_test_split(X, y, test_size=validation_size, random_state=42, stratify=y)
+
+    configs = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    fingerprint = data_fingerprint(X, y)
+    cache = load_cache(cache_file)
+
+    def run(configs, n_rows):
+        keys = [evaluation_key(fingerprint, estimator, params, n_rows) for params in configs]
+        todo = [(key, params) for key, params in zip(keys, configs) if key not in cache]
+        fresh = Parallel(n_jobs=n_jobs or -1)(
+            delayed(evaluate)(estimator, params, X_fit, y_fit, X_val, y_val, n_rows) for _, params in todo
+        )
+        for (key, _), evaluation in zip(todo, fresh):
+            evaluation['key'] = key
+            cache[key] = evaluation
+        append_cache(cache_file, fresh)
+        return [cache[key] for key in keys], len(configs) - len(todo)
+
+    rungs = []
+    for rung in range(n_rungs):
+        # Rows grow by factor per rung, ending with the whole fit pool
+        n_rows = max(100, len(y_fit) // factor ** (n_rungs - 1 - rung))
+        evaluations, n_cached = run(configs, n_rows)
+        print(f"Rung {rung}: {len(configs)} configs on {n_rows} rows ({n_cached} cached)")
+        rungs.append(evaluations)
+        # Keep the best 1/factor by F1, cheapest first among equal scores
+        ranked = sorted(evaluations, key=lambda e: (-e['f1_score'], e['single_row_us']))
+        configs = [e['params'] for e in ranked[:max(1, len(ranked) // factor)]]
+
+    own_params = {name: estimator.get_params()[name] for name in space}
+    (reference,), _ = run([own_params], len(y_fit))
+    return rungs, reference
+
+
+def pareto_frontier(evaluations):
+    """Evaluations not beaten on both F1 and single-row latency, cheapest first"""
+    frontier, best_f1 = [], -np.inf
+    for evaluation in sorted(evaluations, key=lambda e: (e['single_row_us'], -e['f1_score'])):
+        if evaluation['f1_score'] > best_f1:
+            frontier.append(evaluation)
+            best_f1 = evaluation['f1_score']
+    return frontier
+
+
+def choose(evaluations, f1_tolerance=F1_TOLERANCE):
+    """(best, recommended): the top-F1 config and the cheapest one within f1_tolerance of it"""
+    best = max(evaluations, key=lambda e: (e['f1_score'], -e['single_row_us']))
+    contenders = [e for e in evaluations if e['f1_score'] >= best['f1_score'] - f1_tolerance]
+    recommended = min(contenders, key=lambda e: (e['single_row_us'], -e['f1_score']))
+    return best, recommended
+
+
+def _format_params(params):
+    return ', '.join(f"{name}={value}" for name, value in params.items())
+
+
+def print_report(evaluations, frontier, best, recommended, reference):
+    print("\n" + "="*100)
+    print("HYPERPARAMETER SEARCH (successive halving)")
+    print("="*100)
+    print(f"{'Config':52s} {'F1':>7s} {'Fit s':>7s} {'1-row us':>9s} {'us/row':>7s} {'nodes':>7s}")
+    on_frontier = {id(e) for e in frontier}
+    for e in sorted(evaluations, key=lambda e: -e['f1_score']):
+        marks = ''.join([
+            '  frontier' if id(e) in on_frontier else '',
+            '  best' if e is best else '',
+            '  recommended' if e is recommended else '',
+            '  (current)' if e is reference else '',
+        ])
+        print(f"{_format_params(e['params']):52s} {e['f1_score']:7.4f} {e['fit_seconds']:7.2f} "
+              f"{e['single_row_us']:9.1f} {e['batch_us_per_row']:7.2f} {e['n_nodes'] or 0:7d}{marks}")
+
+
+if __name__ == "__main__":
+    from model import DepressionPredictor
+
+    predictor = DepressionPredictor()
+    predictor.initialize_models()
+    X, y, df = predictor.load_and_preprocess_data(csv_filename="Student Depression Dataset.csv")
+    predictor.tune_hyperparameters(X, y)